@@ -0,0 +1,23 @@
+"""中转服务基准测试
+
+启动可调延迟的模拟上游（fake_upstream）和无界面中转服务，用多个模拟客户端按
+_speak_with_proxy_mode 的协议（提交 -> 推送/轮询 -> 下载）发起请求，报告吞吐量、
+端到端延迟分位数以及中转进程的CPU与内存占用。
+
+    python -m benchmarks --clients 16 --requests 20
+    python -m benchmarks --help
+"""
+
+from pathlib import Path
+import importlib.util
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RELAY_SCRIPT = REPO_ROOT / "tts_gui-client-v6.0-支持centos服务器生成音频.py"
+
+
+def load_relay_module(script=RELAY_SCRIPT):
+    """按文件路径导入客户端/中转脚本（文件名不是合法的模块名，不能直接import）"""
+    spec = importlib.util.spec_from_file_location("tts_relay_client", str(script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,159 @@
+"""运行中转服务基准测试：模拟上游 + 无界面中转服务（独立进程）+ N 个模拟客户端
+
+    python -m benchmarks --clients 16 --requests 20 --latency 0.3
+    python -m benchmarks --clients 32 --duration 60 --relay-workers 2 --json result.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from . import REPO_ROOT, RELAY_SCRIPT
+from .clients import ClientDriver, summarize
+from .fake_upstream import add_arguments
+from .resources import ResourceSampler
+
+
+def free_port():
+    with contextlib.closing(socket.socket()) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程已退出（返回码 {process.returncode}）: {url}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"等待服务启动超时: {url}")
+
+
+def stop_process(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def write_relay_config(workdir, upstream_url, args):
+    lines = [
+        "[API]",
+        f"upstream_api_url = {upstream_url}",
+        "[Cache]",
+        f"cache_dir = {os.path.join(workdir, 'audio_cache')}",
+        f"enabled = {not args.no_cache}",
+        "[LocalAPI]",
+        f"workers = {args.relay_workers}",
+    ]
+    if args.upstream_concurrency:
+        lines.append(f"upstream_concurrency = {args.upstream_concurrency}")
+    with open(os.path.join(workdir, "tts_client_config.ini"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def print_report(report):
+    result = report["result"]
+    latency = result["latency_seconds"]
+    print(f"请求数: {result['requests']}  成功: {result['succeeded']}  失败: {result['failed']}")
+    if result["first_error"]:
+        print(f"首个错误: {result['first_error']}")
+    print(f"耗时: {result['wall_seconds']} 秒  吞吐量: {result['throughput_rps']} 请求/秒")
+    print(f"端到端延迟(秒): 平均 {latency['mean']}  p50 {latency['p50']}  p95 {latency['p95']}  "
+          f"p99 {latency['p99']}  最大 {latency['max']}")
+    relay = report["relay_resources"]
+    if relay:
+        print(f"中转服务: CPU {relay['cpu_seconds']} 秒（平均 {relay['cpu_cores']} 核）  "
+              f"内存峰值 {relay['rss_peak_mb']} MB  结束时 {relay['rss_end_mb']} MB")
+    else:
+        print("中转服务: 当前平台无法采样CPU/内存（可安装 psutil）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTS中转服务基准测试")
+    parser.add_argument("--clients", type=int, default=8, help="并发模拟客户端数")
+    parser.add_argument("--requests", type=int, default=10, help="每个客户端的请求数")
+    parser.add_argument("--duration", type=float, default=0, help="按时长运行（秒），设置后忽略 --requests")
+    parser.add_argument("--text-length", type=int, default=30, help="每个请求的文本长度")
+    parser.add_argument("--repeat-text", action="store_true", help="所有请求使用相同文本（测试合成缓存和请求合并）")
+    parser.add_argument("--poll", action="store_true", help="客户端轮询 /tts_status，而不是等待SSE推送")
+    parser.add_argument("--relay-workers", type=int, default=1, help="中转服务worker进程数")
+    parser.add_argument("--upstream-concurrency", type=int, default=0, help="中转服务的上游并发数，0为默认值")
+    parser.add_argument("--no-cache", action="store_true", help="关闭中转服务的合成缓存")
+    parser.add_argument("--script", default=str(RELAY_SCRIPT), help="被测的客户端/中转脚本")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录（中转服务日志和缓存）")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="tts_bench_")
+    upstream_port = free_port()
+    relay_port = free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    relay_url = f"http://127.0.0.1:{relay_port}"
+    upstream_args = [
+        "--latency", str(args.latency), "--per-char", str(args.per_char), "--jitter", str(args.jitter),
+        "--audio-per-char", str(args.audio_per_char), "--min-audio", str(args.min_audio),
+        "--sample-rate", str(args.sample_rate), "--concurrency", str(args.concurrency),
+        "--load-latency", str(args.load_latency), "--reference-latency", str(args.reference_latency),
+    ]
+    write_relay_config(workdir, upstream_url, args)
+
+    processes = []
+    try:
+        with open(os.path.join(workdir, "upstream.log"), "w") as upstream_log:
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.fake_upstream", "--port", str(upstream_port)] + upstream_args,
+                cwd=str(REPO_ROOT), stdout=upstream_log, stderr=subprocess.STDOUT,
+            ))
+        with open(os.path.join(workdir, "relay.log"), "w") as relay_log:
+            relay = subprocess.Popen(
+                [sys.executable, args.script, "--headless", "--host", "127.0.0.1", "--port", str(relay_port)],
+                cwd=workdir, stdout=relay_log, stderr=subprocess.STDOUT,
+            )
+            processes.append(relay)
+        wait_ready(f"{upstream_url}/", processes[0])
+        wait_ready(f"{relay_url}/", relay)
+        print(f"模拟上游: {upstream_url}  中转服务: {relay_url}（{args.relay_workers} 个worker）  工作目录: {workdir}")
+
+        driver = ClientDriver(relay_url, clients=args.clients, use_push_events=not args.poll, script=args.script)
+        sampler = ResourceSampler(relay.pid).start()
+        results, wall = driver.run(
+            requests_per_client=args.requests, text_length=args.text_length,
+            unique=not args.repeat_text, duration=args.duration,
+        )
+        report = {
+            "config": vars(args),
+            "result": summarize(results, wall),
+            "relay_resources": sampler.stop(),
+        }
+        print_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        shutil.rmtree(driver.workdir, ignore_errors=True)
+    finally:
+        for process in reversed(processes):
+            stop_process(process)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""模拟客户端：按 _speak_with_proxy_mode 的协议向中转服务提交任务、等待完成并下载音频"""
+
+import contextlib
+import math
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import load_relay_module, RELAY_SCRIPT
+
+SAMPLE_TEXT = "今天天气很好，我们一起去公园散步，顺便看看湖边新开的花。"
+
+
+def percentile(samples, q):
+    """最近秩法分位数，samples 需已排序"""
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(q * len(samples)))
+    return samples[min(rank, len(samples)) - 1]
+
+
+def make_text(client_index, request_index, length, unique=True):
+    """生成指定长度的文本；unique 时每个请求的文本不同，不会命中中转服务的合成缓存"""
+    prefix = f"{client_index}-{request_index} " if unique else ""
+    body = (SAMPLE_TEXT * (length // len(SAMPLE_TEXT) + 1))[:max(1, length - len(prefix))]
+    return prefix + body
+
+
+class ClientDriver:
+    """用客户端脚本中的 TTSClientGUI（无界面）驱动 N 个并发客户端
+
+    所有模拟客户端共用一个客户端实例和它的连接池（连接池大小设为客户端数），
+    与图形界面中多个线程同时合成时的行为一致。
+    """
+
+    def __init__(self, relay_url, clients=8, use_push_events=True, character="bench", script=RELAY_SCRIPT):
+        self.relay_url = relay_url.rstrip("/")
+        self.clients = clients
+        self.character = character
+        self.workdir = tempfile.mkdtemp(prefix="tts_bench_client_")
+        # 客户端读取当前目录下的配置文件，在独立目录中创建，避免改动仓库里的配置
+        with open(os.path.join(self.workdir, "tts_client_config.ini"), "w") as f:
+            f.write(
+                "[API]\n"
+                f"use_push_events = {use_push_events}\n"
+                f"pool_maxsize = {max(10, clients)}\n"
+                "[Cache]\n"
+                f"cache_dir = {os.path.join(self.workdir, 'audio_cache')}\n"
+                "enabled = False\n"
+                "[LocalAPI]\n"
+                "persist_tasks = False\n"
+                # 客户端每次请求都会记录大量日志，基准测试期间只输出警告和错误，避免干扰计时
+                "[Logging]\n"
+                "level = WARNING\n"
+            )
+        previous = os.getcwd()
+        os.chdir(self.workdir)
+        try:
+            module = load_relay_module(script)
+            self.client = module.TTSClientGUI(None)
+        finally:
+            os.chdir(previous)
+        host, _, port = self.relay_url.split("://", 1)[-1].partition(":")
+        self.client.local_api_host = host
+        self.client.local_api_port = int(port or 80)
+        self.client.connect_master = False
+
+    def run_one(self, client_index, request_index, text_length, unique):
+        text = make_text(client_index, request_index, text_length, unique)
+        data = {"character_name": self.character, "text": text, "split_sentence": False}
+        output_path = os.path.join(self.workdir, f"out_{client_index}_{request_index}.wav")
+        started = time.perf_counter()
+        success, result = self.client._speak_with_proxy_mode(data, output_path)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(output_path) if success and os.path.exists(output_path) else 0
+        with contextlib.suppress(OSError):
+            os.remove(output_path)
+        return success, elapsed, size, None if success else str(result)
+
+    def run(self, requests_per_client=10, text_length=30, unique=True, duration=0):
+        """运行基准测试，duration 大于0时按时长运行（忽略 requests_per_client）
+
+        返回 (结果列表, 实际耗时秒)，结果为 (是否成功, 端到端延迟, 下载字节数, 错误)。
+        """
+        results = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration if duration > 0 else None
+
+        def client_loop(client_index):
+            request_index = 0
+            while (deadline is None and request_index < requests_per_client) or \
+                    (deadline is not None and time.perf_counter() < deadline):
+                outcome = self.run_one(client_index, request_index, text_length, unique)
+                with lock:
+                    results.append(outcome)
+                request_index += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.clients) as executor:
+            list(executor.map(client_loop, range(self.clients)))
+        return results, time.perf_counter() - started
+
+
+def summarize(results, wall_seconds):
+    """汇总吞吐量和端到端延迟分位数"""
+    latencies = sorted(elapsed for success, elapsed, _, _ in results if success)
+    failures = [error for success, _, _, error in results if not success]
+    return {
+        "requests": len(results),
+        "succeeded": len(latencies),
+        "failed": len(failures),
+        "first_error": failures[0] if failures else None,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(latencies) / wall_seconds, 3) if wall_seconds > 0 else 0.0,
+        "latency_seconds": {
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50), 4),
+            "p95": round(percentile(latencies, 0.95), 4),
+            "p99": round(percentile(latencies, 0.99), 4),
+            "max": round(latencies[-1], 4) if latencies else 0.0,
+        },
+        "downloaded_bytes": sum(size for _, _, size, _ in results),
+    }
@@ -0,0 +1,142 @@
+"""模拟的 Genie TTS 上游服务
+
+实现中转服务会调用的接口（/tts、/load_character、/unload_character、/set_reference_audio、
+/clear_reference_audio_cache、/stop），延迟和生成的WAV大小可调，/tts 把音频写到请求中的 save_path。
+
+    python -m benchmarks.fake_upstream --port 18000 --latency 0.3 --per-char 0.01
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import struct
+import wave
+from typing import Optional
+
+import pydantic
+import uvicorn
+from fastapi import FastAPI
+
+
+class TTSPayload(pydantic.BaseModel):
+    character_name: str
+    text: str
+    split_sentence: bool = False
+    save_path: Optional[str] = None
+
+
+def write_wav(path, seconds, sample_rate=32000):
+    """写入指定时长的单声道16位正弦波WAV"""
+    frames = max(1, int(seconds * sample_rate))
+    period = sample_rate / 440.0
+    # 先生成一个周期，再重复拼接，避免逐个采样计算大文件
+    cycle = b"".join(
+        struct.pack("<h", int(8000 * math.sin(2 * math.pi * i / period))) for i in range(int(period))
+    )
+    data = (cycle * (frames // len(cycle) * 2 + 2))[:frames * 2]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(data)
+
+
+def create_app(latency=0.3, per_char=0.0, jitter=0.0, audio_per_char=0.15, min_audio=0.5,
+               sample_rate=32000, concurrency=0, load_latency=0.5, reference_latency=0.05):
+    """创建模拟上游应用
+
+    /tts 耗时为 latency + per_char * 文本长度（再乘以 1±jitter 的随机系数），
+    生成的音频时长为 max(min_audio, audio_per_char * 文本长度) 秒；concurrency 大于0时
+    同时只处理这么多个合成请求，模拟GPU推理槽位。
+    """
+    app = FastAPI(title="Fake Genie TTS")
+    slots = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+    calls = {"tts": 0, "load_character": 0, "unload_character": 0, "set_reference_audio": 0}
+
+    def delay(base):
+        return max(0.0, base * (1 + random.uniform(-jitter, jitter)))
+
+    async def synthesize(payload):
+        await asyncio.sleep(delay(latency + per_char * len(payload.text)))
+        if payload.save_path:
+            seconds = max(min_audio, audio_per_char * len(payload.text))
+            await asyncio.to_thread(write_wav, payload.save_path, seconds, sample_rate)
+
+    @app.get("/")
+    async def root():
+        return {"message": "fake genie tts", "calls": calls}
+
+    @app.post("/tts")
+    async def tts(payload: TTSPayload):
+        calls["tts"] += 1
+        if slots is None:
+            await synthesize(payload)
+        else:
+            async with slots:
+                await synthesize(payload)
+        return {"message": "ok", "save_path": payload.save_path}
+
+    @app.post("/load_character")
+    async def load_character(payload: dict):
+        calls["load_character"] += 1
+        await asyncio.sleep(delay(load_latency))
+        return {"message": "ok"}
+
+    @app.post("/unload_character")
+    async def unload_character(payload: dict):
+        calls["unload_character"] += 1
+        return {"message": "ok"}
+
+    @app.post("/set_reference_audio")
+    async def set_reference_audio(payload: dict):
+        calls["set_reference_audio"] += 1
+        await asyncio.sleep(delay(reference_latency))
+        return {"message": "ok"}
+
+    @app.post("/clear_reference_audio_cache")
+    async def clear_reference_audio_cache():
+        return {"message": "ok"}
+
+    @app.post("/stop")
+    async def stop():
+        return {"message": "ok"}
+
+    return app
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.3, help="每次合成的固定耗时（秒）")
+    parser.add_argument("--per-char", type=float, default=0.0, help="每个字符增加的合成耗时（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="耗时的随机波动比例，如0.2表示±20%%")
+    parser.add_argument("--audio-per-char", type=float, default=0.15, help="每个字符对应的音频时长（秒）")
+    parser.add_argument("--min-audio", type=float, default=0.5, help="最短音频时长（秒）")
+    parser.add_argument("--sample-rate", type=int, default=32000, help="生成WAV的采样率")
+    parser.add_argument("--concurrency", type=int, default=0, help="同时处理的合成请求数，0表示不限")
+    parser.add_argument("--load-latency", type=float, default=0.5, help="加载角色的耗时（秒）")
+    parser.add_argument("--reference-latency", type=float, default=0.05, help="设置参考音频的耗时（秒）")
+
+
+def app_from_args(args):
+    return create_app(
+        latency=args.latency, per_char=args.per_char, jitter=args.jitter,
+        audio_per_char=args.audio_per_char, min_audio=args.min_audio, sample_rate=args.sample_rate,
+        concurrency=args.concurrency, load_latency=args.load_latency, reference_latency=args.reference_latency,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟的 Genie TTS 上游服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(app_from_args(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
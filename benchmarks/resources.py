@@ -0,0 +1,124 @@
+"""采样进程（含子进程，如多worker中转服务）的CPU时间和常驻内存
+
+优先使用 psutil；未安装时在Linux上读取 /proc，其他平台不提供资源数据。
+"""
+
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_tree(pid):
+    """/proc 中 pid 及其所有子孙进程的ID"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read().rsplit(b")", 1)[1].split()
+        except OSError:
+            continue
+        parents.setdefault(int(stat[1]), []).append(int(entry))
+    tree = [pid]
+    for current in tree:
+        tree.extend(parents.get(current, []))
+    return tree
+
+
+def _proc_sample(pid):
+    cpu = 0.0
+    rss = 0
+    for member in _proc_tree(pid):
+        try:
+            with open(f"/proc/{member}/stat", "rb") as f:
+                stat = f.read().rsplit(b")", 1)[1].split()
+            with open(f"/proc/{member}/statm", "rb") as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except OSError:
+            continue
+        # utime、stime 是 ")" 之后的第12、13个字段
+        cpu += (int(stat[11]) + int(stat[12])) / CLOCK_TICKS
+    return cpu, rss
+
+
+def _psutil_sample(pid):
+    try:
+        process = psutil.Process(pid)
+        members = [process] + process.children(recursive=True)
+    except psutil.Error:
+        return 0.0, 0
+    cpu = 0.0
+    rss = 0
+    for member in members:
+        try:
+            times = member.cpu_times()
+            cpu += times.user + times.system
+            rss += member.memory_info().rss
+        except psutil.Error:
+            continue
+    return cpu, rss
+
+
+def sample(pid):
+    """返回 (累计CPU秒, 常驻内存字节)，无法获取时返回None"""
+    if psutil is not None:
+        return _psutil_sample(pid)
+    if os.path.isdir("/proc"):
+        return _proc_sample(pid)
+    return None
+
+
+class ResourceSampler:
+    """后台定期采样，结束后给出平均CPU占用（核数）和内存峰值"""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._start = None
+        self._last = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+
+    def _take(self):
+        result = sample(self.pid)
+        if result is not None:
+            self.peak_rss = max(self.peak_rss, result[1])
+            self._last = (time.perf_counter(), result)
+        return result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._take()
+
+    def start(self):
+        result = self._take()
+        if result is not None:
+            self._start = (time.perf_counter(), result)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止采样，返回资源汇总（不支持的平台返回None）"""
+        if self._start is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._take()
+        (started, (cpu_start, _)), (ended, (cpu_end, rss_end)) = self._start, self._last
+        wall = max(1e-9, ended - started)
+        return {
+            "cpu_seconds": round(cpu_end - cpu_start, 3),
+            "cpu_cores": round((cpu_end - cpu_start) / wall, 3),
+            "rss_peak_mb": round(self.peak_rss / (1024 * 1024), 1),
+            "rss_end_mb": round(rss_end / (1024 * 1024), 1),
+        }
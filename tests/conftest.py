@@ -0,0 +1,96 @@
+"""测试共用的夹具：按文件路径导入客户端/中转脚本，模拟上游，在测试客户端中运行中转服务"""
+
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import requests
+import uvicorn
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import load_relay_module  # noqa: E402
+from benchmarks.fake_upstream import create_app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def relay():
+    return load_relay_module()
+
+
+class Upstream:
+    """在后台线程中用uvicorn运行的模拟上游"""
+
+    def __init__(self, latency=0.3):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        app = create_app(latency=latency, load_latency=0, reference_latency=0, sample_rate=16000)
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def calls(self):
+        return requests.get(self.url + "/", timeout=5).json()["calls"]
+
+    def close(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+@pytest.fixture
+def upstream():
+    server = Upstream()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def make_relay(relay, upstream, tmp_path, monkeypatch):
+    """创建连接模拟上游的无界面中转服务，返回 (TTSClientGUI实例, 测试客户端)
+
+    config 为附加的配置文本，其他关键字参数传给 TTSClientGUI（如模拟多个worker进程时的 shared_state）。
+    """
+    monkeypatch.chdir(tmp_path)
+    clients = []
+
+    def make(config="", **kwargs):
+        (tmp_path / "tts_client_config.ini").write_text(
+            f"[API]\nupstream_api_url = {upstream.url}\n[Cache]\ncache_dir = {tmp_path / 'audio_cache'}\n" + config,
+            encoding="utf-8",
+        )
+        gui = relay.TTSClientGUI(None, **kwargs)
+        gui.create_fastapi_app()
+        client = TestClient(gui.fastapi_app)
+        client.__enter__()
+        clients.append(client)
+        return gui, client
+
+    def stop(client):
+        """提前停止中转服务（如模拟重启）"""
+        clients.remove(client)
+        client.__exit__(None, None, None)
+
+    make.stop = stop
+    yield make
+    for client in clients:
+        client.__exit__(None, None, None)
+
+
+def wait_for_task(client, task_id, timeout=10):
+    """轮询任务状态直到不再处理中"""
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(f"/tts_status/{task_id}").json()
+        if status.get("status") != "processing" or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
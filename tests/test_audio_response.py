@@ -0,0 +1,58 @@
+"""audio_file_response：ETag/304 与 Range/If-Range"""
+
+import io
+import wave
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+
+def make_wav(frames=100, channels=1, sampwidth=2, framerate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(sampwidth)
+        f.setframerate(framerate)
+        f.writeframes(b"\x01\x02" * frames * channels)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def audio_client(relay, tmp_path):
+    path = tmp_path / "audio.wav"
+    path.write_bytes(make_wav(frames=1000))
+    app = FastAPI()
+
+    @app.get("/download")
+    async def download(request: Request):
+        return relay.TTSClientGUI.audio_file_response(request, str(path))
+
+    return TestClient(app), path.read_bytes()
+
+
+def test_audio_response_etag_and_not_modified(audio_client):
+    client, data = audio_client
+    response = client.get("/download")
+    assert response.status_code == 200
+    assert response.content == data
+    etag = response.headers["ETag"]
+
+    assert client.get("/download", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/download", headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    assert client.get("/download", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_audio_response_range_and_if_range(audio_client):
+    client, data = audio_client
+    etag = client.get("/download").headers["ETag"]
+
+    response = client.get("/download", headers={"Range": "bytes=100-", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == data[100:]
+    assert response.headers["Content-Range"] == f"bytes 100-{len(data) - 1}/{len(data)}"
+
+    # 文件已变化（ETag不匹配）时返回完整文件
+    response = client.get("/download", headers={"Range": "bytes=100-", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == data
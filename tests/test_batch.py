@@ -0,0 +1,106 @@
+"""批量合成：/batch_tts 提交，/batch_events 逐条推送，/batch_download 打包下载"""
+
+import asyncio
+import io
+import json
+import zipfile
+
+
+def submit(client, texts, character="角色"):
+    items = [{"character_name": character, "text": text} for text in texts]
+    response = client.post("/batch_tts", json={"items": items})
+    assert response.status_code == 200
+    return response.json()
+
+
+def read_events(client, batch_id):
+    events = []
+    with client.stream("GET", f"/batch_events/{batch_id}") as response:
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                events.append((event, json.loads(line[5:])))
+    return events
+
+
+def test_batch_events_report_each_item_then_summary(make_relay, upstream):
+    gui, client = make_relay()
+    batch = submit(client, ["第一句", "第二句", "第一句"])
+    assert batch["total"] == 3
+
+    events = read_events(client, batch["batch_id"])
+
+    items = [payload for event, payload in events if event == "item"]
+    assert sorted(item["index"] for item in items) == [0, 1, 2]
+    assert all(item["status"] == "completed" for item in items)
+    assert events[-1][0] == "completed"
+    assert events[-1][1]["completed"] == 3
+    # 相同文本的条目共用一次上游合成
+    task_ids = {item["index"]: item["task_id"] for item in items}
+    assert task_ids[0] == task_ids[2] != task_ids[1]
+    assert upstream.calls()["tts"] == 2
+
+    status = client.get(f"/batch_status/{batch['batch_id']}").json()
+    assert status["status"] == "completed"
+    assert [item["index"] for item in status["items"]] == [0, 1, 2]
+
+
+def test_batch_download_archives_finished_audio(make_relay):
+    gui, client = make_relay()
+    batch = submit(client, ["第一句", "第二句"])
+    # 未全部完成时默认不允许下载
+    assert client.get(f"/batch_download/{batch['batch_id']}").status_code == 400
+
+    read_events(client, batch["batch_id"])
+    response = client.get(f"/batch_download/{batch['batch_id']}")
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        assert archive.namelist() == ["0001_角色.wav", "0002_角色.wav"]
+        assert archive.read("0001_角色.wav")[:4] == b"RIFF"
+
+    assert client.get(f"/batch_download/{batch['batch_id']}?format=rar").status_code == 400
+
+
+def test_rejects_empty_and_unknown_batches(make_relay):
+    gui, client = make_relay()
+    assert client.post("/batch_tts", json={"items": []}).status_code == 400
+    assert client.get("/batch_status/missing").status_code == 404
+    assert client.get("/batch_events/missing").status_code == 404
+
+
+def test_parse_batch_file(relay, tmp_path):
+    txt = tmp_path / "lines.txt"
+    txt.write_text("第一句\n\n第二句\n", encoding="utf-8")
+    assert relay.TTSClientGUI.parse_batch_file(str(txt), "默认") == [
+        {"character_name": "默认", "text": "第一句", "split_sentence": False},
+        {"character_name": "默认", "text": "第二句", "split_sentence": False},
+    ]
+    # TXT文件没有角色列，未填写默认角色时无法合成
+    assert relay.TTSClientGUI.parse_batch_file(str(txt), "") == []
+
+    csv_file = tmp_path / "items.csv"
+    csv_file.write_text("character_name,text,split_sentence\n甲,你好,1\n,再见\n乙,\n", encoding="utf-8")
+    assert relay.TTSClientGUI.parse_batch_file(str(csv_file), "默认") == [
+        {"character_name": "甲", "text": "你好", "split_sentence": True},
+        {"character_name": "默认", "text": "再见", "split_sentence": False},
+    ]
+
+
+def test_batches_are_woken_until_their_task_finishes(make_relay, relay):
+    gui, client = make_relay()
+    gui.audio_file_map.add("t1", relay.TaskRecord("t1", "a.wav", "角色", "文本"))
+    gui.task_batches["t1"] = {"b1"}
+
+    # 开始处理时的通知不能消耗批次登记，否则完成时批次收不到通知
+    event = gui.task_change_events["b1"] = asyncio.Event()
+    gui.signal_task_change("t1")
+    assert event.is_set()
+    assert gui.task_batches["t1"] == {"b1"}
+
+    gui.audio_file_map.set_status("t1", "completed")
+    event = gui.task_change_events["b1"] = asyncio.Event()
+    gui.signal_task_change("t1")
+    assert event.is_set()
+    assert "t1" not in gui.task_batches
@@ -0,0 +1,90 @@
+"""CharacterResidency：按需加载角色，超出数量上限时卸载最久未用且不在使用中的角色"""
+
+import asyncio
+import os
+
+
+def make_residency(relay, tmp_path, characters=(), **kwargs):
+    calls = []
+
+    async def api_call(backend, endpoint, data):
+        calls.append((endpoint, data["character_name"]))
+        await asyncio.sleep(0.01)
+        return True, {"message": "ok"}
+
+    residency = relay.CharacterResidency(str(tmp_path), api_call, **kwargs)
+    # 登记模型目录（经过中转的 /load_character 会这样做），之后按需加载
+    for character in characters:
+        residency.mark_loaded("b1", character, f"/models/{character}")
+        residency.mark_unloaded("b1", character)
+    return residency, calls
+
+
+def use(residency, character):
+    async def run():
+        result = await residency.acquire("b1", character)
+        residency.release("b1", character)
+        return result
+    return asyncio.run(run())
+
+
+def test_loads_on_demand_and_evicts_least_recently_used(relay, tmp_path):
+    residency, calls = make_residency(relay, tmp_path, "abc", max_resident=2)
+    for character in "abac":
+        assert use(residency, character) == (True, None)
+
+    assert calls == [
+        ("/load_character", "a"),
+        ("/load_character", "b"),
+        ("/unload_character", "b"),
+        ("/load_character", "c"),
+    ]
+    assert list(residency.resident) == [("b1", "a"), ("b1", "c")]
+    assert residency.loads == 3
+    assert residency.evictions == 1
+
+
+def test_characters_in_use_are_not_evicted(relay, tmp_path):
+    residency, calls = make_residency(relay, tmp_path, "ab", max_resident=1)
+
+    async def run():
+        await residency.acquire("b1", "a")
+        # a 正在合成：加载 b 时暂时超出上限，而不是卸载 a
+        await residency.acquire("b1", "b")
+
+    asyncio.run(run())
+    assert ("/unload_character", "a") not in calls
+    assert set(residency.resident) == {("b1", "a"), ("b1", "b")}
+
+
+def test_concurrent_requests_share_one_load(relay, tmp_path):
+    residency, calls = make_residency(relay, tmp_path, "a")
+
+    async def run():
+        return await asyncio.gather(*(residency.acquire("b1", "a") for _ in range(3)))
+
+    assert asyncio.run(run()) == [(True, None)] * 3
+    assert calls == [("/load_character", "a")]
+
+
+def test_unknown_character_is_left_to_upstream(relay, tmp_path):
+    residency, calls = make_residency(relay, tmp_path)
+    assert use(residency, "unknown") == (True, None)
+    assert calls == []
+
+
+def test_model_dirs_survive_restart(relay, tmp_path):
+    make_residency(relay, tmp_path, "ab")
+    residency, calls = make_residency(relay, tmp_path)
+    assert residency.model_dirs == {"a": "/models/a", "b": "/models/b"}
+    assert not residency.resident
+    use(residency, "b")
+    assert calls == [("/load_character", "b")]
+
+
+def test_model_dirs_survive_restart_without_temp_files(relay, tmp_path):
+    make_residency(relay, tmp_path, "ab")
+    assert os.listdir(tmp_path) == [relay.CharacterResidency.MODELS_FILE]
+
+    residency, calls = make_residency(relay, tmp_path)
+    assert residency.model_dirs == {"a": "/models/a", "b": "/models/b"}
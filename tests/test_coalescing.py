@@ -0,0 +1,30 @@
+"""相同的 /tts 请求在合成完成前提交时合并到同一个任务"""
+
+from conftest import wait_for_task
+
+
+def test_identical_requests_share_one_task(make_relay, upstream):
+    gui, client = make_relay()
+    payload = {"character_name": "角色", "text": "合并测试"}
+    first = client.post("/tts", json=payload).json()
+    second = client.post("/tts", json=payload).json()
+
+    assert second["task_id"] == first["task_id"]
+    assert second["coalesced"] is True
+    assert "coalesced" not in first
+
+    assert wait_for_task(client, first["task_id"])["status"] == "completed"
+    assert upstream.calls()["tts"] == 1
+    dedup = client.get("/stats").json()["dedup"]
+    assert dedup == {"in_flight": 0, "saved_upstream_calls": 1}
+
+
+def test_different_requests_are_not_coalesced(make_relay, upstream):
+    gui, client = make_relay()
+    first = client.post("/tts", json={"character_name": "角色", "text": "第一句"}).json()
+    second = client.post("/tts", json={"character_name": "角色", "text": "第二句"}).json()
+
+    assert second["task_id"] != first["task_id"]
+    assert wait_for_task(client, first["task_id"])["status"] == "completed"
+    assert wait_for_task(client, second["task_id"])["status"] == "completed"
+    assert upstream.calls()["tts"] == 2
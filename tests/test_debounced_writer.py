@@ -0,0 +1,65 @@
+"""DebouncedFileWriter：合并短时间内的多次变更，关闭时写出尚未保存的变更"""
+
+import json
+import time
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_coalesces_changes_into_one_write(relay, tmp_path):
+    state = {"count": 0}
+    path = tmp_path / "state.json"
+    writer = relay.DebouncedFileWriter(str(path), lambda: json.dumps(state), delay=0.1, max_delay=1.0)
+    for _ in range(5):
+        with writer.lock:
+            state["count"] += 1
+        writer.mark_dirty()
+
+    assert wait_for(lambda: writer.writes == 1)
+    time.sleep(0.2)
+    assert writer.writes == 1
+    assert writer.changes == 5
+    assert json.loads(path.read_text()) == {"count": 5}
+    writer.close()
+
+
+def test_max_delay_bounds_continuous_changes(relay, tmp_path):
+    path = tmp_path / "state.json"
+    writer = relay.DebouncedFileWriter(str(path), lambda: "x", delay=0.2, max_delay=0.3)
+    started = time.monotonic()
+    while writer.writes == 0 and time.monotonic() - started < 2:
+        writer.mark_dirty()
+        time.sleep(0.05)
+
+    assert writer.writes >= 1
+    assert time.monotonic() - started < 1.0
+    writer.close()
+
+
+def test_close_flushes_pending_changes(relay, tmp_path):
+    path = tmp_path / "state.json"
+    writer = relay.DebouncedFileWriter(str(path), lambda: "最终状态", delay=60, max_delay=60, encoding="utf-8")
+    writer.mark_dirty()
+    assert not path.exists()
+
+    writer.close()
+
+    assert path.read_text(encoding="utf-8") == "最终状态"
+    assert writer.writes == 1
+    assert not (tmp_path / "state.json.tmp").exists()
+    # 关闭后后台线程退出，不会再次写入
+    assert wait_for(lambda: not writer._thread.is_alive())
+
+
+def test_flush_without_changes_does_not_write(relay, tmp_path):
+    path = tmp_path / "state.json"
+    writer = relay.DebouncedFileWriter(str(path), lambda: "x")
+    writer.flush()
+    writer.close()
+    assert writer.writes == 0
+    assert not path.exists()
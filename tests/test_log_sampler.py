@@ -0,0 +1,55 @@
+"""LogSampler：同一采样键在间隔内只输出一条，之后注明省略的条数"""
+
+import logging
+import time
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def make_logger(relay, name, interval):
+    test_logger = logging.getLogger(f"tts_client.tests.{name}")
+    test_logger.propagate = False
+    test_logger.setLevel(logging.DEBUG)
+    test_logger.handlers[:] = []
+    handler = ListHandler()
+    sampler = relay.LogSampler(interval=interval, max_keys=2)
+    handler.addFilter(sampler)
+    test_logger.addHandler(handler)
+    return test_logger, handler, sampler
+
+
+def test_samples_by_key_and_reports_suppressed(relay):
+    test_logger, handler, sampler = make_logger(relay, "sampled", interval=0.2)
+    for index in range(3):
+        test_logger.warning("队列已满 %d", index, extra={"sample": "queue_full"})
+    test_logger.warning("其他日志")
+    assert handler.messages == ["队列已满 0", "其他日志"]
+    assert sampler.suppressed == 2
+
+    time.sleep(0.25)
+    test_logger.warning("队列已满 %d", 3, extra={"sample": "queue_full"})
+    assert handler.messages[-1] == "队列已满 3（此前省略 2 条）"
+
+
+def test_keys_are_sampled_independently_and_bounded(relay):
+    test_logger, handler, sampler = make_logger(relay, "bounded", interval=60)
+    for key in ("a", "b", "a", "c", "a"):
+        test_logger.info(key, extra={"sample": key})
+    # 最多记住2个键："c" 输出后最早输出的 "a" 被遗忘，之后的 "a" 重新输出
+    assert handler.messages == ["a", "b", "c", "a"]
+    assert list(sampler._keys) == ["c", "a"]
+    assert sampler.suppressed == 1
+
+
+def test_zero_interval_disables_sampling(relay):
+    test_logger, handler, _ = make_logger(relay, "disabled", interval=0)
+    for _ in range(3):
+        test_logger.info("重复", extra={"sample": "same"})
+    assert handler.messages == ["重复"] * 3
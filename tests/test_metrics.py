@@ -0,0 +1,49 @@
+"""RelayMetrics：Prometheus文本格式导出；/metrics 汇总中转服务各阶段的统计"""
+
+from conftest import wait_for_task
+
+
+def test_renders_counters_and_cumulative_histograms(relay):
+    metrics = relay.RelayMetrics()
+    metrics.inc("http_requests_total", route="tts", status="2xx")
+    metrics.inc("http_requests_total", 2, route="tts", status="2xx")
+    for seconds in (0.04, 0.3, 100):
+        metrics.observe("upstream_tts_seconds", seconds, character='say "hi"')
+    metrics.collectors.append(lambda: [("gauge", "queue_depth", 3, {})])
+
+    lines = metrics.render().splitlines()
+
+    assert "# TYPE tts_relay_http_requests_total counter" in lines
+    assert 'tts_relay_http_requests_total{route="tts",status="2xx"} 3' in lines
+    assert "# TYPE tts_relay_upstream_tts_seconds histogram" in lines
+    # 分桶计数是累计的，标签值中的引号被转义
+    assert 'tts_relay_upstream_tts_seconds_bucket{character="say \\"hi\\"",le="0.05"} 1' in lines
+    assert 'tts_relay_upstream_tts_seconds_bucket{character="say \\"hi\\"",le="0.5"} 2' in lines
+    assert 'tts_relay_upstream_tts_seconds_bucket{character="say \\"hi\\"",le="+Inf"} 3' in lines
+    assert 'tts_relay_upstream_tts_seconds_count{character="say \\"hi\\""} 3' in lines
+    assert "tts_relay_queue_depth 3" in lines
+
+
+def test_failing_collector_does_not_break_scrape(relay):
+    metrics = relay.RelayMetrics()
+    metrics.collectors.append(lambda: 1 / 0)
+    metrics.inc("tts_tasks_total", result="completed")
+    assert 'tts_relay_tts_tasks_total{result="completed"} 1' in metrics.render()
+
+
+def test_metrics_endpoint_reports_relay_stages(make_relay):
+    gui, client = make_relay()
+    task_id = client.post("/tts", json={"character_name": "角色", "text": "指标"}).json()["task_id"]
+    assert wait_for_task(client, task_id)["status"] == "completed"
+    assert client.get(f"/download/{task_id}").status_code == 200
+    client.get("/no/such/route")
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'tts_relay_upstream_tts_seconds_count{character="角色"} 1' in text
+    assert 'tts_relay_http_requests_total{route="tts",status="2xx"} 1' in text
+    assert 'tts_relay_http_requests_total{route="other",status="4xx"} 1' in text
+    assert 'tts_relay_download_seconds_count{route="download"} 1' in text
+    assert "tts_relay_completion_to_download_seconds_count 1" in text
+    assert 'tts_relay_tts_tasks_total{result="completed"} 1' in text
@@ -0,0 +1,58 @@
+"""/set_reference_audio：参考音频未变化时不再转发到上游"""
+
+
+def set_reference(client, audio_path, text="参考文本"):
+    response = client.post("/set_reference_audio", json={
+        "character_name": "角色", "audio_path": str(audio_path), "audio_text": text,
+    })
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_unchanged_reference_is_skipped(make_relay, upstream, tmp_path):
+    gui, client = make_relay()
+    reference = tmp_path / "ref.wav"
+    reference.write_bytes(b"RIFF-1")
+
+    assert not set_reference(client, reference).get("skipped")
+    assert set_reference(client, reference).get("skipped") is True
+    assert upstream.calls()["set_reference_audio"] == 1
+
+    # 文本或文件内容变化时重新转发
+    assert not set_reference(client, reference, text="另一段文本").get("skipped")
+    reference.write_bytes(b"RIFF-2")
+    assert not set_reference(client, reference, text="另一段文本").get("skipped")
+    assert upstream.calls()["set_reference_audio"] == 3
+
+
+def test_clearing_upstream_cache_forgets_references(make_relay, upstream, tmp_path):
+    gui, client = make_relay()
+    reference = tmp_path / "ref.wav"
+    reference.write_bytes(b"RIFF")
+    set_reference(client, reference)
+
+    assert client.post("/clear_reference_audio_cache").status_code == 200
+    assert not set_reference(client, reference).get("skipped")
+    assert upstream.calls()["set_reference_audio"] == 2
+
+
+def test_reloading_character_forgets_its_reference(make_relay, upstream, tmp_path):
+    gui, client = make_relay()
+    reference = tmp_path / "ref.wav"
+    reference.write_bytes(b"RIFF")
+    set_reference(client, reference)
+
+    response = client.post("/load_character", json={"character_name": "角色", "onnx_model_dir": str(tmp_path)})
+    assert response.status_code == 200
+    assert not set_reference(client, reference).get("skipped")
+
+
+def test_reference_hash_is_cached_by_file_state(relay, tmp_path):
+    tracker = relay.ReferenceTracker()
+    reference = tmp_path / "ref.wav"
+    reference.write_bytes(b"RIFF")
+    first = tracker.fingerprint(str(reference), "文本")
+    assert first[2]
+    assert tracker.fingerprint(str(reference), "文本") == first
+    # 文件不在本机时只能按路径和文本比较
+    assert tracker.fingerprint(str(tmp_path / "missing.wav"), "文本")[2] == ""
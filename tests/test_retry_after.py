@@ -0,0 +1,22 @@
+"""parse_retry_after：Retry-After 可以是秒数或HTTP日期"""
+
+import email.utils
+import time
+
+
+def test_seconds(relay):
+    assert relay.parse_retry_after("7") == 7
+    assert relay.parse_retry_after("-3") == 0
+
+
+def test_http_date(relay):
+    value = email.utils.formatdate(time.time() + 20, usegmt=True)
+    assert 18 <= relay.parse_retry_after(value) <= 21
+    past = email.utils.formatdate(time.time() - 60, usegmt=True)
+    assert relay.parse_retry_after(past) == 0
+
+
+def test_missing_or_invalid_uses_default(relay):
+    assert relay.parse_retry_after(None) == 5
+    assert relay.parse_retry_after("") == 5
+    assert relay.parse_retry_after("soon", default=3) == 3
@@ -0,0 +1,151 @@
+"""多个worker进程共享任务存储：任意worker都能查询、下载其他worker的任务，相同请求跨进程合并"""
+
+import asyncio
+import json
+import os
+
+from conftest import wait_for_task
+
+
+def make_workers(make_relay, count=2):
+    return [make_relay(shared_state=True, process_count=count) for _ in range(count)]
+
+
+def test_tasks_are_visible_on_every_worker(make_relay):
+    (first, first_client), (second, second_client) = make_workers(make_relay)
+    task_id = first_client.post("/tts", json={"character_name": "角色", "text": "共享测试"}).json()["task_id"]
+    assert wait_for_task(first_client, task_id)["status"] == "completed"
+
+    status = second_client.get(f"/tts_status/{task_id}").json()
+    assert status["status"] == "completed"
+    assert not second.audio_file_map.is_local(task_id)
+    response = second_client.get(f"/download/{task_id}")
+    assert response.status_code == 200
+    assert response.content[:4] == b"RIFF"
+
+
+def test_identical_requests_coalesce_across_workers(make_relay, upstream):
+    (first, first_client), (second, second_client) = make_workers(make_relay)
+    payload = {"character_name": "角色", "text": "跨进程合并"}
+    task_id = first_client.post("/tts", json=payload).json()["task_id"]
+
+    response = second_client.post("/tts", json=payload).json()
+    assert response["task_id"] == task_id
+    assert response["coalesced"] is True
+
+    assert wait_for_task(first_client, task_id)["status"] == "completed"
+    assert upstream.calls()["tts"] == 1
+
+
+def test_batches_are_visible_on_every_worker(make_relay):
+    (first, first_client), (second, second_client) = make_workers(make_relay)
+    items = [{"character_name": "角色", "text": text} for text in ("一", "二")]
+    batch_id = first_client.post("/batch_tts", json={"items": items}).json()["batch_id"]
+
+    with second_client.stream("GET", f"/batch_events/{batch_id}") as response:
+        events = [json.loads(line[5:]) for line in response.iter_lines() if line.startswith("data:")]
+    assert events[-1]["completed"] == 2
+    assert second_client.get(f"/batch_download/{batch_id}").status_code == 200
+
+
+def test_claim_inflight_writes_the_task_row(relay, tmp_path):
+    store = relay.TaskStore(str(tmp_path), flush_interval=60)
+    first = relay.TaskRecord("t1", str(tmp_path / "a.wav"), "角色", "文本")
+    assert store.claim_inflight("key", first) is None
+    # 登记和任务记录一起写入，不依赖后台线程
+    assert store.fetch("t1").status == "processing"
+    assert store.claim_inflight("key", relay.TaskRecord("t2", None, "角色", "文本")) == "t1"
+
+    # 登记的任务已结束时由新任务接替
+    first.status = "completed"
+    store.put(first)
+    store.flush()
+    assert store.claim_inflight("key", relay.TaskRecord("t2", None, "角色", "文本")) is None
+
+    # 任务记录已不存在的登记视为崩溃进程的残留
+    store.delete("t2")
+    store.flush()
+    assert store.claim_inflight("key", relay.TaskRecord("t3", None, "角色", "文本")) is None
+    store.close()
+
+
+class StatusResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.payload = payload or {}
+        self.headers = {}
+        self.text = json.dumps(self.payload)
+
+    def json(self):
+        return self.payload
+
+
+class RelaySession:
+    """提交返回任务ID，状态查询依次返回给定的响应"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+
+    def post(self, url, json=None, timeout=None, headers=None):
+        return StatusResponse(200, {"status": "processing", "task_id": "t1"})
+
+    def get(self, url, timeout=None, headers=None):
+        return self.statuses.pop(0)
+
+
+def relay_with_statuses(make_relay, monkeypatch, statuses, grace):
+    gui, _ = make_relay()
+    gui.config.set("API", "use_push_events", "false")
+    gui.config.set("API", "task_not_found_grace", str(grace))
+    monkeypatch.setattr(gui, "get_http_client", lambda: RelaySession(statuses))
+    monkeypatch.setattr(gui, "_download_task_audio", lambda session, api, task_id, path, on_chunk: (True, path))
+    return gui._relay_tts({"character_name": "角色", "text": "文本"}, "out.wav")
+
+
+def test_client_retries_tasks_not_yet_visible(make_relay, monkeypatch):
+    statuses = [StatusResponse(404), StatusResponse(404), StatusResponse(200, {"status": "completed"})]
+    assert relay_with_statuses(make_relay, monkeypatch, statuses, grace=5) == (True, "out.wav")
+
+
+def test_client_gives_up_on_unknown_tasks_after_grace(make_relay, monkeypatch):
+    success, error = relay_with_statuses(make_relay, monkeypatch, [StatusResponse(404)], grace=0)
+    assert not success
+    assert "404" in error
+
+
+def test_throughput_samples_from_every_worker_are_combined(relay, tmp_path):
+    stores = [relay.TaskStore(str(tmp_path), flush_interval=60) for _ in range(2)]
+    first, second = (relay.ThroughputModel(str(tmp_path), store=store, refresh_interval=0) for store in stores)
+    for model, length in ((first, 10), (second, 20), (first, 40)):
+        model.observe("角色", length, 0.5 + 0.1 * length)
+
+    for model in (first, second):
+        overhead, per_char = model.coefficients("角色")
+        assert (round(overhead, 6), round(per_char, 6)) == (0.5, 0.1)
+    assert not os.path.exists(first.path)
+    for store in stores:
+        store.close()
+
+
+def test_model_dirs_registered_on_one_worker_load_on_another(relay, tmp_path):
+    stores = [relay.TaskStore(str(tmp_path), flush_interval=60) for _ in range(2)]
+    calls = []
+
+    async def api_call(backend, endpoint, data):
+        calls.append((endpoint, data))
+        return True, {"message": "ok"}
+
+    first, second = (relay.CharacterResidency(str(tmp_path), api_call, store=store) for store in stores)
+    first.mark_loaded("b1", "角色", "/models/角色")
+
+    async def use():
+        result = await second.acquire("b1", "角色")
+        second.release("b1", "角色")
+        return result
+
+    assert asyncio.run(use()) == (True, None)
+    assert calls[0][0] == "/load_character"
+    assert calls[0][1]["character_name"] == "角色"
+    assert not os.path.exists(first.path)
+    for store in stores:
+        store.close()
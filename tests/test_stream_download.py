@@ -0,0 +1,160 @@
+"""stream_download：分块下载，连接中断后用 Range/If-Range 续传"""
+
+import configparser
+import types
+
+import requests
+
+
+class FakeResponse:
+    """按块返回数据，可在发送 fail_after 个块后模拟连接中断"""
+
+    def __init__(self, status_code, chunks=(), headers=None, fail_after=None):
+        self.status_code = status_code
+        self.chunks = list(chunks)
+        self.headers = headers or {}
+        self.fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def iter_content(self, chunk_size=None):
+        for index, chunk in enumerate(self.chunks):
+            if self.fail_after is not None and index >= self.fail_after:
+                raise requests.exceptions.ChunkedEncodingError("连接中断")
+            yield chunk
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, stream=False, timeout=None, headers=None):
+        self.requests.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+
+def download(relay, session, dest_path, retries=3):
+    config = configparser.ConfigParser()
+    config.read_dict({"API": {"download_chunk_size": "4", "download_retries": str(retries)}})
+    client = types.SimpleNamespace(config=config, tracer=relay.Tracer())
+    delivered = bytearray()
+    result = relay.TTSClientGUI.stream_download(client, session, "http://relay/download/t", str(dest_path),
+                                                on_chunk=delivered.extend)
+    return result, bytes(delivered)
+
+
+def test_stream_download_resumes_with_range_and_if_range(relay, tmp_path):
+    data = bytes(range(40))
+    session = FakeSession([
+        FakeResponse(200, [data[:10], data[10:20], data[20:]], fail_after=2,
+                     headers={"Content-Length": str(len(data)), "ETag": '"v1"'}),
+        FakeResponse(206, [data[20:30], data[30:]],
+                     headers={"Content-Range": f"bytes 20-39/{len(data)}", "ETag": '"v1"'}),
+    ])
+    dest = tmp_path / "out.wav"
+
+    result, delivered = download(relay, session, dest)
+
+    assert result == (True, len(data))
+    assert dest.read_bytes() == data
+    assert delivered == data
+    assert "Range" not in session.requests[0]
+    assert session.requests[1]["Range"] == "bytes=20-"
+    assert session.requests[1]["If-Range"] == '"v1"'
+    assert not (tmp_path / "out.wav.part").exists()
+
+
+def test_stream_download_restarts_when_file_changed(relay, tmp_path):
+    old, new = b"a" * 20, b"b" * 30
+    session = FakeSession([
+        FakeResponse(200, [old[:10], old[10:]], fail_after=1,
+                     headers={"Content-Length": str(len(old)), "ETag": '"v1"'}),
+        # If-Range 不匹配：服务端返回完整的新文件
+        FakeResponse(200, [new[:15], new[15:]], headers={"Content-Length": str(len(new)), "ETag": '"v2"'}),
+    ])
+    dest = tmp_path / "out.wav"
+
+    result, delivered = download(relay, session, dest)
+
+    assert result == (True, len(new))
+    assert dest.read_bytes() == new
+    # 已交付的前10字节不重复交付
+    assert delivered == old[:10] + new[10:]
+
+
+def test_stream_download_retries_short_response(relay, tmp_path):
+    data = bytes(range(16))
+    session = FakeSession([
+        FakeResponse(200, [data[:8]], headers={"Content-Length": str(len(data))}),
+        FakeResponse(206, [data[8:]], headers={"Content-Range": f"bytes 8-15/{len(data)}"}),
+    ])
+    dest = tmp_path / "out.wav"
+
+    result, _ = download(relay, session, dest)
+
+    assert result == (True, len(data))
+    assert dest.read_bytes() == data
+    assert session.requests[1]["Range"] == "bytes=8-"
+
+
+def test_stream_download_gives_up_after_retries(relay, tmp_path):
+    session = FakeSession([
+        FakeResponse(200, [b"x" * 4, b"y" * 4], fail_after=0, headers={"Content-Length": "8"})
+        for _ in range(3)
+    ])
+    dest = tmp_path / "out.wav"
+
+    success, error = download(relay, session, dest, retries=2)[0]
+
+    assert not success
+    assert "多次传输中断" in error
+    assert not dest.exists()
+
+
+def test_stream_download_reports_http_error(relay, tmp_path):
+    session = FakeSession([FakeResponse(404)])
+    assert download(relay, session, tmp_path / "out.wav")[0] == (False, "下载音频失败: 404")
+
+
+def test_stream_download_resumes_on_the_next_call(relay, tmp_path):
+    data = bytes(range(24))
+    dest = tmp_path / "out.wav"
+    first = FakeSession([
+        FakeResponse(200, [data[:8], data[8:]], fail_after=1,
+                     headers={"Content-Length": str(len(data)), "ETag": '"v1"'}),
+        FakeResponse(206, [data[8:]], fail_after=0,
+                     headers={"Content-Range": f"bytes 8-23/{len(data)}", "ETag": '"v1"'}),
+    ])
+    assert not download(relay, first, dest, retries=1)[0][0]
+    # 临时文件和ETag保留下来
+    assert (tmp_path / "out.wav.part").read_bytes() == data[:8]
+    assert (tmp_path / "out.wav.part.etag").read_text() == '"v1"'
+
+    second = FakeSession([
+        FakeResponse(206, [data[8:16], data[16:]],
+                     headers={"Content-Range": f"bytes 8-23/{len(data)}", "ETag": '"v1"'}),
+    ])
+    result, delivered = download(relay, second, dest)
+
+    assert result == (True, len(data))
+    assert second.requests[0]["Range"] == "bytes=8-"
+    assert second.requests[0]["If-Range"] == '"v1"'
+    assert dest.read_bytes() == data
+    # 上次已下载的部分也按顺序交付
+    assert delivered == data
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["out.wav"]
+
+
+def test_stream_download_does_not_resume_without_etag(relay, tmp_path):
+    (tmp_path / "out.wav.part").write_bytes(b"stale")
+    session = FakeSession([FakeResponse(200, [b"fresh"], headers={"Content-Length": "5"})])
+    result, delivered = download(relay, session, tmp_path / "out.wav")
+
+    assert result == (True, 5)
+    assert "Range" not in session.requests[0]
+    assert delivered == b"fresh"
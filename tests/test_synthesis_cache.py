@@ -0,0 +1,124 @@
+"""SynthesisCache：按内容寻址命中，丢失的文件不算命中，按容量和时间淘汰"""
+
+import time
+
+import pytest
+
+from conftest import wait_for_task
+
+
+@pytest.fixture
+def cache(relay, tmp_path):
+    cache = relay.SynthesisCache(str(tmp_path), max_size_mb=1000 / (1024 * 1024), max_age_days=1)
+    yield cache
+    cache.close()
+
+
+def write_audio(tmp_path, name, size=400):
+    path = tmp_path / name
+    path.write_bytes(b"\x00" * size)
+    return str(path)
+
+
+def test_key_ignores_whitespace_and_width(relay):
+    make_key = relay.SynthesisCache.make_key
+    key = make_key("角色", "ref.wav", "参考", False, "你好，  世界")
+    # 全角标点按NFKC规范化，连续空白折叠为一个空格
+    assert key == make_key("角色", "ref.wav", "参考", False, " 你好,\t世界 ")
+    assert key != make_key("角色", "ref.wav", "参考", True, "你好，  世界")
+    assert key != make_key("角色", "other.wav", "参考", False, "你好，  世界")
+
+
+def test_lookup_hit_and_miss(cache, tmp_path):
+    path = write_audio(tmp_path, "a.wav")
+    assert cache.lookup("a") is None
+    assert cache.store("a", path, "角色")
+    assert cache.lookup("a") == path
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_missing_file_is_dropped_from_index(cache, tmp_path):
+    path = write_audio(tmp_path, "a.wav")
+    cache.store("a", path)
+    (tmp_path / "a.wav").unlink()
+    assert cache.lookup("a") is None
+    assert cache.stats()["entries"] == 0
+    # 不存在或为空的文件不登记
+    assert not cache.store("b", str(tmp_path / "missing.wav"))
+    assert not cache.store("c", write_audio(tmp_path, "empty.wav", size=0))
+
+
+def test_evicts_least_recently_used_over_size(cache, tmp_path):
+    paths = [write_audio(tmp_path, f"{key}.wav") for key in "abc"]
+    cache.store("a", paths[0])
+    time.sleep(0.01)
+    cache.store("b", paths[1])
+    time.sleep(0.01)
+    assert cache.lookup("a") == paths[0]
+    time.sleep(0.01)
+    cache.store("c", paths[2])
+
+    assert cache.lookup("b") is None
+    assert not (tmp_path / "b.wav").exists()
+    assert cache.lookup("a") == paths[0]
+    assert cache.lookup("c") == paths[2]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_expired_entries(cache, tmp_path):
+    cache.store("old", write_audio(tmp_path, "old.wav", size=10))
+    cache._db.execute("UPDATE entries SET created_at = created_at - 2 * 86400 WHERE key = 'old'")
+    cache.store("new", write_audio(tmp_path, "new.wav", size=10))
+
+    assert cache.lookup("old") is None
+    assert not (tmp_path / "old.wav").exists()
+    assert cache.lookup("new") is not None
+
+
+def test_eviction_keeps_files_referenced_by_tasks(relay, tmp_path):
+    referenced = set()
+    cache = relay.SynthesisCache(str(tmp_path), max_size_mb=1000 / (1024 * 1024), max_age_days=1,
+                                 referenced_files=lambda: referenced)
+    paths = [write_audio(tmp_path, f"{key}.wav") for key in "abc"]
+    referenced.add(paths[0])
+    for key, path in zip("abc", paths):
+        cache.store(key, path)
+        time.sleep(0.01)
+
+    # 最久未用的a仍被任务引用，改为淘汰b
+    assert (tmp_path / "a.wav").exists()
+    assert not (tmp_path / "b.wav").exists()
+    assert cache.lookup("a") == paths[0]
+
+    # 过期的条目同样保留到不再被引用
+    cache._db.execute("UPDATE entries SET created_at = created_at - 2 * 86400")
+    cache.store("c", paths[2])
+    assert (tmp_path / "a.wav").exists()
+    referenced.clear()
+    cache.store("c", paths[2])
+    assert not (tmp_path / "a.wav").exists()
+    cache.close()
+
+
+def test_relay_keeps_audio_of_completed_tasks(make_relay, tmp_path):
+    gui, client = make_relay()
+    gui.config.set("Cache", "max_size_mb", str(1 / (1024 * 1024)))
+    gui.open_synthesis_cache()
+    reference = tmp_path / "ref.wav"
+    reference.write_bytes(b"RIFF")
+    # 参考音频已知时结果才进入合成缓存
+    assert client.post("/set_reference_audio", json={
+        "character_name": "角色", "audio_path": str(reference), "audio_text": "参考文本"
+    }).status_code == 200
+
+    task_ids = []
+    for text in ("第一句", "第二句"):
+        task_id = client.post("/tts", json={"character_name": "角色", "text": text}).json()["task_id"]
+        assert wait_for_task(client, task_id)["status"] == "completed"
+        task_ids.append(task_id)
+    # 缓存超出容量，但两个任务的文件仍可下载
+    assert gui.synthesis_cache.stats()["entries"] == 2
+    for task_id in task_ids:
+        assert client.get(f"/download/{task_id}").status_code == 200
@@ -0,0 +1,44 @@
+"""/events/{task_id}：以SSE推送任务状态，完成或失败后结束"""
+
+import json
+
+
+def read_events(client, task_id):
+    events = []
+    with client.stream("GET", f"/events/{task_id}") as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                events.append((event, json.loads(line[5:])))
+    return events
+
+
+def test_stream_reports_progress_until_completed(make_relay):
+    gui, client = make_relay()
+    task_id = client.post("/tts", json={"character_name": "角色", "text": "推送测试"}).json()["task_id"]
+
+    events = read_events(client, task_id)
+
+    assert events[0][0] == "processing"
+    assert events[-1][0] == "completed"
+    assert events[-1][1]["download_url"] == f"/download/{task_id}"
+    assert events[-1][1]["file_exists"] is True
+    assert all(payload["task_id"] == task_id for _, payload in events)
+
+
+def test_finished_task_sends_one_event(make_relay):
+    gui, client = make_relay()
+    task_id = client.post("/tts", json={"character_name": "角色", "text": "推送测试"}).json()["task_id"]
+    read_events(client, task_id)
+
+    events = read_events(client, task_id)
+    assert [event for event, _ in events] == ["completed"]
+
+
+def test_unknown_task_is_404(make_relay):
+    gui, client = make_relay()
+    assert client.get("/events/missing").status_code == 404
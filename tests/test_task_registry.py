@@ -0,0 +1,68 @@
+"""TaskRegistry：按容量和TTL淘汰记录，处理中的记录保留，状态计数保持一致"""
+
+import time
+
+
+def make_record(relay, task_id, status="completed", age=0.0):
+    record = relay.TaskRecord(task_id, f"/tmp/{task_id}.wav", "角色", "文本", status=status)
+    record.created_ts -= age
+    return record
+
+
+def test_evicts_oldest_records_over_max_size(relay):
+    registry = relay.TaskRegistry(max_size=3, ttl_seconds=0)
+    for index in range(5):
+        registry.add(f"t{index}", make_record(relay, f"t{index}"))
+
+    assert [key for key, _ in registry.items()] == ["t2", "t3", "t4"]
+    assert registry.evicted == 2
+    assert registry.counts() == {"completed": 3}
+
+
+def test_processing_records_are_not_evicted_by_size(relay):
+    registry = relay.TaskRegistry(max_size=2, ttl_seconds=0)
+    registry.add("busy", make_record(relay, "busy", status="processing"))
+    for index in range(3):
+        registry.add(f"t{index}", make_record(relay, f"t{index}"))
+
+    assert "busy" in registry
+    assert [key for key, _ in registry.items()] == ["busy", "t2"]
+    assert registry.count("processing") == 1
+
+
+def test_expired_records_are_evicted(relay):
+    registry = relay.TaskRegistry(max_size=100, ttl_seconds=60)
+    registry.add("old", make_record(relay, "old", age=120))
+    registry.add("old-busy", make_record(relay, "old-busy", status="processing", age=120))
+    registry.add("new", make_record(relay, "new"))
+
+    assert "old" not in registry
+    assert "old-busy" in registry
+    assert "new" in registry
+    assert registry.evicted == 1
+
+
+def test_set_status_moves_record_between_status_indexes(relay):
+    registry = relay.TaskRegistry(max_size=3, ttl_seconds=0)
+    registry.add("a", make_record(relay, "a", status="processing"))
+    registry.add("b", make_record(relay, "b", status="processing"))
+    registry.add("c", make_record(relay, "c", status="processing"))
+
+    registry.set_status("a", "completed", progress=100)
+    assert registry.counts() == {"processing": 2, "completed": 1}
+    assert [key for key, _ in registry.items("completed")] == ["a"]
+    assert registry.get("a").progress == 100
+
+    # 下一次写入时，已完成的记录按容量被淘汰
+    registry.add("d", make_record(relay, "d"))
+    assert "a" not in registry
+    assert [key for key, _ in registry.items()] == ["b", "c", "d"]
+    assert registry.counts() == {"processing": 2, "completed": 1}
+
+
+def test_restore_keeps_creation_time(relay):
+    registry = relay.TaskRegistry(max_size=10, ttl_seconds=3600)
+    record = make_record(relay, "restored", age=10)
+    registry.restore([record])
+
+    assert registry.get("restored").created_ts < time.time() - 5
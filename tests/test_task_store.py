@@ -0,0 +1,61 @@
+"""TaskStore：任务写入SQLite，中转服务重启后恢复；中断的任务标记为失败"""
+
+from conftest import wait_for_task
+
+
+def make_record(relay, task_id, file_path, status="completed"):
+    return relay.TaskRecord(task_id, str(file_path), "角色", "文本", status=status)
+
+
+def test_records_survive_reopen(relay, tmp_path):
+    audio = tmp_path / "done.wav"
+    audio.write_bytes(b"RIFF")
+    store = relay.TaskStore(str(tmp_path), flush_interval=60)
+    store.put(make_record(relay, "done", audio))
+    store.put(make_record(relay, "busy", tmp_path / "busy.wav", status="processing"))
+    store.put(make_record(relay, "lost", tmp_path / "lost.wav"))
+    store.put(make_record(relay, "removed", audio))
+    store.delete("removed")
+    # 同一批次内的多次变更合并为一次写入
+    assert store.stats()["pending_writes"] == 4
+    store.close()
+
+    store = relay.TaskStore(str(tmp_path))
+    records = {record.task_id: record for record in store.load()}
+    store.close()
+
+    # 文件已丢失的完成任务被丢弃，处理中的任务无法继续，标记为失败
+    assert set(records) == {"done", "busy"}
+    assert records["done"].status == "completed"
+    assert records["done"].progress == 100
+    assert records["busy"].status == "failed"
+    assert records["busy"].error == "中转服务重启，任务已中断"
+
+
+def test_load_drops_expired_rows(relay, tmp_path):
+    audio = tmp_path / "a.wav"
+    audio.write_bytes(b"RIFF")
+    store = relay.TaskStore(str(tmp_path))
+    old = make_record(relay, "old", audio)
+    old.created_ts -= 7200
+    store.put(old)
+    store.put(make_record(relay, "new", audio))
+    store.flush()
+
+    assert [record.task_id for record in store.load(max_age_seconds=3600)] == ["new"]
+    assert [record.task_id for record in store.load()] == ["new"]
+    store.close()
+
+
+def test_relay_restores_tasks_after_restart(make_relay):
+    gui, client = make_relay()
+    task_id = client.post("/tts", json={"character_name": "角色", "text": "重启测试"}).json()["task_id"]
+    assert wait_for_task(client, task_id)["status"] == "completed"
+    make_relay.stop(client)
+    gui.task_store.close()
+
+    restarted, client = make_relay()
+    status = client.get(f"/tts_status/{task_id}").json()
+    assert status["status"] == "completed"
+    assert status["file_exists"] is True
+    assert client.get(f"/download/{task_id}").status_code == 200
@@ -0,0 +1,70 @@
+"""ThroughputModel：按角色拟合合成耗时；任务状态中给出剩余时间和排队位置"""
+
+import os
+import threading
+
+import pytest
+
+
+def test_default_speed_without_samples(relay, tmp_path):
+    model = relay.ThroughputModel(str(tmp_path))
+    assert model.estimate("角色", 16) == pytest.approx(16 / relay.ThroughputModel.DEFAULT_CHARS_PER_SECOND)
+
+
+def test_fits_overhead_and_speed(relay, tmp_path):
+    model = relay.ThroughputModel(str(tmp_path))
+    for length in (10, 20, 40):
+        model.observe("角色", length, 0.5 + 0.1 * length)
+
+    overhead, per_char = model.coefficients("角色")
+    assert overhead == pytest.approx(0.5)
+    assert per_char == pytest.approx(0.1)
+    assert model.estimate("角色", 30) == pytest.approx(3.5)
+    # 没有样本的角色使用所有角色的合计
+    assert model.estimate("新角色", 30) == pytest.approx(3.5)
+    assert model.stats()["角色"]["chars_per_second"] == 10.0
+
+
+def test_similar_lengths_use_average_speed(relay, tmp_path):
+    model = relay.ThroughputModel(str(tmp_path))
+    for _ in range(3):
+        model.observe("角色", 10, 2.5)
+    assert model.coefficients("角色") == (0.0, pytest.approx(0.25))
+
+
+def test_model_survives_restart(relay, tmp_path):
+    model = relay.ThroughputModel(str(tmp_path), save_every=3)
+    for length in (10, 20, 40):
+        model.observe("角色", length, 0.5 + 0.1 * length)
+
+    restored = relay.ThroughputModel(str(tmp_path))
+    assert restored.estimate("角色", 30) == pytest.approx(3.5)
+
+
+def test_status_reports_eta_and_queue_position(make_relay):
+    gui, client = make_relay("[LocalAPI]\nrelay_workers = 1\n")
+    task_ids = [
+        client.post("/tts", json={"character_name": "角色", "text": f"第{index}句"}).json()["task_id"]
+        for index in range(3)
+    ]
+
+    statuses = [client.get(f"/tts_status/{task_id}").json() for task_id in task_ids]
+    assert all(status["eta_seconds"] > 0 for status in statuses)
+    assert "queue_position" not in statuses[0]
+    assert statuses[2]["queue_position"] == statuses[1]["queue_position"] + 1
+    assert statuses[2]["eta_seconds"] > statuses[0]["eta_seconds"]
+
+
+def test_concurrent_saves_keep_a_valid_model_file(relay, tmp_path):
+    models = [relay.ThroughputModel(str(tmp_path)) for _ in range(4)]
+    for index, model in enumerate(models):
+        model.observe(f"角色{index}", 10, 1.0)
+    threads = [threading.Thread(target=lambda m=model: [m.save() for _ in range(50)]) for model in models]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 每次保存使用唯一的临时文件，不会留下残余，文件内容始终是某一次完整的保存
+    assert os.listdir(tmp_path) == [relay.ThroughputModel.MODEL_FILE]
+    assert len(relay.ThroughputModel(str(tmp_path)).sums) == 1
@@ -0,0 +1,104 @@
+"""Tracer：span 的父子关系、traceparent 传递和 OTLP JSON 导出"""
+
+import json
+import types
+
+from conftest import wait_for_task
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+TRACEPARENT = f"00-{TRACE_ID}-{PARENT_ID}-01"
+
+
+def read_spans(path):
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            for resource_spans in json.loads(line)["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    spans.extend(scope_spans["spans"])
+    return spans
+
+
+def test_parse_traceparent(relay):
+    assert relay.Tracer.parse_traceparent(TRACEPARENT) == (TRACE_ID, PARENT_ID)
+    assert relay.Tracer.parse_traceparent(TRACEPARENT.upper()) == (TRACE_ID, PARENT_ID)
+    assert relay.Tracer.parse_traceparent(None) is None
+    assert relay.Tracer.parse_traceparent("00-abc-def-01") is None
+    assert relay.Tracer.parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+
+
+def test_nested_spans_are_exported_with_parents(relay, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = relay.Tracer(str(path), service_name="test", enabled=True, flush_interval=60)
+    with tracer.span("outer", parent=TRACEPARENT, kind="server") as outer:
+        headers = tracer.inject({"Accept": "audio/wav"})
+        with tracer.span("inner", kind="client", attributes={"tts.retries": 2}):
+            pass
+    tracer.close()
+
+    assert headers == {"Accept": "audio/wav", "traceparent": outer.traceparent}
+    spans = {span["name"]: span for span in read_spans(path)}
+    assert spans["outer"]["traceId"] == spans["inner"]["traceId"] == TRACE_ID
+    assert spans["outer"]["parentSpanId"] == PARENT_ID
+    assert spans["inner"]["parentSpanId"] == spans["outer"]["spanId"]
+    assert spans["inner"]["kind"] == 3
+    assert spans["inner"]["attributes"] == [{"key": "tts.retries", "value": {"intValue": "2"}}]
+    assert tracer.stats()["exported_spans"] == 2
+
+
+def test_disabled_tracer_records_nothing(relay, tmp_path):
+    tracer = relay.Tracer(str(tmp_path / "traces.jsonl"))
+    with tracer.span("ignored"):
+        assert tracer.inject() == {}
+    tracer.close()
+    assert not (tmp_path / "traces.jsonl").exists()
+
+
+def test_require_parent_skips_unrelated_calls(relay, tmp_path):
+    tracer = relay.Tracer(str(tmp_path / "traces.jsonl"), enabled=True)
+    with tracer.span("probe", require_parent=True) as span:
+        assert span is relay.NULL_SPAN
+    tracer.close()
+
+
+def test_relay_continues_the_callers_trace(make_relay, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    gui, client = make_relay(f"[Tracing]\nenabled = true\nexport_file = {path}\n")
+    response = client.post("/tts", json={"character_name": "角色", "text": "追踪"},
+                           headers={"traceparent": TRACEPARENT})
+    task_id = response.json()["task_id"]
+    assert wait_for_task(client, task_id)["status"] == "completed"
+    gui.tracer.flush()
+
+    spans = read_spans(path)
+    names = {span["name"] for span in spans}
+    assert {"relay queue_wait", "upstream POST /tts"} <= names
+    assert all(span["traceId"] == TRACE_ID for span in spans if span["name"] != "GET /tts_status/{task_id}")
+    # 服务端span挂在调用方的span下
+    server = next(span for span in spans if span.get("parentSpanId") == PARENT_ID)
+    assert server["kind"] == 2
+
+
+def test_incremental_speech_is_one_trace(make_relay, relay, tmp_path, monkeypatch):
+    gui, _ = make_relay()
+    path = tmp_path / "client_traces.jsonl"
+    gui.tracer = relay.Tracer(str(path), enabled=True, flush_interval=60)
+
+    def synthesize_segment(character_name, sentence):
+        with gui.tracer.span("segment", attributes={"tts.sentence": sentence}):
+            return False, "上游不可用"
+
+    monkeypatch.setattr(gui, "_synthesize_segment", synthesize_segment)
+    # 无界面运行，失败提示框不可用
+    monkeypatch.setattr(relay, "messagebox", types.SimpleNamespace(showerror=lambda *args: None))
+    gui._speak_incremental_thread({"character_name": "角色", "text": "一。二。"}, str(tmp_path / "out.wav"),
+                                  None, ["一。", "二。"])
+    gui.tracer.close()
+
+    spans = read_spans(path)
+    root = next(span for span in spans if span["name"] == "client speak_incremental")
+    assert "parentSpanId" not in root
+    segments = [span for span in spans if span["name"] == "segment"]
+    assert segments
+    assert all(span["traceId"] == root["traceId"] and span["parentSpanId"] == root["spanId"] for span in segments)
@@ -0,0 +1,108 @@
+"""UpstreamPool：按负载和角色驻留选择后端，连续失败时摘除，探测恢复后重新加入"""
+
+import asyncio
+
+import pytest
+
+
+class FakeEngine:
+    """按后端地址返回预设结果的上游引擎"""
+
+    def __init__(self):
+        self.down = set()
+        self.results = {}
+
+    async def request(self, method, url, timeout=None):
+        if any(url.startswith(base) for base in self.down):
+            raise ConnectionError("连接被拒绝")
+        return type("Response", (), {"status_code": 200})()
+
+    async def api_call(self, url, endpoint, data=None, timeout=30):
+        return self.results.get(url, (True, {"message": "ok"}))
+
+
+def make_pool(relay, **kwargs):
+    engine = FakeEngine()
+    backends = [("a", "http://a:9880"), ("b", "http://b:9880")]
+    return relay.UpstreamPool(engine, backends, health_interval=0, **kwargs), engine
+
+
+def probe_all(pool):
+    async def run():
+        for backend in pool.backends.values():
+            await pool.probe(backend)
+    asyncio.run(run())
+
+
+def test_ejects_after_consecutive_failures_and_readmits(relay):
+    readmitted = []
+    pool, engine = make_pool(relay, eject_after=2, readmit_after=2, on_readmit=readmitted.append)
+    engine.down.add("http://a:9880")
+
+    probe_all(pool)
+    assert pool.backends["a"].healthy
+    probe_all(pool)
+    assert not pool.backends["a"].healthy
+    assert [backend.name for backend in pool.healthy_backends()] == ["b"]
+    assert pool.choose("角色").name == "b"
+
+    engine.down.clear()
+    probe_all(pool)
+    assert not pool.backends["a"].healthy
+    probe_all(pool)
+    assert pool.backends["a"].healthy
+    assert pool.backends["a"].ejections == 1
+    assert readmitted == ["a"]
+
+
+def test_all_ejected_keeps_serving(relay):
+    pool, engine = make_pool(relay, eject_after=1)
+    engine.down.update({"http://a:9880", "http://b:9880"})
+    probe_all(pool)
+    assert len(pool.healthy_backends()) == 2
+
+
+def test_transport_errors_count_towards_ejection(relay):
+    pool, engine = make_pool(relay, eject_after=2)
+    backend = pool.backends["a"]
+
+    async def run():
+        engine.results[backend.url] = (False, "上游返回错误: 500")
+        await pool.call(backend, "/tts")
+        assert backend.consecutive_failures == 0
+        engine.results[backend.url] = (False, relay.RelayEngine.CONNECT_ERROR)
+        await pool.call(backend, "/tts")
+        await pool.call(backend, "/tts")
+
+    asyncio.run(run())
+    assert not backend.healthy
+    assert backend.failures == 3
+
+
+def test_prefers_backend_with_character_resident(relay):
+    pool, _ = make_pool(relay, affinity_slack=2)
+    resident = {("b", "角色")}
+
+    def is_resident(backend, character):
+        return (backend, character) in resident
+
+    assert pool.choose("角色", is_resident).name == "b"
+    assert pool.choose("其他", is_resident).name == "a"
+    # 已加载角色的后端明显更忙时改选空闲的后端
+    pool.backends["b"].outstanding = 3
+    assert pool.choose("角色", is_resident).name == "a"
+
+
+def test_local_backend_detection(relay):
+    assert relay.UpstreamBackend.is_local_url("http://127.0.0.1:9880")
+    assert relay.UpstreamBackend.is_local_url("http://localhost:9880")
+    assert not relay.UpstreamBackend.is_local_url("http://tts-host.invalid:9880")
+
+
+def test_remote_backend_requires_shared_cache_dir(make_relay):
+    with pytest.raises(RuntimeError, match="shared_cache_dir"):
+        make_relay("[Upstreams]\nremote = http://tts-host.invalid:9880\n")
+
+    gui, client = make_relay("[Upstreams]\nremote = http://tts-host.invalid:9880\n"
+                             "[LocalAPI]\nshared_cache_dir = true\nhealth_interval = 0\n")
+    assert client.get("/stats").status_code == 200
@@ -0,0 +1,87 @@
+"""UpstreamScheduler：角色之间轮询出队、队列上限和排队位置"""
+
+import asyncio
+
+
+def drain(scheduler, count):
+    async def run():
+        return [await scheduler.get() for _ in range(count)]
+    return asyncio.run(run())
+
+
+def test_round_robin_between_characters(relay):
+    scheduler = relay.UpstreamScheduler()
+    for job in ("a1", "a2", "a3"):
+        scheduler.offer("A", job)
+    scheduler.offer("B", "b1")
+    for job in ("c1", "c2"):
+        scheduler.offer("C", job)
+
+    assert drain(scheduler, 6) == ["a1", "b1", "c1", "a2", "c2", "a3"]
+    assert scheduler.depth == 0
+    assert scheduler.dispatched == 6
+    assert not scheduler.queues
+
+
+def test_busy_character_does_not_starve_late_arrivals(relay):
+    scheduler = relay.UpstreamScheduler()
+
+    async def run():
+        for index in range(10):
+            scheduler.offer("busy", f"busy{index}")
+        jobs = [await scheduler.get()]
+        # 后到的角色排在本轮末尾，最多等 busy 再出队一个
+        scheduler.offer("quiet", "quiet0")
+        return jobs + [await scheduler.get() for _ in range(3)]
+
+    assert asyncio.run(run()) == ["busy0", "busy1", "quiet0", "busy2"]
+
+
+def test_rejects_when_total_queue_is_full(relay):
+    scheduler = relay.UpstreamScheduler(max_queue_depth=2)
+
+    async def run():
+        assert scheduler.offer("A", "a1")
+        assert scheduler.offer("B", "b1")
+        assert not scheduler.offer("C", "c1")
+        assert scheduler.rejected == 1
+        # 出队后腾出位置
+        await scheduler.get()
+        assert scheduler.offer("C", "c1")
+
+    asyncio.run(run())
+
+
+def test_rejects_when_character_queue_is_full(relay):
+    scheduler = relay.UpstreamScheduler(max_queue_depth=10, max_queue_per_character=2)
+    assert scheduler.offer("A", "a1")
+    assert scheduler.offer("A", "a2")
+    assert not scheduler.offer("A", "a3")
+    assert scheduler.offer("B", "b1")
+    assert scheduler.stats()["queues"] == {"A": 2, "B": 1}
+
+
+def test_position_follows_round_robin_order(relay):
+    scheduler = relay.UpstreamScheduler()
+    scheduler.offer("A", "a1", key="a1")
+    scheduler.offer("A", "a2", key="a2")
+    scheduler.offer("B", "b1", key="b1")
+
+    assert scheduler.position("A", "a1") == 0
+    assert scheduler.position("B", "b1") == 1
+    assert scheduler.position("A", "a2") == 2
+    assert scheduler.position("A", "missing") is None
+    assert scheduler.position("C", "c1") is None
+
+
+def test_waiting_consumer_is_woken_by_offer(relay):
+    scheduler = relay.UpstreamScheduler()
+
+    async def run():
+        consumer = asyncio.ensure_future(scheduler.get())
+        await asyncio.sleep(0.01)
+        assert not consumer.done()
+        scheduler.offer("A", "a1")
+        return await asyncio.wait_for(consumer, 1)
+
+    assert asyncio.run(run()) == "a1"
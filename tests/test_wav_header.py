@@ -0,0 +1,50 @@
+"""parse_wav_header：从已下载的开头部分解析WAV格式和数据块位置"""
+
+import io
+import struct
+import wave
+
+import pytest
+
+
+def make_wav(frames=100, channels=1, sampwidth=2, framerate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(sampwidth)
+        f.setframerate(framerate)
+        f.writeframes(b"\x01\x02" * frames * channels)
+    return buffer.getvalue()
+
+
+def test_parse_wav_header(relay):
+    data = make_wav(frames=100, channels=2, framerate=32000)
+    assert relay.parse_wav_header(data) == (2, 2, 32000, 1, 44, 400)
+
+
+def test_parse_wav_header_needs_more_data(relay):
+    data = make_wav()
+    assert relay.parse_wav_header(data[:8]) is None
+    assert relay.parse_wav_header(data[:30]) is None
+    assert relay.parse_wav_header(data[:43]) is None
+
+
+def test_parse_wav_header_skips_other_chunks(relay):
+    data = make_wav(frames=10)
+    # 在 fmt 和 data 之间插入奇数长度的 LIST 块（按偶数字节对齐）
+    extra = b"LIST" + struct.pack("<I", 3) + b"abc\x00"
+    data = data[:36] + extra + data[36:]
+    assert relay.parse_wav_header(data) == (1, 2, 16000, 1, 44 + len(extra), 20)
+
+
+def test_parse_wav_header_extensible_format(relay):
+    data = bytearray(make_wav(frames=10))
+    fmt = struct.pack("<HHIIHH", 0xFFFE, 1, 16000, 32000, 2, 16)
+    fmt += struct.pack("<HHI", 22, 16, 0) + struct.pack("<H", 3) + b"\x00" * 14
+    data = bytes(data[:12]) + b"fmt " + struct.pack("<I", len(fmt)) + fmt + bytes(data[36:])
+    assert relay.parse_wav_header(data)[3] == 3
+
+
+def test_parse_wav_header_rejects_other_data(relay):
+    with pytest.raises(ValueError):
+        relay.parse_wav_header(b"ID3\x04" + b"\x00" * 20)
@@ -1,50 +1,2868 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
 import requests
+import httpx
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 import uuid
 import json
 import threading
 import os
+import sys
+import atexit
+import logging
+import logging.handlers
+import queue
 import tempfile
+import shutil
+import subprocess
 import configparser
+import multiprocessing
+import signal
+import socket
+import csv
+import zipfile
+import tarfile
 import wave
-import pyaudio
+import struct
+import argparse
 import hashlib
 import re
+import urllib.parse
+import sqlite3
+import unicodedata
 from datetime import datetime
 import uvicorn
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 import pydantic
 from typing import Optional, Dict, Any, List
 import asyncio
+import contextlib
+import contextvars
+import functools
+import email.utils
 import webbrowser
 import io
 import time
+import math
+from collections import OrderedDict, deque
 from pathlib import Path
-from random import randint
+from concurrent.futures import ThreadPoolExecutor
 
-class TTSClientGUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("TTS API 客户端 - 中转服务器")
-        self.root.geometry("800x600")
-        # 禁用Tk默认的系统提示音（bell），避免点击按钮时发出提示音
+# 图形界面与音频播放依赖按需导入：无界面运行中转服务时不需要 tkinter / pyaudio
+tk = ttk = filedialog = messagebox = None
+pyaudio = None
+
+
+def import_gui_modules():
+    """导入 tkinter（仅图形界面模式需要）"""
+    global tk, ttk, filedialog, messagebox
+    if tk is None:
+        import tkinter
+        from tkinter import ttk as tkinter_ttk, filedialog as tkinter_filedialog, messagebox as tkinter_messagebox
+        tk, ttk, filedialog, messagebox = tkinter, tkinter_ttk, tkinter_filedialog, tkinter_messagebox
+
+
+def import_pyaudio():
+    """导入 pyaudio（仅本机播放音频时需要）"""
+    global pyaudio
+    if pyaudio is None:
+        import pyaudio as pyaudio_module
+        pyaudio = pyaudio_module
+
+
+# 日志经有界队列交给后台线程写出，请求处理路径上不会阻塞在 stdout / 文件写入上
+logger = logging.getLogger("tts_client")
+# 是否记录请求/响应数据及截断长度（[Logging] log_payloads / payload_max_chars）
+LOG_PAYLOADS = False
+PAYLOAD_MAX_CHARS = 200
+_log_handler = None
+
+
+class LogSampler(logging.Filter):
+    """日志采样：带 sample 键（extra={"sample": 键}）的日志，同一个键每 interval 秒只输出一条
+
+    下一条输出的日志注明期间省略的条数；键的数量有上限，最久未出现的键先被遗忘。
+    """
+
+    def __init__(self, interval=5.0, max_keys=1024):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self.suppressed = 0
+        # 键 -> [上次输出时间, 之后省略的条数]
+        self._keys: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None or self.interval <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            state = self._keys.get(key)
+            if state is not None and now - state[0] < self.interval:
+                state[1] += 1
+                self.suppressed += 1
+                return False
+            skipped = state[1] if state is not None else 0
+            self._keys[key] = [now, 0]
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        if skipped:
+            record.msg = f"{record.getMessage()}（此前省略 {skipped} 条）"
+            record.args = None
+        return True
+
+
+class JsonLogFormatter(logging.Formatter):
+    """每条日志输出为一行JSON：时间、级别、进程、线程、消息，以及 extra 传入的字段（如 trace_id）"""
+
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AsyncLogHandler(logging.handlers.QueueHandler):
+    """非阻塞日志处理器：记录放入有界队列，由 QueueListener 线程格式化后交给 target 写出
+
+    队列已满（写出跟不上）时丢弃新记录并计数，不阻塞调用方；处于追踪span中时记录其 trace_id。
+    """
+
+    def __init__(self, target, max_queue=10000):
+        super().__init__(queue.Queue(max_queue))
+        self.target = target
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(self.queue, target, respect_handler_level=True)
+
+    def prepare(self, record):
+        span = current_span.get()
+        if span is not None:
+            record.trace_id = span.trace_id
+        return super().prepare(record)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self.listener.start()
+        return self
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "dropped": self.dropped,
+            "sampled_out": sum(f.suppressed for f in self.filters if isinstance(f, LogSampler)),
+        }
+
+    def stop(self):
+        """停止后台线程（先写出队列中剩余的日志）"""
+        self.listener.stop()
+        self.target.close()
+
+
+def setup_logging(config):
+    """按配置 [Logging] 设置日志：级别、text/json 格式、输出文件（默认stdout）、采样间隔、请求数据记录
+
+    重复调用时替换之前的设置。
+    """
+    global _log_handler, LOG_PAYLOADS, PAYLOAD_MAX_CHARS
+    LOG_PAYLOADS = config.getboolean('Logging', 'log_payloads', fallback=False)
+    PAYLOAD_MAX_CHARS = config.getint('Logging', 'payload_max_chars', fallback=200)
+    path = config.get('Logging', 'file', fallback='').strip()
+    target = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler(sys.stdout)
+    if config.get('Logging', 'format', fallback='text').strip().lower() == 'json':
+        target.setFormatter(JsonLogFormatter())
+    else:
+        target.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    handler = AsyncLogHandler(target, max_queue=config.getint('Logging', 'queue_size', fallback=10000))
+    handler.addFilter(LogSampler(config.getfloat('Logging', 'sample_interval', fallback=5)))
+    shutdown_logging()
+    level = config.get('Logging', 'level', fallback='INFO').strip().upper()
+    logger.setLevel(level if isinstance(logging.getLevelName(level), int) else logging.INFO)
+    logger.propagate = False
+    logger.addHandler(handler.start())
+    _log_handler = handler
+    return handler
+
+
+def shutdown_logging():
+    """停止写日志的后台线程，写出剩余日志"""
+    global _log_handler
+    if _log_handler is not None:
+        logger.removeHandler(_log_handler)
+        _log_handler.stop()
+        _log_handler = None
+
+
+atexit.register(shutdown_logging)
+
+
+def truncate_payload(data, max_chars=None):
+    """把请求/响应数据转为日志文本，超出 max_chars（默认 PAYLOAD_MAX_CHARS）的部分截断"""
+    max_chars = PAYLOAD_MAX_CHARS if max_chars is None else max_chars
+    text = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False, default=str)
+    if max_chars > 0 and len(text) > max_chars:
+        return f"{text[:max_chars]}…（共 {len(text)} 字符）"
+    return text
+
+
+def log_payload(label, data):
+    """记录请求/响应数据（默认关闭，[Logging] log_payloads 开启后按 payload_max_chars 截断记录）"""
+    if LOG_PAYLOADS and logger.isEnabledFor(logging.INFO):
+        logger.info(f"{label}: {truncate_payload(data)}")
+
+
+class UpstreamHTTPClient:
+    """共享的上游HTTP客户端：长连接池在线程间复用，重试策略和代理只配置一次"""
+
+    def __init__(self, proxies=None, pool_connections=10, pool_maxsize=20, pool_block=False,
+                 max_retries=3, backoff_factor=0.3, keep_alive=True):
+        self.proxies = proxies
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+
+        self.session = requests.Session()
+        retry_strategy = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[500, 502, 503, 504],
+        )
+        # pool_connections: 缓存的主机连接池数量；pool_maxsize: 每个主机的最大连接数
+        # pool_block=True 时每主机连接数达到上限后阻塞等待，而不是临时新建连接
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=retry_strategy,
+        )
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        if proxies:
+            self.session.proxies = proxies
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def _connection_pools(self):
+        """枚举适配器当前持有的所有连接池（直连与代理）"""
+        managers = [self.adapter.poolmanager] + list(self.adapter.proxy_manager.values())
+        for manager in managers:
+            for key in manager.pools.keys():
+                pool = manager.pools.get(key)
+                if pool is not None:
+                    yield pool
+
+    def stats(self):
+        """连接池命中统计：复用已有连接记为命中，新建连接记为未命中"""
+        requests_sent = 0
+        connections_created = 0
+        pool_count = 0
+        for pool in self._connection_pools():
+            pool_count += 1
+            requests_sent += pool.num_requests
+            connections_created += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "pool_hits": max(0, requests_sent - connections_created),
+            "pool_misses": connections_created,
+            "pools": pool_count,
+            "pool_connections": self.pool_connections,
+            "pool_maxsize": self.pool_maxsize,
+            "pool_block": self.pool_block,
+            "keep_alive": self.keep_alive,
+            "proxy": bool(self.proxies),
+        }
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# 后台任务的强引用：事件循环只弱引用任务，不保存引用的任务可能在完成前被回收
+_background_tasks = set()
+
+
+def run_in_background(coro, description):
+    """在当前事件循环中后台运行协程，完成前保持引用，异常写入日志"""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(functools.partial(_background_task_done, description=description))
+    return task
+
+
+def _background_task_done(task, description):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        error = task.exception()
+        logger.error(f"[后台任务] {description} 异常: {error}", exc_info=(type(error), error, error.__traceback__))
+
+
+def parse_retry_after(value, default=5):
+    """解析 Retry-After 响应头（秒数或HTTP日期），返回等待秒数，无法解析时返回 default"""
+    if not value:
+        return default
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if retry_at.tzinfo is None:
+        return default
+    return max(0, math.ceil(retry_at.timestamp() - time.time()))
+
+
+class SynthesisCache:
+    """内容寻址的合成缓存：以(角色, 参考音频, 分句, 规范化文本)的哈希为键索引已生成的WAV
+
+    referenced_files 为可选的回调，返回仍被任务引用（客户端可能还要下载）的文件路径集合，淘汰时跳过这些文件。
+    """
+
+    INDEX_FILE = "synthesis_cache.db"
+
+    def __init__(self, cache_dir, max_size_mb=1024, max_age_days=30, referenced_files=None):
+        self.cache_dir = cache_dir
+        self.referenced_files = referenced_files
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # 多个中转worker进程共享同一索引：WAL模式下读写互不阻塞，写冲突时等待而不是报错
+        self._db = sqlite3.connect(os.path.join(cache_dir, self.INDEX_FILE), timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, file_path TEXT NOT NULL, size INTEGER NOT NULL,"
+            " character TEXT, created_at REAL NOT NULL, last_access REAL NOT NULL,"
+            " hit_count INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_created_at ON entries(created_at)")
+        self._db.commit()
+
+    @staticmethod
+    def normalize_text(text):
+        """规范化文本：统一全半角并折叠空白，避免仅空白不同的文本被视为不同请求"""
+        text = unicodedata.normalize('NFKC', text or '')
+        return re.sub(r'\s+', ' ', text).strip()
+
+    @classmethod
+    def make_key(cls, character_name, ref_audio_path, ref_audio_text, split_sentence, text, ref_audio_hash=''):
+        """计算缓存键（参考音频内容哈希已知时一并计入，替换同名参考音频文件后不会命中旧结果）"""
+        parts = [
+            character_name or '',
+            ref_audio_path or '',
+            ref_audio_text or '',
+            '1' if split_sentence else '0',
+            cls.normalize_text(text),
+        ]
+        if ref_audio_hash:
+            parts.append(ref_audio_hash)
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+    def lookup(self, key):
+        """查询缓存，命中时返回WAV路径；索引指向的文件已丢失时删除该条目"""
+        with self._lock:
+            row = self._db.execute("SELECT file_path FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and os.path.exists(row[0]) and os.path.getsize(row[0]) > 0:
+                self._db.execute(
+                    "UPDATE entries SET last_access = ?, hit_count = hit_count + 1 WHERE key = ?",
+                    (time.time(), key)
+                )
+                self._db.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+            self.misses += 1
+            return None
+
+    def store(self, key, file_path, character_name=None):
+        """登记新生成的WAV，并按容量和时间淘汰旧条目"""
+        if not file_path or not os.path.exists(file_path):
+            return False
+        size = os.path.getsize(file_path)
+        if size <= 0:
+            return False
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, file_path, size, character, created_at, last_access, hit_count)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, file_path, size, character_name, now, now)
+            )
+            self._db.commit()
+            self._evict_locked(now)
+        return True
+
+    def _evict_locked(self, now):
+        """淘汰过期条目，再按最近访问时间淘汰到容量上限以内（仍被任务引用的文件保留到下次淘汰）"""
+        referenced = None
+
+        def is_referenced(path):
+            nonlocal referenced
+            if self.referenced_files is None:
+                return False
+            if referenced is None:
+                referenced = set(self.referenced_files())
+            return path in referenced
+
+        victims = []
+        if self.max_age > 0:
+            victims.extend(row for row in self._db.execute(
+                "SELECT key, file_path, size FROM entries WHERE created_at < ?", (now - self.max_age,)
+            ).fetchall() if not is_referenced(row[1]))
+        if self.max_bytes > 0:
+            expired = {key for key, _, _ in victims}
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            total -= sum(size for _, _, size in victims)
+            if total > self.max_bytes:
+                for key, path, size in self._db.execute(
+                    "SELECT key, file_path, size FROM entries ORDER BY last_access"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    if key in expired or is_referenced(path):
+                        continue
+                    victims.append((key, path, size))
+                    total -= size
+        for key, path, _ in victims:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            # 连同转码缓存的压缩格式一起删除
+            for victim_path in [path] + [AudioTranscoder.variant_path(path, fmt) for fmt in AudioTranscoder.FORMATS]:
+                try:
+                    os.remove(victim_path)
+                except OSError:
+                    pass
+        if victims:
+            self._db.commit()
+            self.evictions += len(victims)
+            logger.info(f"[合成缓存] 已淘汰 {len(victims)} 个缓存文件")
+
+    def clear(self):
+        """清空缓存索引（文件由调用方删除）"""
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "total_bytes": total,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def atomic_write_text(path, text, encoding='utf-8'):
+    """原子写入文本文件：先写入同一目录下的临时文件，再替换目标文件
+
+    临时文件名是唯一的，多个线程或worker进程同时保存同一文件时不会写入或替换彼此的临时文件。
+    """
+    tmp_file = tempfile.NamedTemporaryFile(
+        'w', encoding=encoding, dir=os.path.dirname(os.path.abspath(path)),
+        prefix=os.path.basename(path) + '.', suffix='.tmp', delete=False
+    )
+    try:
+        with tmp_file as f:
+            f.write(text)
+        os.replace(tmp_file.name, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_file.name)
+        raise
+
+
+class ThroughputModel:
+    """按角色估计合成耗时：耗时 ≈ 固定开销 + 字数 / 每秒字数
+
+    对每个角色的历史 (字数, 耗时) 做指数衰减的最小二乘拟合，较新的样本权重更高。
+    模型保存在缓存目录中，重启后继续使用。设置了 store（TaskStore，多个worker进程共享）时
+    样本直接并入数据库中的累计值，各进程的样本都会计入，并每隔 refresh_interval 秒重新读取。
+    """
+
+    MODEL_FILE = "throughput_model.json"
+    DEFAULT_CHARS_PER_SECOND = 8.0
+
+    def __init__(self, cache_dir, decay=0.95, save_every=10, store=None, refresh_interval=5.0):
+        self.path = os.path.join(cache_dir, self.MODEL_FILE)
+        self.decay = decay
+        self.save_every = save_every
+        self.store = store
+        self.refresh_interval = refresh_interval
+        # 角色 -> [样本权重和, Σ字数, Σ耗时, Σ字数², Σ字数×耗时]
+        self.sums: Dict[str, List[float]] = {}
+        self._unsaved = 0
+        self._loaded_at = 0.0
+        self.load()
+
+    def observe(self, character, length, seconds):
+        """记录一次上游合成的实际耗时"""
+        if length <= 0 or seconds <= 0:
+            return
+        values = (1.0, length, seconds, length * length, length * seconds)
+        if self.store is not None:
+            self.store.add_throughput_sample(character, values, self.decay)
+            self.load()
+            return
+        sums = self.sums.setdefault(character, [0.0] * 5)
+        for i, value in enumerate(values):
+            sums[i] = sums[i] * self.decay + value
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    def coefficients(self, character):
+        """返回 (固定开销秒数, 每字秒数)；该角色没有样本时使用所有角色的合计"""
+        if self.store is not None and time.monotonic() - self._loaded_at >= self.refresh_interval:
+            self.load()
+        sums = self.sums.get(character)
+        if sums is None:
+            if not self.sums:
+                return 0.0, 1.0 / self.DEFAULT_CHARS_PER_SECOND
+            sums = [sum(values) for values in zip(*self.sums.values())]
+        n, sx, sy, sxx, sxy = sums
+        denominator = n * sxx - sx * sx
+        if n >= 2 and denominator > 1e-9 * n * sxx:
+            slope = (n * sxy - sx * sy) / denominator
+            intercept = (sy - slope * sx) / n
+            if slope > 0 and intercept >= 0:
+                return intercept, slope
+        # 样本字数相近，无法区分开销和速率时，按平均每字耗时估计
+        return 0.0, sy / sx if sx > 0 else 1.0 / self.DEFAULT_CHARS_PER_SECOND
+
+    def estimate(self, character, length):
+        """估计合成指定字数需要的秒数"""
+        overhead, per_char = self.coefficients(character)
+        return overhead + per_char * max(1, length)
+
+    def load(self):
+        if self.store is not None:
+            self._loaded_at = time.monotonic()
+            try:
+                self.sums = self.store.load_throughput()
+            except Exception as e:
+                logger.warning(f"[吞吐模型] 读取共享存储失败: {e}")
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.sums = {character: [float(v) for v in values] for character, values in data.items()
+                         if isinstance(values, list) and len(values) == 5}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"[吞吐模型] 读取失败，重新开始统计: {e}")
+
+    def save(self):
+        """原子写入模型文件（使用共享存储时样本已写入数据库，无需保存）"""
+        self._unsaved = 0
+        if self.store is not None:
+            return
+        try:
+            atomic_write_text(self.path, json.dumps(self.sums, ensure_ascii=False))
+        except Exception as e:
+            logger.warning(f"[吞吐模型] 保存失败: {e}")
+
+    def stats(self):
+        result = {}
+        for character, sums in self.sums.items():
+            overhead, per_char = self.coefficients(character)
+            result[character] = {
+                "samples": round(sums[0], 1),
+                "chars_per_second": round(1.0 / per_char, 2) if per_char > 0 else None,
+                "overhead_seconds": round(overhead, 2),
+            }
+        return result
+
+
+class ReferenceTracker:
+    """记录每个角色的参考音频指纹 (音频路径, 文本, 文件内容哈希)
+
+    active 是客户端最近设置的参考音频（参与合成缓存键计算），未经本服务设置过的角色参考音频未知；
+    applied 记录每个上游后端实际生效的参考音频，与 active 一致时无需再次调用上游。
+    设置了 store（TaskStore）时两者都读写数据库，多个worker进程共享，重启后 active 仍然有效。
+    内容哈希按 (路径, 大小, 修改时间) 缓存，文件未变化时不重复读取；
+    参考音频不在本机（只存在于上游服务器）时哈希为空，只能按路径和文本比较。
+    """
+
+    def __init__(self, max_cached_hashes=256, store=None):
+        self.store = store
+        self.active: Dict[str, tuple] = {}
+        # (后端, 角色) -> 指纹
+        self.applied: Dict[tuple, tuple] = {}
+        self.max_cached_hashes = max_cached_hashes
+        # 路径 -> (大小, 修改时间, 哈希)
+        self._hashes: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.forwarded = 0
+        self.skipped = 0
+
+    def file_hash(self, audio_path):
+        """参考音频文件的SHA-256，文件不可读时返回空字符串"""
+        try:
+            stat_result = os.stat(audio_path)
+        except (OSError, ValueError):
+            return ''
+        with self._lock:
+            cached = self._hashes.get(audio_path)
+            if cached and cached[:2] == (stat_result.st_size, stat_result.st_mtime_ns):
+                self._hashes.move_to_end(audio_path)
+                return cached[2]
+        digest = hashlib.sha256()
+        try:
+            with open(audio_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+        except OSError:
+            return ''
+        with self._lock:
+            self._hashes[audio_path] = (stat_result.st_size, stat_result.st_mtime_ns, digest.hexdigest())
+            while len(self._hashes) > self.max_cached_hashes:
+                self._hashes.popitem(last=False)
+        return digest.hexdigest()
+
+    def fingerprint(self, audio_path, audio_text):
+        return (audio_path, audio_text, self.file_hash(audio_path))
+
+    def get(self, character):
+        """角色当前的参考音频指纹，未知时返回None"""
+        if self.store is not None:
+            return self.store.get_reference(character)
+        return self.active.get(character)
+
+    def set(self, character, fingerprint):
+        fingerprint = tuple(fingerprint)
+        if self.store is not None:
+            self.store.set_reference(character, fingerprint)
+        else:
+            self.active[character] = fingerprint
+
+    def is_applied(self, backend, character, fingerprint):
+        if self.store is not None:
+            return self.store.get_reference(character, backend) == tuple(fingerprint)
+        return self.applied.get((backend, character)) == tuple(fingerprint)
+
+    def mark_applied(self, backend, character, fingerprint):
+        if self.store is not None:
+            self.store.set_reference(character, fingerprint, backend)
+        else:
+            self.applied[(backend, character)] = tuple(fingerprint)
+
+    def invalidate(self, backend=None, character=None):
+        """上游状态可能已重置（角色重新加载/卸载、后端重启、清除参考音频缓存）时清除生效记录"""
+        if self.store is not None:
+            self.store.clear_applied_references(backend, character)
+            return
+        for key in [key for key in self.applied
+                    if (backend is None or key[0] == backend) and (character is None or key[1] == character)]:
+            del self.applied[key]
+
+    def stats(self):
+        if self.store is not None:
+            active, applied = self.store.count_references()
+        else:
+            active, applied = len(self.active), len(self.applied)
+        return {
+            "characters": active,
+            "applied": applied,
+            "forwarded": self.forwarded,
+            "skipped": self.skipped,
+        }
+
+
+class CharacterResidency:
+    """跟踪每个上游后端已加载的角色模型，按需加载并在超出数量或内存预算时卸载该后端最久未用的角色
+
+    角色的模型目录来自经过中转的 /load_character 请求，保存在缓存目录中，重启后仍可按需加载。
+    api_call 为异步函数 (后端名, endpoint, data) -> (success, result)，用于调用上游。
+    驻留状态以 (后端, 角色) 为键，预算按后端分别计算；正在合成的角色不会被卸载。
+    设置了 store（TaskStore，多个worker进程共享）时模型目录记录在数据库中，任一进程登记的目录其他进程都能使用。
+    驻留状态只在本进程内跟踪，多worker进程时各进程无法知道其他进程正在使用的角色，
+    因此 max_resident/memory_budget_mb 只能在单进程运行时启用（run_headless 会拒绝启动）。
+    """
+
+    MODELS_FILE = "character_models.json"
+
+    def __init__(self, cache_dir, api_call, max_resident=0, memory_budget_mb=0, default_model_mb=500, on_change=None,
+                 store=None):
+        self.path = os.path.join(cache_dir, self.MODELS_FILE)
+        self.store = store
+        self.api_call = api_call
+        # 角色被加载或卸载后调用 on_change(后端, 角色)，上游该角色的其他状态（如参考音频）可能已重置
+        self.on_change = on_change
+        self.max_resident = max_resident
+        self.memory_budget_mb = memory_budget_mb
+        self.default_model_mb = default_model_mb
+        # 角色 -> 模型目录
+        self.model_dirs: Dict[str, str] = {}
+        # (后端, 角色) -> 驻留信息；顺序即最近使用顺序（最久未用的在前）
+        self.resident: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        # (后端, 角色) -> 正在使用的合成任务数
+        self.in_use: Dict[tuple, int] = {}
+        self._loading: Dict[tuple, asyncio.Future] = {}
+        self.loads = 0
+        self.load_failures = 0
+        self.evictions = 0
+        self.total_load_time = 0.0
+        self.max_load_time = 0.0
+        try:
+            if store is not None:
+                self.model_dirs = store.load_model_dirs()
+            else:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.model_dirs = dict(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"[角色驻留] 读取模型目录记录失败: {e}")
+
+    def _save_model_dirs(self):
+        try:
+            atomic_write_text(self.path, json.dumps(self.model_dirs, ensure_ascii=False, indent=1))
+        except Exception as e:
+            logger.warning(f"[角色驻留] 保存模型目录记录失败: {e}")
+
+    def estimate_memory_mb(self, model_dir):
+        """按模型目录的文件大小估算占用内存；目录不在本机（模型在上游服务器上）时使用默认值"""
+        total = 0
+        if model_dir and os.path.isdir(model_dir):
+            for dirpath, _, filenames in os.walk(model_dir):
+                for filename in filenames:
+                    with contextlib.suppress(OSError):
+                        total += os.path.getsize(os.path.join(dirpath, filename))
+        return total / (1024 * 1024) if total else self.default_model_mb
+
+    def is_resident(self, backend, character):
+        return (backend, character) in self.resident
+
+    def mark_loaded(self, backend, character, model_dir, load_seconds=None):
+        """登记已加载的角色（经过中转的手动加载也调用此方法）"""
+        if self.model_dirs.get(character) != model_dir:
+            self.model_dirs[character] = model_dir
+            if self.store is not None:
+                self.store.set_model_dir(character, model_dir)
+            else:
+                self._save_model_dirs()
+        now = time.time()
+        key = (backend, character)
+        self.resident[key] = {
+            "model_dir": model_dir,
+            "memory_mb": round(self.estimate_memory_mb(model_dir), 1),
+            "loaded_at": now,
+            "last_used": now,
+            "load_seconds": round(load_seconds, 3) if load_seconds is not None else None,
+        }
+        self.resident.move_to_end(key)
+        if self.on_change:
+            self.on_change(backend, character)
+
+    def mark_unloaded(self, backend, character):
+        self.resident.pop((backend, character), None)
+        if self.on_change:
+            self.on_change(backend, character)
+
+    def reset_backend(self, backend):
+        """后端重新上线（可能已重启）时清空它的驻留记录"""
+        for key in [key for key in self.resident if key[0] == backend]:
+            self.mark_unloaded(*key)
+
+    def resident_memory_mb(self, backend=None):
+        return sum(info["memory_mb"] for key, info in self.resident.items() if backend is None or key[0] == backend)
+
+    async def acquire(self, backend, character):
+        """合成前调用：确保角色已在该后端加载（已知模型目录时按需加载）并标记为使用中
+
+        返回 (success, error)。未登记过模型目录的角色不做处理，交给上游自行判断。
+        """
+        key = (backend, character)
+        self.in_use[key] = self.in_use.get(key, 0) + 1
+        if key in self.resident:
+            self.resident[key]["last_used"] = time.time()
+            self.resident.move_to_end(key)
+            return True, None
+        model_dir = self.model_dirs.get(character)
+        if not model_dir and self.store is not None:
+            # 可能由其他worker进程登记
+            model_dir = self.store.get_model_dir(character)
+            if model_dir:
+                self.model_dirs[character] = model_dir
+        if not model_dir:
+            return True, None
+        future = self._loading.get(key)
+        if future is None:
+            future = self._loading[key] = asyncio.ensure_future(self.load(backend, character, model_dir))
+            future.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(future)
+
+    def release(self, backend, character):
+        key = (backend, character)
+        count = self.in_use.get(key, 0) - 1
+        if count > 0:
+            self.in_use[key] = count
+        else:
+            self.in_use.pop(key, None)
+
+    async def load(self, backend, character, model_dir):
+        """先按预算腾出空间再在该后端加载角色，返回 (success, error)"""
+        await self._make_room(backend, self.estimate_memory_mb(model_dir), exclude=character)
+        started = time.monotonic()
+        success, result = await self.api_call(backend, "/load_character", {
+            "character_name": character,
+            "onnx_model_dir": model_dir,
+        })
+        elapsed = time.monotonic() - started
+        if not success:
+            self.load_failures += 1
+            logger.warning(f"[角色驻留] 后端 {backend} 加载角色失败: {character}, {result}")
+            return False, f"后端 {backend} 加载角色 {character} 失败: {result}"
+        self.loads += 1
+        self.total_load_time += elapsed
+        self.max_load_time = max(self.max_load_time, elapsed)
+        self.mark_loaded(backend, character, model_dir, elapsed)
+        logger.info(f"[角色驻留] 后端 {backend} 已加载角色: {character}, 用时 {elapsed:.2f} 秒")
+        return True, None
+
+    async def _make_room(self, backend, needed_mb, exclude=None):
+        """卸载该后端最久未用且不在使用中的角色，直到加载新角色后不超出预算（重新加载已驻留的角色时不计入它自己）"""
+        def others():
+            return [key for key in self.resident if key[0] == backend and key[1] != exclude]
+
+        def over_budget():
+            keys = others()
+            if self.max_resident and len(keys) + 1 > self.max_resident:
+                return True
+            used = sum(self.resident[key]["memory_mb"] for key in keys)
+            return bool(self.memory_budget_mb) and used + needed_mb > self.memory_budget_mb
+
+        while over_budget():
+            victim = next((key for key in others() if not self.in_use.get(key)), None)
+            if victim is None:
+                logger.warning(f"[角色驻留] 后端 {backend} 已加载的角色都在使用中，暂时超出预算")
+                return
+            self.mark_unloaded(*victim)
+            success, result = await self.api_call(backend, "/unload_character", {"character_name": victim[1]})
+            self.evictions += 1
+            if success:
+                logger.info(f"[角色驻留] 后端 {backend} 已卸载最久未用的角色: {victim[1]}")
+            else:
+                logger.warning(f"[角色驻留] 后端 {backend} 卸载角色失败: {victim[1]}, {result}")
+
+    def stats(self):
+        now = time.time()
+        backends: Dict[str, Dict[str, Any]] = {}
+        for (backend, character), info in self.resident.items():
+            backends.setdefault(backend, {})[character] = {
+                "memory_mb": info["memory_mb"],
+                "load_seconds": info["load_seconds"],
+                "idle_seconds": round(now - info["last_used"], 1),
+                "in_use": self.in_use.get((backend, character), 0),
+            }
+        return {
+            "resident": backends,
+            "resident_count": len(self.resident),
+            "max_resident": self.max_resident,
+            "resident_memory_mb": {backend: round(self.resident_memory_mb(backend), 1) for backend in backends},
+            "memory_budget_mb": self.memory_budget_mb,
+            "known_characters": len(self.model_dirs),
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+            "evictions": self.evictions,
+            "avg_load_seconds": round(self.total_load_time / self.loads, 3) if self.loads else 0.0,
+            "max_load_seconds": round(self.max_load_time, 3),
+        }
+
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图（秒），可按分桶估算分位数"""
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        # 最后一个计数对应 +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def percentile(self, q):
+        """按分桶线性插值估算分位数，落在 +Inf 桶时返回最大的有限边界"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and cumulative + count >= target:
+                return lower + (bound - lower) * (target - cumulative) / count
+            cumulative += count
+            lower = bound
+        return self.buckets[-1]
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float('inf') else str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "p50": round(self.percentile(0.5), 3),
+            "p95": round(self.percentile(0.95), 3),
+            "p99": round(self.percentile(0.99), 3),
+            "buckets": buckets,
+        }
+
+
+class UpstreamBackend:
+    """上游TTS后端的状态：在途请求数、健康状态和延迟统计"""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.ejections = 0
+        self.requests = 0
+        self.failures = 0
+        # 请求延迟的指数移动平均，尚无样本时为None
+        self.ewma_latency = None
+        self.latency = LatencyHistogram()
+        self.probe_latency = None
+        self.last_error = None
+
+    @staticmethod
+    def is_local_url(url):
+        """地址是否指向本机（回环地址或本机网卡地址）：只有本机后端写入的 save_path 对中转服务一定可见"""
+        host = urllib.parse.urlsplit(url).hostname or ""
+        if host in ("localhost", "127.0.0.1", "::1"):
+            return True
+        try:
+            address = socket.getaddrinfo(host, None)[0][4][0]
+            with socket.socket(socket.AF_INET6 if ':' in address else socket.AF_INET) as probe:
+                probe.bind((address, 0))
+            return True
+        except OSError:
+            return False
+
+    @property
+    def is_local(self):
+        return self.is_local_url(self.url)
+
+    def record(self, seconds, success):
+        self.requests += 1
+        if success:
+            self.latency.observe(seconds)
+            self.ewma_latency = seconds if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * seconds
+        else:
+            self.failures += 1
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "consecutive_failures": self.consecutive_failures,
+            "ewma_latency_seconds": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "probe_latency_seconds": round(self.probe_latency, 3) if self.probe_latency is not None else None,
+            "last_error": self.last_error,
+            "latency": self.latency.snapshot(),
+        }
+
+
+class UpstreamPool:
+    """多个上游后端的负载均衡与健康检查
+
+    strategy 为 least_outstanding（在途请求最少）或 latency（在途请求数乘以平均延迟最小）。
+    选择时优先已加载该角色的后端，除非它比最空闲的后端多出 affinity_slack 个以上的在途请求。
+    后台定期探测各后端，连续失败 eject_after 次（探测或请求的连接错误/超时）即摘除，
+    摘除后连续探测成功 readmit_after 次再重新加入，并调用 on_readmit(后端名)。
+    """
+
+    def __init__(self, engine, backends, strategy="least_outstanding", health_interval=10.0,
+                 health_timeout=3.0, eject_after=3, readmit_after=2, affinity_slack=2, on_readmit=None):
+        self.engine = engine
+        self.backends: "OrderedDict[str, UpstreamBackend]" = OrderedDict(
+            (name, UpstreamBackend(name, url)) for name, url in backends
+        )
+        self.strategy = strategy
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.eject_after = eject_after
+        self.readmit_after = readmit_after
+        self.affinity_slack = affinity_slack
+        self.on_readmit = on_readmit
+        self._probe_task = None
+
+    def __len__(self):
+        return len(self.backends)
+
+    def start(self):
+        if self.health_interval > 0:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+    def healthy_backends(self):
+        """健康的后端；全部被摘除时返回所有后端，尽量继续服务"""
+        healthy = [backend for backend in self.backends.values() if backend.healthy]
+        return healthy or list(self.backends.values())
+
+    def _score(self, backend):
+        if self.strategy == "latency":
+            return (backend.outstanding + 1) * (backend.ewma_latency or 1.0)
+        return backend.outstanding
+
+    def choose(self, character=None, is_resident=None, exclude=()):
+        """为一次合成选择后端"""
+        candidates = [backend for backend in self.healthy_backends() if backend.name not in exclude]
+        if not candidates:
+            candidates = self.healthy_backends()
+        best = min(candidates, key=lambda backend: (self._score(backend), backend.ewma_latency or 0.0))
+        if character and is_resident:
+            resident = [backend for backend in candidates if is_resident(backend.name, character)]
+            if resident:
+                best_resident = min(resident, key=self._score)
+                if best_resident.outstanding - best.outstanding <= self.affinity_slack:
+                    return best_resident
+        return best
+
+    @staticmethod
+    def is_transport_error(result):
+        return result in (RelayEngine.CONNECT_ERROR, RelayEngine.TIMEOUT_ERROR)
+
+    async def call(self, backend, endpoint, data=None, timeout=30):
+        """调用指定后端，记录延迟；连接错误或超时计入连续失败次数"""
+        backend.outstanding += 1
+        started = time.monotonic()
+        try:
+            success, result = await self.engine.api_call(backend.url, endpoint, data, timeout)
+        finally:
+            backend.outstanding -= 1
+        backend.record(time.monotonic() - started, success)
+        if success:
+            backend.consecutive_failures = 0
+        elif self.is_transport_error(result):
+            self._record_failure(backend, result)
+        return success, result
+
+    async def broadcast(self, endpoint, data=None, timeout=30):
+        """在所有健康后端上执行同一调用，返回 [(后端, success, result)]"""
+        backends = self.healthy_backends()
+        results = await asyncio.gather(*(self.call(backend, endpoint, data, timeout) for backend in backends))
+        return [(backend, success, result) for backend, (success, result) in zip(backends, results)]
+
+    def _record_failure(self, backend, error):
+        backend.consecutive_failures += 1
+        backend.consecutive_successes = 0
+        backend.last_error = str(error)
+        if backend.healthy and backend.consecutive_failures >= self.eject_after:
+            backend.healthy = False
+            backend.ejections += 1
+            logger.warning(f"[上游池] 后端 {backend.name} 连续失败 {backend.consecutive_failures} 次，已摘除: {error}")
+
+    async def probe(self, backend):
+        started = time.monotonic()
+        try:
+            response = await self.engine.request("GET", f"{backend.url}/", timeout=self.health_timeout)
+            if response.status_code >= 500:
+                raise RuntimeError(f"HTTP {response.status_code}")
+        except Exception as e:
+            self._record_failure(backend, e if str(e) else type(e).__name__)
+            return False
+        backend.probe_latency = time.monotonic() - started
+        backend.consecutive_failures = 0
+        backend.consecutive_successes += 1
+        if not backend.healthy and backend.consecutive_successes >= self.readmit_after:
+            backend.healthy = True
+            backend.last_error = None
+            logger.info(f"[上游池] 后端 {backend.name} 已恢复，重新加入")
+            if self.on_readmit:
+                self.on_readmit(backend.name)
+        return True
+
+    async def _probe_loop(self):
+        while True:
+            await asyncio.gather(*(self.probe(backend) for backend in self.backends.values()))
+            await asyncio.sleep(self.health_interval)
+
+    def stats(self):
+        return {
+            "strategy": self.strategy,
+            "healthy": sum(1 for backend in self.backends.values() if backend.healthy),
+            "backends": {name: backend.stats() for name, backend in self.backends.items()},
+        }
+
+
+class RelayMetrics:
+    """中转服务的Prometheus指标
+
+    直方图（复用 LatencyHistogram）和计数器按 (指标名, 标签) 分别累计，记录开销只是一次字典查找；
+    其他组件已有的统计在导出时由 collectors 回调读取，回调返回 (类型, 指标名, 值, 标签) 列表，
+    类型为 histogram 时值为 LatencyHistogram。
+    """
+
+    PREFIX = "tts_relay"
+    BYTES_BUCKETS = (1024, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+    HELP = {
+        "upstream_tts_seconds": "上游 /tts 合成耗时（按角色）",
+        "upstream_request_seconds": "上游请求耗时（按后端）",
+        "queue_wait_seconds": "任务从提交到开始调用上游的排队时间",
+        "completion_to_download_seconds": "任务完成到首次下载的间隔",
+        "download_seconds": "音频下载响应耗时",
+        "download_bytes": "音频下载响应字节数",
+        "transcode_seconds": "获取转码音频的耗时（含已转码的情况）",
+        "http_requests_total": "HTTP请求数（按路由和状态码类别）",
+        "tts_tasks_total": "TTS任务结果数",
+        "cache_hits_total": "合成缓存命中次数",
+        "cache_misses_total": "合成缓存未命中次数",
+        "cache_hit_ratio": "合成缓存命中率",
+        "queue_depth": "等待上游的任务数",
+        "busy_workers": "正在调用上游的worker数",
+        "tasks": "任务表中的任务数（按状态）",
+        "upstream_healthy": "上游后端是否健康",
+        "upstream_outstanding": "上游后端的在途请求数",
+    }
+
+    def __init__(self, max_pending_downloads=10000):
+        self.histograms: Dict[tuple, LatencyHistogram] = {}
+        self.counters: Dict[tuple, float] = {}
+        self.collectors = []
+        self.max_pending_downloads = max_pending_downloads
+        # 已完成、尚未被下载的任务 -> 完成时间
+        self._completed: "OrderedDict[str, float]" = OrderedDict()
+
+    def observe(self, name, value, buckets=LatencyHistogram.BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram(buckets)
+        histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def mark_completed(self, task_id):
+        self._completed[task_id] = time.time()
+        while len(self._completed) > self.max_pending_downloads:
+            self._completed.popitem(last=False)
+
+    def observe_first_download(self, task_id):
+        completed_at = self._completed.pop(task_id, None)
+        if completed_at is not None:
+            self.observe("completion_to_download_seconds", time.time() - completed_at)
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        escaped = (
+            (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in labels
+        )
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+    def render(self):
+        """按Prometheus文本格式导出全部指标"""
+        # 指标名 -> (类型, [(标签, 值)])
+        families: "OrderedDict[str, tuple]" = OrderedDict()
+        for (name, labels), histogram in self.histograms.items():
+            families.setdefault(name, ("histogram", []))[1].append((labels, histogram))
+        for (name, labels), value in self.counters.items():
+            families.setdefault(name, ("counter", []))[1].append((labels, value))
+        for collect in self.collectors:
+            try:
+                for kind, name, value, labels in collect():
+                    families.setdefault(name, (kind, []))[1].append((tuple(sorted(labels.items())), value))
+            except Exception as e:
+                logger.warning(f"[指标] 读取统计失败: {e}")
+        lines = []
+        for name, (kind, samples) in families.items():
+            full_name = f"{self.PREFIX}_{name}"
+            if name in self.HELP:
+                lines.append(f"# HELP {full_name} {self.HELP[name]}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in samples:
+                if kind != "histogram":
+                    lines.append(f"{full_name}{self._labels(labels)} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value.buckets + (float('inf'),), value.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float('inf') else repr(float(bound))
+                    lines.append(f"{full_name}_bucket{self._labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{self._labels(labels)} {value.sum}")
+                lines.append(f"{full_name}_count{self._labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI中间件：统计每个路由的请求数，下载类路由另外记录响应耗时和字节数"""
+
+    DOWNLOAD_ROUTES = ("download", "stream", "batch_download")
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+        # 应用中各路由路径的第一段，其他路径统一记为 other，避免标签数量无限增长
+        self.route_names = None
+
+    def route_name(self, scope):
+        if self.route_names is None:
+            self.route_names = {
+                getattr(route, "path", "/").strip("/").split("/")[0] for route in scope["app"].routes
+            }
+        name = scope["path"].strip("/").split("/")[0]
+        return (name or "root") if name in self.route_names else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route = self.route_name(scope)
+        started = time.perf_counter()
+        sent = 0
+        status = 500
+
+        async def counting_send(message):
+            nonlocal sent, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, counting_send)
+        finally:
+            self.metrics.inc("http_requests_total", route=route, status=f"{status // 100}xx")
+            if route in self.DOWNLOAD_ROUTES and status < 400:
+                self.metrics.observe("download_seconds", time.perf_counter() - started, route=route)
+                self.metrics.observe("download_bytes", sent, buckets=RelayMetrics.BYTES_BUCKETS, route=route)
+
+
+# 当前线程/协程中正在计时的追踪span（contextvars 在线程和 asyncio 任务之间互相隔离）
+current_span = contextvars.ContextVar("tts_current_span", default=None)
+
+
+class TraceSpan:
+    """一个计时的追踪span，字段与OpenTelemetry的span一致"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, trace_id=None, parent_id=None, kind="internal", start_ns=None, attributes=None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.error = str(message)
+
+    @property
+    def traceparent(self):
+        """W3C traceparent 请求头的值"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+class NullSpan:
+    """未启用追踪时使用的空span"""
+
+    traceparent = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, message):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """请求追踪：记录各阶段的span，以OTLP JSON格式（每行一个 ExportTraceServiceRequest）追加写入本地文件
+
+    追踪上下文通过W3C traceparent 请求头在客户端、中转服务和上游之间传递。未启用时 span() 直接返回空span；
+    已结束的span进入有界缓冲区（满时丢弃最旧的），由后台线程定期批量写入，多个进程可写同一文件。
+    """
+
+    HEADER = "traceparent"
+    KINDS = {"internal": 1, "server": 2, "client": 3}
+    MAX_SPANS_PER_LINE = 512
+
+    def __init__(self, path=None, service_name="tts-client", enabled=False, flush_interval=2.0, max_buffer=10000):
+        self.path = path
+        self.service_name = service_name
+        self.enabled = bool(enabled and path)
+        self.flush_interval = flush_interval
+        self.exported = 0
+        self.dropped = 0
+        self._buffer = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._export_loop, name="trace-export", daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def parse_traceparent(header):
+        """解析 traceparent 请求头，返回 (trace_id, span_id)，格式不正确时返回None"""
+        parts = (header or "").strip().lower().split("-")
+        if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+            return None
+        try:
+            if int(parts[1], 16) == 0 or int(parts[2], 16) == 0:
+                return None
+        except ValueError:
+            return None
+        return parts[1], parts[2]
+
+    @classmethod
+    def context_of(cls, parent):
+        """把 TraceSpan、traceparent 字符串或 (trace_id, span_id) 统一为 (trace_id, span_id)"""
+        if isinstance(parent, TraceSpan):
+            return parent.trace_id, parent.span_id
+        if isinstance(parent, str):
+            return cls.parse_traceparent(parent)
+        return parent if isinstance(parent, tuple) else None
+
+    @contextlib.contextmanager
+    def span(self, name, parent=None, kind="internal", attributes=None, start_time=None, require_parent=False):
+        """在 with 块内计时一个span，并设为当前span
+
+        parent 缺省为当前span；require_parent 为True且没有父span时不记录（如健康探测等不属于任何请求的调用）。
+        start_time 为 time.time() 秒数，用于从更早的时刻（如任务提交时）开始计时。
+        """
+        if not self.enabled:
+            yield NULL_SPAN
+            return
+        context = self.context_of(parent if parent is not None else current_span.get())
+        if context is None and require_parent:
+            yield NULL_SPAN
+            return
+        span = TraceSpan(
+            name,
+            trace_id=context[0] if context else None,
+            parent_id=context[1] if context else None,
+            kind=kind,
+            start_ns=int(start_time * 1e9) if start_time is not None else None,
+            attributes=attributes,
+        )
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(str(e) or type(e).__name__)
+            raise
+        finally:
+            current_span.reset(token)
+            self.finish(span)
+
+    def record(self, name, start_time, end_time, parent=None, kind="internal", attributes=None):
+        """补记一个已经结束的阶段（开始、结束均为 time.time() 秒数）"""
+        if not self.enabled:
+            return
+        context = self.context_of(parent if parent is not None else current_span.get())
+        span = TraceSpan(
+            name,
+            trace_id=context[0] if context else None,
+            parent_id=context[1] if context else None,
+            kind=kind,
+            start_ns=int(start_time * 1e9),
+            attributes=attributes,
+        )
+        span.end_ns = int(end_time * 1e9)
+        self.finish(span)
+
+    def inject(self, headers=None):
+        """返回加上当前span的 traceparent 的请求头（没有当前span时原样返回）"""
+        headers = dict(headers or {})
+        span = current_span.get()
+        if span is not None:
+            headers[self.HEADER] = span.traceparent
+        return headers
+
+    def finish(self, span):
+        if span.end_ns is None:
+            span.end_ns = time.time_ns()
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(span)
+
+    @staticmethod
+    def _attribute(key, value):
+        if isinstance(value, bool):
+            encoded = {"boolValue": value}
+        elif isinstance(value, int):
+            # OTLP JSON 中64位整数按字符串编码
+            encoded = {"intValue": str(value)}
+        elif isinstance(value, float):
+            encoded = {"doubleValue": value}
+        else:
+            encoded = {"stringValue": str(value)}
+        return {"key": key, "value": encoded}
+
+    def _encode(self, span):
+        encoded = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": self.KINDS.get(span.kind, 1),
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [self._attribute(key, value) for key, value in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error is not None else {},
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        return encoded
+
+    def _export_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"[追踪] 写入失败: {e}")
+
+    def flush(self):
+        """把缓冲区中的span写入文件"""
+        with self._lock:
+            if not self._buffer:
+                return
+            spans = list(self._buffer)
+            self._buffer.clear()
+        resource = {"attributes": [
+            self._attribute("service.name", self.service_name),
+            self._attribute("process.pid", os.getpid()),
+            self._attribute("host.name", socket.gethostname()),
+        ]}
+        lines = []
+        for start in range(0, len(spans), self.MAX_SPANS_PER_LINE):
+            payload = {"resourceSpans": [{
+                "resource": resource,
+                "scopeSpans": [{
+                    "scope": {"name": "tts_gui_client", "version": "6.0"},
+                    "spans": [self._encode(span) for span in spans[start:start + self.MAX_SPANS_PER_LINE]],
+                }],
+            }]}
+            lines.append(json.dumps(payload, ensure_ascii=False, separators=(",", ":")) + "\n")
+        # O_APPEND 下一次 write 整体追加到文件末尾，多个worker进程写同一文件时各行不会交错
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, "".join(lines).encode("utf-8"))
+        finally:
+            os.close(fd)
+        self.exported += len(spans)
+
+    def stats(self):
+        with self._lock:
+            buffered = len(self._buffer)
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "buffered_spans": buffered,
+            "exported_spans": self.exported,
+            "dropped_spans": self.dropped,
+        }
+
+    def close(self):
+        """停止后台线程并写入剩余的span"""
+        if self._thread is None:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"[追踪] 写入失败: {e}")
+
+
+class TracingMiddleware:
+    """ASGI中间件：请求带有 traceparent 头时记录一个服务端span，处理请求期间作为当前span"""
+
+    def __init__(self, app, tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        parent = None
+        if scope["type"] == "http" and self.tracer.enabled:
+            for name, value in scope["headers"]:
+                if name == b"traceparent":
+                    parent = Tracer.parse_traceparent(value.decode("latin-1"))
+                    break
+        if parent is None:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def recording_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        route = "/" + scope["path"].strip("/").split("/")[0]
+        attributes = {"http.method": scope["method"], "http.target": scope["path"]}
+        with self.tracer.span(f"relay {scope['method']} {route}", parent=parent, kind="server",
+                              attributes=attributes) as span:
+            try:
+                await self.app(scope, receive, recording_send)
+            finally:
+                span.set_attribute("http.status_code", status)
+                if status >= 500:
+                    span.set_error(f"HTTP {status}")
+
+
+class UpstreamScheduler:
+    """上游准入调度：每个角色一个FIFO队列，角色之间轮询出队，队列总深度有上限"""
+
+    def __init__(self, max_queue_depth=256, max_queue_per_character=0):
+        self.max_queue_depth = max_queue_depth
+        self.max_queue_per_character = max_queue_per_character
+        # 角色 -> 等待中的 (入队时间, 任务)；OrderedDict 的顺序即轮询顺序
+        self.queues: "OrderedDict[str, deque]" = OrderedDict()
+        self.depth = 0
+        self.rejected = 0
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._cond = None
+
+    def offer(self, character, job, key=None):
+        """入队，超出队列上限时返回False；key 用于之后查询排队位置"""
+        queue = self.queues.get(character)
+        if self.depth >= self.max_queue_depth or (
+            self.max_queue_per_character and queue is not None and len(queue) >= self.max_queue_per_character
+        ):
+            self.rejected += 1
+            return False
+        if queue is None:
+            queue = self.queues[character] = deque()
+        queue.append((time.monotonic(), job, key))
+        self.depth += 1
+        if self._cond is not None:
+            run_in_background(self._notify(), "调度器唤醒")
+        return True
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify(1)
+
+    async def get(self):
+        """取出下一个任务：从轮询顺序最前的角色出队，然后把该角色移到末尾"""
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            while not self.queues:
+                await self._cond.wait()
+            character, queue = next(iter(self.queues.items()))
+            enqueued_at, job, _ = queue.popleft()
+            if queue:
+                self.queues.move_to_end(character)
+            else:
+                del self.queues[character]
+            self.depth -= 1
+        wait = time.monotonic() - enqueued_at
+        self.dispatched += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        return job
+
+    def position(self, character, key):
+        """按轮询顺序估算该任务前面还有多少个排队任务，不在队列中时返回None"""
+        queue = self.queues.get(character)
+        if queue is None:
+            return None
+        index = next((i for i, entry in enumerate(queue) if entry[2] == key), None)
+        if index is None:
+            return None
+        ahead = index
+        before = True
+        for other, other_queue in self.queues.items():
+            if other == character:
+                before = False
+                continue
+            # 轮询顺序在前的角色每轮都比本角色先出队一个
+            ahead += min(len(other_queue), index + 1 if before else index)
+        return ahead
+
+    def stats(self):
+        return {
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_queue_depth,
+            "queues": {character: len(queue) for character, queue in self.queues.items()},
+            "rejected": self.rejected,
+            "dispatched": self.dispatched,
+            "avg_wait_seconds": round(self.total_wait / self.dispatched, 3) if self.dispatched else 0.0,
+            "max_wait_seconds": round(self.max_wait, 3),
+        }
+
+
+class RelayEngine:
+    """异步中转引擎：固定数量的worker按调度器顺序取任务，经共享的异步HTTP客户端调用上游
+
+    worker数量即上游的全局并发上限。settings_provider 返回 (配置指纹, 参数字典)，
+    与 UpstreamHTTPClient 使用同一份连接池配置，指纹变化时重建异步客户端。
+    tracer 为 Tracer 时，属于某个追踪的上游调用记录为子span，并通过 traceparent 头传给上游。
+    """
+
+    CONNECT_ERROR = "连接错误: 请检查服务器是否运行及API地址是否正确"
+    TIMEOUT_ERROR = "请求超时: 服务器响应时间过长"
+
+    def __init__(self, settings_provider, worker_count=4, queue_size=256, queue_per_character=0, tracer=None):
+        self.settings_provider = settings_provider
+        self.tracer = tracer or Tracer()
+        self.worker_count = worker_count
+        self.scheduler = UpstreamScheduler(queue_size, queue_per_character)
+        self.workers = []
+        self.busy_workers = 0
+        self.client = None
+        self._client_key = None
+        self.requests_sent = 0
+        self.connections_created = 0
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.service_time = 0.0
+
+    async def start(self):
+        """在服务器事件循环中启动worker"""
+        self.workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+        logger.info(f"[中转服务] 异步引擎已启动: 上游并发 {self.worker_count}, 队列上限 {self.scheduler.max_queue_depth}")
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def get_client(self):
+        """获取异步HTTP客户端，连接池配置变化时重建"""
+        key, settings = self.settings_provider()
+        if self.client is not None and key == self._client_key:
+            return self.client
+        old_client = self.client
+        proxies = settings['proxies']
+        limits = httpx.Limits(
+            max_connections=settings['pool_maxsize'],
+            max_keepalive_connections=settings['pool_maxsize'] if settings['keep_alive'] else 0,
+        )
+        transport = httpx.AsyncHTTPTransport(
+            limits=limits,
+            retries=settings['max_retries'],
+            proxy=proxies['http'] if proxies else None,
+        )
+        self.client = httpx.AsyncClient(transport=transport, timeout=30)
+        self._client_key = key
+        logger.info(f"[中转服务] 异步上游连接池已{'重建' if old_client else '创建'}")
+        if old_client is not None:
+            # 旧客户端上可能仍有进行中的请求，稍后再关闭
+            asyncio.get_running_loop().call_later(60, lambda: run_in_background(old_client.aclose(), "关闭旧的异步上游连接池"))
+        return self.client
+
+    async def _trace(self, event_name, info):
+        # 新建TCP连接记为连接池未命中
+        if event_name == "connection.connect_tcp.complete":
+            self.connections_created += 1
+
+    async def request(self, method, url, **kwargs):
+        client = self.get_client()
+        self.requests_sent += 1
+        return await client.request(method, url, extensions={"trace": self._trace}, **kwargs)
+
+    async def api_call(self, base_url, endpoint, data=None, timeout=30):
+        """异步版本的上游调用，返回 (success, result)，语义与 TTSClientGUI.api_call 一致"""
+        url = f"{base_url}{endpoint}"
+        with self.tracer.span(f"upstream POST {endpoint}", kind="client", require_parent=True,
+                              attributes={"http.url": url}) as span:
+            success, result = await self._api_call(url, data, timeout)
+            if not success:
+                span.set_error(result)
+            return success, result
+
+    async def _api_call(self, url, data, timeout):
+        headers = self.tracer.inject()
+        try:
+            logger.debug(f"[中转服务] 上游调用: {url}")
+            if data:
+                response = await self.request("POST", url, json=data, timeout=timeout, headers=headers)
+            else:
+                response = await self.request("POST", url, timeout=timeout, headers=headers)
+
+            if response.status_code == 200:
+                if not response.content:
+                    return True, "成功"
+                try:
+                    return True, response.json()
+                except ValueError:
+                    return True, response.text
+
+            error_msg = f"HTTP错误: {response.status_code}"
+            try:
+                error_msg += f" - {response.json()}"
+            except ValueError:
+                error_msg += f" - {response.text}"
+            logger.warning(f"[中转服务] 上游响应失败: {error_msg}")
+            return False, error_msg
+        except httpx.ConnectError:
+            logger.warning(f"[中转服务] 连接错误: 无法连接到服务器 {url}")
+            return False, self.CONNECT_ERROR
+        except httpx.TimeoutException:
+            logger.warning(f"[中转服务] 请求超时: {url}")
+            return False, self.TIMEOUT_ERROR
+        except Exception as e:
+            logger.error(f"[中转服务] 上游调用异常: {e}")
+            return False, str(e)
+
+    def submit(self, job, character='', key=None):
+        """提交任务（无参协程函数）到该角色的队列，队列已满时返回False"""
+        return self.scheduler.offer(character, job, key)
+
+    def average_service_time(self):
+        finished = self.jobs_done + self.jobs_failed
+        return self.service_time / finished if finished else 5.0
+
+    def retry_after(self):
+        """按当前排队深度和平均处理时长估算客户端应等待的秒数"""
+        avg_service = self.average_service_time()
+        return max(1, int(math.ceil(self.scheduler.depth * avg_service / max(1, self.worker_count))))
+
+    async def _worker(self, index):
+        while True:
+            job = await self.scheduler.get()
+            self.busy_workers += 1
+            started = time.monotonic()
+            try:
+                await job()
+                self.jobs_done += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.jobs_failed += 1
+                logger.error(f"[中转服务] worker {index} 任务异常: {e}")
+            finally:
+                self.service_time += time.monotonic() - started
+                self.busy_workers -= 1
+
+    def stats(self):
+        stats = self.scheduler.stats()
+        stats.update({
+            "max_concurrency": self.worker_count,
+            "in_flight": self.busy_workers,
+            "jobs_done": self.jobs_done,
+            "jobs_failed": self.jobs_failed,
+            "requests": self.requests_sent,
+            "pool_hits": max(0, self.requests_sent - self.connections_created),
+            "pool_misses": self.connections_created,
+        })
+        return stats
+
+
+class TaskRecord:
+    """中转任务记录"""
+
+    __slots__ = ('task_id', 'file_path', 'status', 'progress', 'created_at', 'created_ts',
+                 'started_at', 'character', 'text', 'text_length', 'error', 'cached')
+
+    def __init__(self, task_id, file_path, character, text, status="processing", cached=False):
+        self.task_id = task_id
+        self.file_path = file_path
+        self.status = status
+        self.progress = 100 if status == "completed" else 0
+        self.created_ts = time.time()
+        self.created_at = datetime.fromtimestamp(self.created_ts).isoformat()
+        # 上游开始处理的时间，排队期间为None
+        self.started_at = None
+        self.character = character
+        # 只保留文本摘要和长度，完整文本不常驻内存
+        self.text = text[:50] + "..." if len(text) > 50 else text
+        self.text_length = len(text)
+        self.error = None
+        self.cached = cached
+
+    def to_row(self):
+        return (self.task_id, self.file_path, self.status, self.progress, self.created_ts,
+                self.started_at, self.character, self.text, self.error, 1 if self.cached else 0)
+
+    @classmethod
+    def from_row(cls, row):
+        task_id, file_path, status, progress, created_ts, started_at, character, text, error, cached = row
+        record = cls(task_id, file_path, character, text or '', status=status, cached=bool(cached))
+        record.progress = progress
+        record.created_ts = created_ts
+        record.created_at = datetime.fromtimestamp(created_ts).isoformat()
+        record.started_at = started_at
+        record.error = error
+        return record
+
+    def to_dict(self):
+        info = {
+            "file_path": self.file_path,
+            "status": self.status,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "character": self.character,
+            "text": self.text,
+        }
+        if self.error is not None:
+            info["error"] = self.error
+        if self.cached:
+            info["cached"] = True
+        return info
+
+
+class ClientTaskRecord:
+    """客户端任务注册记录"""
+
+    __slots__ = ('task_id', 'client_id', 'callback_url', 'last_check', 'status', 'created_ts')
+
+    def __init__(self, task_id, client_id, callback_url=None):
+        self.task_id = task_id
+        self.client_id = client_id
+        self.callback_url = callback_url
+        self.created_ts = time.time()
+        self.last_check = datetime.fromtimestamp(self.created_ts).isoformat()
+        self.status = "registered"
+
+    def to_dict(self):
+        return {
+            "task_id": self.task_id,
+            "callback_url": self.callback_url,
+            "last_check": self.last_check,
+            "status": self.status,
+        }
+
+
+class BatchRecord:
+    """批量任务记录：条目按提交顺序排列，task_ids 中尚未送入上游队列的条目为None"""
+
+    __slots__ = ('batch_id', 'items', 'task_ids', 'errors', 'status', 'created_ts', 'created_at')
+
+    def __init__(self, batch_id, items):
+        self.batch_id = batch_id
+        # (角色, 文本, 是否分句)
+        self.items = items
+        self.task_ids: List[Optional[str]] = [None] * len(items)
+        self.errors: Dict[int, str] = {}
+        # 批次本身的状态不随条目变化，始终可按TTL/容量淘汰
+        self.status = "registered"
+        self.created_ts = time.time()
+        self.created_at = datetime.fromtimestamp(self.created_ts).isoformat()
+
+    def to_row(self):
+        return (self.batch_id, self.status, self.created_ts, json.dumps(self.items, ensure_ascii=False),
+                json.dumps(self.task_ids), json.dumps(self.errors, ensure_ascii=False))
+
+    @classmethod
+    def from_row(cls, row):
+        batch_id, status, created_ts, items, task_ids, errors = row
+        record = cls(batch_id, [tuple(item) for item in json.loads(items)])
+        record.status = status
+        record.created_ts = created_ts
+        record.created_at = datetime.fromtimestamp(created_ts).isoformat()
+        record.task_ids = json.loads(task_ids)
+        record.errors = {int(index): error for index, error in json.loads(errors).items()}
+        return record
+
+
+class TaskRegistry:
+    """有界记录表：按TTL和最大条目数淘汰最旧的记录，并增量维护各状态的计数
+
+    记录需有 status 和 created_ts 属性。处理中的记录不会被淘汰。
+    状态变更必须通过 set_status 进行，以保持计数和状态索引一致。
+    shared 为True时（多个中转worker进程共享存储），本进程没有的记录从存储中读取，
+    这类记录由其他进程维护，不缓存在本地。
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=86400, store=None, table="tasks", shared=False):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # 可选的持久化存储，记录的增删和状态变更会同步写入 store 的 table 表
+        self.store = store
+        self.table = table
+        self.shared = shared
+        self._records: "OrderedDict[str, Any]" = OrderedDict()
+        # 状态 -> {key: record}，按插入顺序，列出某一状态时无需扫描全表
+        self._by_status: Dict[str, "OrderedDict[str, Any]"] = {}
+        self.evicted = 0
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, key):
+        record = self._records.get(key)
+        if record is None and self.shared and self.store is not None:
+            record = self.store.fetch(key, self.table)
+        return record
+
+    def is_local(self, key):
+        """记录是否由本进程维护"""
+        return key in self._records
+
+    def add(self, key, record):
+        if key in self._records:
+            self.remove(key)
+        self._records[key] = record
+        self._by_status.setdefault(record.status, OrderedDict())[key] = record
+        if self.store is not None:
+            self.store.put(record, self.table)
+        self._evict()
+
+    def remove(self, key):
+        record = self._records.pop(key, None)
+        if record is not None:
+            self._by_status.get(record.status, {}).pop(key, None)
+            if self.store is not None:
+                self.store.delete(key, self.table)
+        return record
+
+    def set_status(self, key, status, **fields):
+        """更新记录状态及其他字段"""
+        record = self._records.get(key)
+        if record is None:
+            return None
+        for name, value in fields.items():
+            setattr(record, name, value)
+        if record.status != status:
+            self._by_status.get(record.status, {}).pop(key, None)
+            record.status = status
+            self._by_status.setdefault(status, OrderedDict())[key] = record
+        if self.store is not None:
+            self.store.put(record, self.table)
+        return record
+
+    def save(self, key):
+        """记录的其他字段被原地修改后写回存储"""
+        record = self._records.get(key)
+        if record is not None and self.store is not None:
+            self.store.put(record, self.table)
+
+    def restore(self, records):
+        """载入持久化存储中的记录（按创建时间升序），不回写存储"""
+        store, self.store = self.store, None
+        try:
+            for record in records:
+                self.add(record.task_id, record)
+        finally:
+            self.store = store
+
+    def items(self, status=None):
+        """按创建顺序列出记录，指定status时只列出该状态的记录"""
+        if status is None:
+            return list(self._records.items())
+        return list(self._by_status.get(status, {}).items())
+
+    def count(self, status):
+        return len(self._by_status.get(status, ()))
+
+    def counts(self):
+        return {status: len(records) for status, records in self._by_status.items()}
+
+    def _evict(self):
+        now = time.time()
+        expire_before = now - self.ttl_seconds if self.ttl_seconds > 0 else None
+        overflow = len(self._records) - self.max_size if self.max_size > 0 else 0
+        if overflow <= 0 and (expire_before is None or not self._records or
+                              next(iter(self._records.values())).created_ts >= expire_before):
+            return
+        victims = []
+        for key, record in self._records.items():
+            expired = expire_before is not None and record.created_ts < expire_before
+            if len(victims) >= overflow and not expired:
+                break
+            if record.status != "processing":
+                victims.append(key)
+        for key in victims:
+            self.remove(key)
+        self.evicted += len(victims)
+
+
+class TaskStore:
+    """中转任务的持久化存储（SQLite WAL）
+
+    状态变更先进入内存中的待写表，由后台线程按固定间隔或攒够一批后在一个事务中写入，
+    同一任务在一批之内的多次变更只写最后一次；flush_interval 为0时有变更即写入。
+    中转服务重启后从这里恢复任务表。多个worker进程共享同一数据库时，
+    另有批量任务表和进行中任务表（合并相同请求）供各进程查询。
+    各角色当前的参考音频和各后端已生效的参考音频、吞吐模型的累计值以及角色模型目录也保存在这里（直接写入），
+    所有进程看到同一份。
+    查询使用单独的读连接：WAL模式下读不会被写事务阻塞，无需等待后台线程写完一批。
+    """
+
+    DB_FILE = "relay_tasks.db"
+    COLUMNS = ("task_id", "file_path", "status", "progress", "created_ts",
+               "started_at", "character", "text", "error", "cached")
+    BATCH_COLUMNS = ("batch_id", "status", "created_ts", "items", "task_ids", "errors")
+    # 表名 -> (记录类, 列名)，第一列为主键
+    TABLES = {"tasks": (TaskRecord, COLUMNS), "batches": (BatchRecord, BATCH_COLUMNS)}
+
+    def __init__(self, cache_dir, flush_interval=0.5, batch_size=256):
+        self.path = os.path.join(cache_dir, self.DB_FILE)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.flushes = 0
+        self.rows_written = 0
+        # (表名, 主键) -> 行数据，None表示删除
+        self._pending: Dict[tuple, Optional[tuple]] = {}
+        self._pending_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " task_id TEXT PRIMARY KEY, file_path TEXT, status TEXT NOT NULL,"
+            " progress INTEGER NOT NULL DEFAULT 0, created_ts REAL NOT NULL, started_at REAL,"
+            " character TEXT, text TEXT, error TEXT, cached INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_created_ts ON tasks(created_ts)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " batch_id TEXT PRIMARY KEY, status TEXT NOT NULL, created_ts REAL NOT NULL,"
+            " items TEXT NOT NULL, task_ids TEXT NOT NULL, errors TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS inflight ("
+            " cache_key TEXT PRIMARY KEY, task_id TEXT NOT NULL, created_ts REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS reference_audio ("
+            " character TEXT PRIMARY KEY, audio_path TEXT NOT NULL, audio_text TEXT NOT NULL,"
+            " audio_hash TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS applied_reference ("
+            " backend TEXT NOT NULL, character TEXT NOT NULL, audio_path TEXT NOT NULL,"
+            " audio_text TEXT NOT NULL, audio_hash TEXT NOT NULL, PRIMARY KEY (backend, character))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS throughput ("
+            " character TEXT PRIMARY KEY, n REAL NOT NULL, sx REAL NOT NULL, sy REAL NOT NULL,"
+            " sxx REAL NOT NULL, sxy REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS character_models (character TEXT PRIMARY KEY, model_dir TEXT NOT NULL)"
+        )
+        self._db.commit()
+        self._reader = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._flush_loop, name="task-store-flush", daemon=True)
+        self._thread.start()
+
+    def put(self, record, table="tasks"):
+        row = record.to_row()
+        self._queue(table, row[0], row)
+
+    def delete(self, key, table="tasks"):
+        self._queue(table, key, None)
+
+    def _queue(self, table, key, row):
+        with self._pending_lock:
+            self._pending[(table, key)] = row
+            full = len(self._pending) >= self.batch_size
+        if full or self.flush_interval <= 0:
+            self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval if self.flush_interval > 0 else None)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"[任务存储] 写入失败: {e}")
+
+    def flush(self):
+        """把待写的变更在一个事务中写入数据库
+
+        后台线程之外也可调用（多worker共享状态时需要变更立即对其他进程可见）；
+        取出待写表和写入都在数据库锁内进行，较早取出的一批不会覆盖较新的变更。
+        """
+        with self._db_lock:
+            with self._pending_lock:
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, {}
+            with self._db:
+                for table, (_, columns) in self.TABLES.items():
+                    upserts = [row for (name, _), row in pending.items() if name == table and row is not None]
+                    deletes = [(key,) for (name, key), row in pending.items() if name == table and row is None]
+                    if upserts:
+                        self._db.executemany(
+                            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)})"
+                            f" VALUES ({', '.join('?' * len(columns))})",
+                            upserts
+                        )
+                    if deletes:
+                        self._db.executemany(f"DELETE FROM {table} WHERE {columns[0]} = ?", deletes)
+        self.flushes += 1
+        self.rows_written += len(pending)
+
+    def fetch(self, key, table="tasks"):
+        """直接从数据库读取一条记录（其他worker进程写入的记录），不存在时返回None"""
+        record_cls, columns = self.TABLES[table]
+        with self._read_lock:
+            row = self._reader.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE {columns[0]} = ?", (key,)
+            ).fetchone()
+        return record_cls.from_row(row) if row else None
+
+    def load(self, max_age_seconds=0, limit=0, recover=True):
+        """读取未过期的任务（按创建时间升序），同时删除过期的行
+
+        recover 为True时（进程启动、没有其他worker在运行），上次退出时仍在处理中的任务已无法完成，
+        标记为失败，并清空进行中任务表；已完成但文件已丢失的任务直接丢弃。
+        """
+        now = time.time()
+        with self._db_lock:
+            with self._db:
+                if max_age_seconds > 0:
+                    self._db.execute("DELETE FROM tasks WHERE created_ts < ?", (now - max_age_seconds,))
+                    self._db.execute("DELETE FROM batches WHERE created_ts < ?", (now - max_age_seconds,))
+                if recover:
+                    self._db.execute(
+                        "UPDATE tasks SET status = 'failed', progress = 0, error = ? WHERE status = 'processing'",
+                        ("中转服务重启，任务已中断",)
+                    )
+                    self._db.execute("DELETE FROM inflight")
+                    # 上游在中转服务停止期间可能已重启，参考音频需在下次合成前重新设置
+                    self._db.execute("DELETE FROM applied_reference")
+            query = f"SELECT {', '.join(self.COLUMNS)} FROM tasks"
+            if not recover:
+                # 其他worker的处理中任务由它们自己维护，这里只按需从存储读取
+                query += " WHERE status != 'processing'"
+            query += " ORDER BY created_ts DESC"
+            if limit > 0:
+                query += f" LIMIT {int(limit)}"
+            rows = self._db.execute(query).fetchall()
+        records = []
+        missing = []
+        for row in reversed(rows):
+            record = TaskRecord.from_row(row)
+            if record.status == "completed" and not os.path.exists(record.file_path or ''):
+                missing.append((record.task_id,))
+                continue
+            records.append(record)
+        if missing:
+            with self._db_lock:
+                with self._db:
+                    self._db.executemany("DELETE FROM tasks WHERE task_id = ?", missing)
+        return records
+
+    def claim_inflight(self, cache_key, record):
+        """登记进行中的合成，返回 None 表示登记成功；相同请求已在其他进程合成时返回其任务ID
+
+        登记成功时任务记录 record 在同一事务中写入，其他进程合并到这个任务ID后总能查到任务。
+        已有登记对应的任务已结束或已不存在（进程异常退出的残留）时，改为登记新任务。
+        """
+        with self._db_lock:
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                row = self._db.execute(
+                    "SELECT i.task_id FROM inflight i JOIN tasks t ON t.task_id = i.task_id"
+                    " WHERE i.cache_key = ? AND t.status = 'processing'", (cache_key,)
+                ).fetchone()
+                if row is not None:
+                    return row[0]
+                self._db.execute(
+                    "INSERT OR REPLACE INTO inflight (cache_key, task_id, created_ts) VALUES (?, ?, ?)",
+                    (cache_key, record.task_id, record.created_ts)
+                )
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO tasks ({', '.join(self.COLUMNS)})"
+                    f" VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                    record.to_row()
+                )
+        return None
+
+    def release_inflight(self, cache_key, task_id):
+        with self._db_lock:
+            with self._db:
+                self._db.execute("DELETE FROM inflight WHERE cache_key = ? AND task_id = ?", (cache_key, task_id))
+
+    def get_reference(self, character, backend=None):
+        """角色当前的参考音频指纹 (路径, 文本, 哈希)；给出 backend 时返回该后端已生效的指纹，未知时返回None"""
+        with self._read_lock:
+            if backend is None:
+                row = self._reader.execute(
+                    "SELECT audio_path, audio_text, audio_hash FROM reference_audio WHERE character = ?",
+                    (character,)
+                ).fetchone()
+            else:
+                row = self._reader.execute(
+                    "SELECT audio_path, audio_text, audio_hash FROM applied_reference"
+                    " WHERE backend = ? AND character = ?", (backend, character)
+                ).fetchone()
+        return tuple(row) if row else None
+
+    def set_reference(self, character, fingerprint, backend=None):
+        with self._db_lock:
+            with self._db:
+                if backend is None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO reference_audio (character, audio_path, audio_text, audio_hash)"
+                        " VALUES (?, ?, ?, ?)", (character,) + tuple(fingerprint)
+                    )
+                else:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO applied_reference"
+                        " (backend, character, audio_path, audio_text, audio_hash) VALUES (?, ?, ?, ?, ?)",
+                        (backend, character) + tuple(fingerprint)
+                    )
+
+    def clear_applied_references(self, backend=None, character=None):
+        conditions = []
+        params = []
+        if backend is not None:
+            conditions.append("backend = ?")
+            params.append(backend)
+        if character is not None:
+            conditions.append("character = ?")
+            params.append(character)
+        query = "DELETE FROM applied_reference"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._db_lock:
+            with self._db:
+                self._db.execute(query, params)
+
+    def referenced_files(self):
+        """未失败的任务指向的音频文件路径"""
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT DISTINCT file_path FROM tasks WHERE status != 'failed' AND file_path IS NOT NULL"
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def add_throughput_sample(self, character, values, decay):
+        """把一个样本 (1, 字数, 耗时, 字数², 字数×耗时) 并入角色的衰减累计值，在一条语句中原子更新"""
+        with self._db_lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO throughput (character, n, sx, sy, sxx, sxy) VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(character) DO UPDATE SET n = n * ? + excluded.n, sx = sx * ? + excluded.sx,"
+                    " sy = sy * ? + excluded.sy, sxx = sxx * ? + excluded.sxx, sxy = sxy * ? + excluded.sxy",
+                    (character,) + tuple(values) + (decay,) * 5
+                )
+
+    def load_throughput(self):
+        with self._read_lock:
+            rows = self._reader.execute("SELECT character, n, sx, sy, sxx, sxy FROM throughput").fetchall()
+        return {row[0]: list(row[1:]) for row in rows}
+
+    def set_model_dir(self, character, model_dir):
+        with self._db_lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO character_models (character, model_dir) VALUES (?, ?)",
+                    (character, model_dir)
+                )
+
+    def get_model_dir(self, character):
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT model_dir FROM character_models WHERE character = ?", (character,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load_model_dirs(self):
+        with self._read_lock:
+            return dict(self._reader.execute("SELECT character, model_dir FROM character_models").fetchall())
+
+    def count_references(self):
+        with self._read_lock:
+            active = self._reader.execute("SELECT COUNT(*) FROM reference_audio").fetchone()[0]
+            applied = self._reader.execute("SELECT COUNT(*) FROM applied_reference").fetchone()[0]
+        return active, applied
+
+    def stats(self):
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "pending_writes": pending,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+    def close(self):
+        """停止后台线程并写入剩余变更"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        try:
+            self.flush()
+        finally:
+            with self._db_lock:
+                self._db.close()
+            with self._read_lock:
+                self._reader.close()
+
+
+class AudioTranscoder:
+    """用ffmpeg把WAV转码为压缩格式，转码在线程池中执行，结果缓存在WAV文件旁边
+
+    未找到ffmpeg时 available 为False，调用方应回退为直接发送WAV。
+    """
+
+    # 格式 -> (扩展名, Content-Type, ffmpeg输出格式, 编码参数)
+    FORMATS = {
+        "opus": (".opus", "audio/ogg", "opus", ["-c:a", "libopus", "-b:a", "32k"]),
+        "flac": (".flac", "audio/flac", "flac", ["-c:a", "flac"]),
+        "mp3": (".mp3", "audio/mpeg", "mp3", ["-c:a", "libmp3lame", "-q:a", "4"]),
+    }
+    ACCEPT_TYPES = {
+        "audio/ogg": "opus", "audio/opus": "opus",
+        "audio/flac": "flac", "audio/x-flac": "flac",
+        "audio/mpeg": "mp3", "audio/mp3": "mp3",
+        "audio/wav": "wav", "audio/x-wav": "wav", "audio/wave": "wav",
+    }
+
+    def __init__(self, ffmpeg_path=None, max_workers=2):
+        self.ffmpeg = ffmpeg_path or shutil.which("ffmpeg")
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcode")
+        # 目标文件 -> 进行中的转码，避免同一文件被并发重复转码
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.transcoded = 0
+        self.variant_hits = 0
+        self.failures = 0
+
+    @property
+    def available(self):
+        return bool(self.ffmpeg)
+
+    @classmethod
+    def negotiate(cls, requested=None, accept=None):
+        """确定返回格式：查询参数优先，其次按Accept的q值选择，都没有时为wav
+
+        查询参数指定了不支持的格式时抛出ValueError。
+        """
+        if requested:
+            requested = requested.lower()
+            if requested != "wav" and requested not in cls.FORMATS:
+                raise ValueError(f"不支持的音频格式: {requested}")
+            return requested
+        best, best_q = "wav", 0.0
+        for part in (accept or "").split(","):
+            media_type, _, params = part.strip().partition(";")
+            fmt = cls.ACCEPT_TYPES.get(media_type.strip().lower())
+            if fmt is None:
+                continue
+            q = 1.0
+            for param in params.split(";"):
+                name, _, value = param.strip().partition("=")
+                if name == "q":
+                    try:
+                        q = float(value)
+                    except ValueError:
+                        q = 0.0
+            if q > best_q:
+                best, best_q = fmt, q
+        return best
+
+    @classmethod
+    def variant_path(cls, wav_path, fmt):
+        return os.path.splitext(wav_path)[0] + cls.FORMATS[fmt][0]
+
+    @classmethod
+    def media_type(cls, fmt):
+        return cls.FORMATS[fmt][1] if fmt in cls.FORMATS else "audio/wav"
+
+    async def get_variant(self, wav_path, fmt):
+        """返回WAV的压缩版本路径，不存在或已过期时在线程池中转码"""
+        dest = self.variant_path(wav_path, fmt)
+        try:
+            if os.path.getmtime(dest) >= os.path.getmtime(wav_path):
+                self.variant_hits += 1
+                return dest
+        except OSError:
+            pass
+        with self._lock:
+            future = self._inflight.get(dest)
+            if future is None:
+                future = self._inflight[dest] = self.executor.submit(self._encode, wav_path, dest, fmt)
+                future.add_done_callback(lambda _: self._forget(dest))
+        return await asyncio.wrap_future(future)
+
+    def _forget(self, dest):
+        with self._lock:
+            self._inflight.pop(dest, None)
+
+    def _encode(self, wav_path, dest, fmt):
+        _, _, muxer, codec_args = self.FORMATS[fmt]
+        tmp_path = dest + '.tmp'
+        started = time.monotonic()
+        try:
+            subprocess.run(
+                [self.ffmpeg, "-y", "-loglevel", "error", "-i", wav_path, *codec_args, "-f", muxer, tmp_path],
+                check=True, capture_output=True, timeout=120
+            )
+            os.replace(tmp_path, dest)
+        except Exception as e:
+            self.failures += 1
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            detail = e.stderr.decode(errors='replace').strip() if isinstance(e, subprocess.CalledProcessError) else e
+            raise RuntimeError(f"转码为{fmt}失败: {detail}")
+        self.transcoded += 1
+        logger.debug(f"[转码] {os.path.basename(dest)} 用时 {time.monotonic() - started:.2f} 秒")
+        return dest
+
+    def stats(self):
+        return {
+            "available": self.available,
+            "transcoded": self.transcoded,
+            "variant_hits": self.variant_hits,
+            "failures": self.failures,
+            "in_progress": len(self._inflight),
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class FfmpegDecodeStream:
+    """边接收边解码：把压缩音频数据块送入ffmpeg，解码出的WAV数据块交给回调
+
+    用于下载压缩格式时的流式播放，回调在内部读取线程中调用。
+    """
+
+    def __init__(self, ffmpeg, on_chunk):
+        self.on_chunk = on_chunk
+        self.error = None
+        self.process = subprocess.Popen(
+            [ffmpeg, "-loglevel", "error", "-i", "pipe:0", "-f", "wav", "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def feed(self, chunk):
+        if self.error is not None:
+            return
+        try:
+            self.process.stdin.write(chunk)
+            self.process.stdin.flush()
+        except OSError as e:
+            self.error = str(e)
+
+    def _read(self):
+        while True:
+            data = self.process.stdout.read1(64 * 1024)
+            if not data:
+                break
+            self.on_chunk(data)
+
+    def finish(self):
+        """输入结束，等待剩余数据解码完毕"""
+        with contextlib.suppress(OSError):
+            self.process.stdin.close()
+        self._reader.join()
+        self.process.wait()
+
+
+def parse_wav_header(data):
+    """解析WAV头部
+
+    返回 (channels, sampwidth, framerate, audio_format, data_offset, data_size)，
+    数据还不足以解析出 data 块时返回None，不是WAV数据时抛出ValueError。
+    """
+    if len(data) < 12:
+        return None
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise ValueError("不是WAV数据")
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        size = struct.unpack('<I', data[pos + 4:pos + 8])[0]
+        body = pos + 8
+        if chunk_id == b'fmt ':
+            if body + 16 > len(data):
+                return None
+            audio_format, channels, framerate, _, _, bits = struct.unpack('<HHIIHH', data[body:body + 16])
+            if audio_format == 0xFFFE:
+                # WAVE_FORMAT_EXTENSIBLE：真实格式在子格式GUID的前两个字节
+                if body + 26 > len(data):
+                    return None
+                audio_format = struct.unpack('<H', data[body + 24:body + 26])[0]
+            fmt = (channels, bits // 8, framerate, audio_format)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV数据缺少fmt块")
+            return fmt + (body, size)
+        pos = body + size + (size & 1)
+    return None
+
+
+class StreamingWavPlayer:
+    """边下载边播放WAV：解析出头部后把PCM数据放入抖动缓冲区，由播放线程写入PyAudio
+
+    缓冲区积累到 prebuffer_ms 的音频后才开始播放，欠载时暂停并重新积累，避免网络抖动造成断续。
+    """
+
+    def __init__(self, pa, prebuffer_ms=300, on_start=None, should_continue=None):
+        self.pa = pa
+        self.prebuffer_ms = prebuffer_ms
+        self.on_start = on_start
+        self.should_continue = should_continue or (lambda: True)
+        self.started = False
+        self.underruns = 0
+        self.error = None
+        self._header = bytearray()
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._eof = False
+        self._remaining = None
+        self._thread = None
+
+    def feed(self, chunk):
+        """接收下载的数据块（下载线程中调用）"""
+        if self._thread is None:
+            self._header.extend(chunk)
+            try:
+                info = parse_wav_header(bytes(self._header))
+            except ValueError as e:
+                # 不是可流式播放的WAV，交给下载完成后的整文件播放处理
+                logger.warning(f"[流式播放] 无法解析音频头: {e}")
+                self._thread = False
+                return
+            if info is None:
+                return
+            channels, sampwidth, framerate, audio_format, data_offset, data_size = info
+            # 流式生成的WAV可能把data长度写成0或0xFFFFFFFF，此时播放到数据结束为止
+            if data_size not in (0, 0xFFFFFFFF):
+                self._remaining = data_size
+            chunk = bytes(self._header[data_offset:])
+            self._header = None
+            self.started = True
+            self._thread = threading.Thread(
+                target=self._play, args=(channels, sampwidth, framerate, audio_format), daemon=True
+            )
+            self._thread.start()
+        elif self._thread is False:
+            return
+        with self._cond:
+            if self._remaining is not None:
+                chunk = chunk[:self._remaining]
+                self._remaining -= len(chunk)
+            self._buffer.extend(chunk)
+            self._cond.notify()
+
+    def finish(self):
+        """数据已全部送达"""
+        with self._cond:
+            self._eof = True
+            self._cond.notify()
+
+    def wait(self):
+        if self._thread:
+            self._thread.join()
+
+    def _play(self, channels, sampwidth, framerate, audio_format):
+        frame_size = channels * sampwidth
+        prebuffer = max(frame_size, int(framerate * frame_size * self.prebuffer_ms / 1000))
+        prebuffer -= prebuffer % frame_size
+        block = 1024 * frame_size
+        stream = None
+        try:
+            if self.on_start:
+                self.on_start()
+            if audio_format == 3 and sampwidth == 4:
+                sample_format = pyaudio.paFloat32
+            else:
+                sample_format = self.pa.get_format_from_width(sampwidth)
+            stream = self.pa.open(format=sample_format, channels=channels, rate=framerate, output=True)
+            buffering = True
+            while self.should_continue():
+                with self._cond:
+                    if buffering:
+                        # 积累到预缓冲量（或数据结束）再开始播放
+                        while len(self._buffer) < prebuffer and not self._eof and self.should_continue():
+                            self._cond.wait(0.1)
+                        buffering = False
+                    if not self._buffer:
+                        if self._eof:
+                            break
+                        self.underruns += 1
+                        buffering = True
+                        continue
+                    size = min(len(self._buffer), block)
+                    size -= size % frame_size
+                    if size == 0:
+                        if self._eof:
+                            break
+                        buffering = True
+                        continue
+                    data = bytes(self._buffer[:size])
+                    del self._buffer[:size]
+                stream.write(data)
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"[流式播放] 播放异常: {e}")
+        finally:
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
+
+
+class DebouncedFileWriter:
+    """把内存中的状态合并写入文件：变更后等 delay 秒内没有新变更再写（最迟 max_delay 秒），
+    由后台线程先写临时文件再原子替换，调用方不做磁盘IO
+
+    serialize 在 lock 内调用并返回要写入的文本；修改被序列化的状态时也应持有 lock。
+    """
+
+    def __init__(self, path, serialize, delay=1.0, max_delay=5.0, lock=None, encoding=None):
+        self.path = path
+        self.serialize = serialize
+        self.delay = delay
+        self.max_delay = max_delay
+        self.lock = lock or threading.RLock()
+        self.encoding = encoding
+        self.changes = 0
+        self.writes = 0
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        # 第一次未写入变更和最近一次变更的时间，没有未写入变更时为None
+        self._dirty_since = None
+        self._last_change = None
+        self._closed = False
+        self._thread = None
+
+    def mark_dirty(self):
+        with self._cond:
+            now = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._last_change = now
+            self.changes += 1
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="debounced-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._dirty_since is None and not self._closed:
+                    self._cond.wait()
+                if self._dirty_since is None:
+                    return
+                due = min(self._last_change + self.delay, self._dirty_since + self.max_delay)
+                wait = due - time.monotonic()
+                if wait > 0 and not self._closed:
+                    self._cond.wait(wait)
+                    continue
+                self._dirty_since = None
+            self._write()
+
+    def _write(self):
+        with self._write_lock:
+            with self.lock:
+                data = self.serialize()
+            tmp_path = self.path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding=self.encoding) as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+                self.writes += 1
+            except Exception as e:
+                logger.warning(f"保存文件失败: {self.path}, {e}")
+
+    def flush(self):
+        """立即写入尚未保存的变更"""
+        with self._cond:
+            dirty = self._dirty_since is not None
+            self._dirty_since = None
+        if dirty:
+            self._write()
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+
+class RecentTextStore:
+    """最近使用的TTS文本（最新的在前，去重），条目数和单条长度有上限，单独保存在JSON文件中"""
+
+    def __init__(self, path, max_items=20, max_chars=10000):
+        self.path = path
+        self.max_items = max_items
+        self.max_chars = max_chars
+        self.texts: List[str] = []
+        self.writer = DebouncedFileWriter(
+            path, lambda: json.dumps(self.texts, ensure_ascii=False, indent=1), encoding='utf-8'
+        )
         try:
-            self.root.bell = lambda *a, **k: None
-        except Exception:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.texts = [text for text in json.load(f) if isinstance(text, str)][:max_items]
+        except FileNotFoundError:
             pass
+        except Exception as e:
+            logger.warning(f"读取最近文本记录失败: {e}")
+
+    def add(self, text):
+        text = text[:self.max_chars]
+        if not text or (self.texts and self.texts[0] == text):
+            return
+        with self.writer.lock:
+            if text in self.texts:
+                self.texts.remove(text)
+            self.texts.insert(0, text)
+            del self.texts[self.max_items:]
+        self.writer.mark_dirty()
+
+    def latest(self):
+        return self.texts[0] if self.texts else ''
+
+    def clear(self):
+        with self.writer.lock:
+            self.texts = []
+        self.writer.mark_dirty()
+
+    def close(self):
+        self.writer.close()
+
+
+class NullVar:
+    """无界面模式下代替 tk 变量（状态栏等），忽略写入"""
+
+    def __init__(self, value=""):
+        self.value = value
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+class TTSClientGUI:
+    def __init__(self, root=None, shared_state=False, process_count=1):
+        # root 为 None 时以无界面模式运行：只提供中转服务，不创建窗口也不初始化音频
+        self.root = root
+        self.headless = root is None
+        # 多个中转worker进程时为True：任务、批次和进行中任务表经缓存目录中的SQLite共享
+        self.shared_state = shared_state
+        self.process_count = process_count
+        if not self.headless:
+            self.root.title("TTS API 客户端 - 中转服务器")
+            self.root.geometry("800x600")
+            # 禁用Tk默认的系统提示音（bell），避免点击按钮时发出提示音
+            try:
+                self.root.bell = lambda *a, **k: None
+            except Exception:
+                pass
         
         # 配置文件
         self.config_file = "tts_client_config.ini"
         self.config = configparser.ConfigParser()
+        # 配置变更只修改内存，由后台线程合并后写入文件（路径先转为绝对路径，之后切换工作目录也写回原处）
+        self.config_writer = DebouncedFileWriter(os.path.abspath(self.config_file), self.serialize_config)
         
         # 加载配置
         self.load_config()
+        # 日志级别、格式和输出位置（[Logging]）
+        setup_logging(self.config)
+        # 最近的TTS文本单独保存（有数量和长度上限），不再写入配置文件
+        self.recent_texts = RecentTextStore(
+            os.path.join(os.path.dirname(os.path.abspath(self.config_file)), "tts_recent_texts.json"),
+            max_items=self.config.getint('TTS', 'recent_texts', fallback=20),
+        )
+        legacy_text = self.config.get('Recent', 'tts_text', fallback='')
+        if legacy_text:
+            if not self.recent_texts.texts:
+                self.recent_texts.add(legacy_text)
+            with self.config_writer.lock:
+                self.config.remove_option('Recent', 'tts_text')
+            self.config_writer.mark_dirty()
         
         # API配置 - 使用配置中的值或默认值
         # 上游真实TTS API（前置API）
@@ -84,24 +2902,62 @@ class TTSClientGUI:
         
         # 路径模式配置（Windows/Linux）
         self.path_mode = self.config.get('Path', 'path_mode', fallback='auto')  # auto, windows, linux
-        
+
+        # 共享的上游HTTP客户端（连接池），在[API]/[Proxy]配置变化时重建
+        self._http_client = None
+        self._http_client_key = None
+        self._http_client_lock = threading.Lock()
+
         # 确保缓存目录存在
         self.ensure_cache_dir()
+
+        # 合成结果缓存（索引保存在缓存目录中）
+        self.synthesis_cache = None
+        self.open_synthesis_cache()
+        # 各角色当前生效的参考音频指纹，参与缓存键计算，并用于跳过重复的设置请求
+        self.reference_tracker = ReferenceTracker()
         
-        # PyAudio实例
-        self.p = pyaudio.PyAudio()
+        # PyAudio实例（无界面模式不播放音频）
+        if not self.headless:
+            import_pyaudio()
+            self.p = pyaudio.PyAudio()
         
         # FastAPI应用实例
         self.fastapi_app = None
         self.server_thread = None
         self.server_running = False
         
-        # 音频文件映射表，用于跟踪生成的音频文件
-        self.audio_file_map: Dict[str, Dict[str, Any]] = {}
+        # 任务表，用于跟踪生成的音频文件（有界，按TTL和最大条目数淘汰）
+        max_tasks = self.config.getint('LocalAPI', 'max_tasks', fallback=10000)
+        task_ttl = self.config.getfloat('LocalAPI', 'task_ttl_hours', fallback=24) * 3600
+        self.audio_file_map = TaskRegistry(max_tasks, task_ttl, shared=shared_state)
+        # 任务表持久化到缓存目录，中转服务重启后已完成的任务仍可下载
+        self.task_store = None
+        self.open_task_store()
+        # 各角色的合成速度模型，用于估算进度和剩余时间
+        self.throughput_model = ThroughputModel(self.cache_dir, store=self.task_store if self.shared_state else None)
+        # 压缩格式转码（中转服务按请求转码，客户端用同一个ffmpeg解码）
+        self.transcoder = AudioTranscoder(
+            self.config.get('Audio', 'ffmpeg_path', fallback='') or None,
+            max_workers=self.config.getint('LocalAPI', 'transcode_workers', fallback=2),
+        )
+        # 请求链路追踪（[Tracing]，默认关闭）：客户端、中转服务和上游调用的各阶段span写入本地OTLP JSON文件
+        self.tracer = Tracer(
+            os.path.abspath(self.config.get('Tracing', 'export_file', fallback='tts_traces.jsonl')),
+            service_name=self.config.get(
+                'Tracing', 'service_name', fallback='tts-relay' if self.headless else 'tts-client'
+            ),
+            enabled=self.config.getboolean('Tracing', 'enabled', fallback=False),
+            flush_interval=self.config.getfloat('Tracing', 'flush_interval', fallback=2),
+        )
         
         # 客户端任务追踪
-        self.client_tasks: Dict[str, Dict[str, Any]] = {}
+        self.client_tasks = TaskRegistry(max_tasks, task_ttl)
         
+        if self.headless:
+            self.status_var = NullVar()
+            return
+
         # 创建主框架
         self.create_widgets()
         
@@ -114,12 +2970,100 @@ class TTSClientGUI:
         if not os.path.exists(self.cache_dir):
             try:
                 os.makedirs(self.cache_dir)
-                print(f"创建缓存目录: {self.cache_dir}")
+                logger.info(f"创建缓存目录: {self.cache_dir}")
             except Exception as e:
-                print(f"创建缓存目录失败: {e}")
+                logger.warning(f"创建缓存目录失败: {e}")
                 # 如果创建失败，使用临时目录
                 self.cache_dir = tempfile.gettempdir()
-                print(f"使用临时目录: {self.cache_dir}")
+                logger.warning(f"使用临时目录: {self.cache_dir}")
+
+    def open_synthesis_cache(self):
+        """打开（或在缓存目录变更后重新打开）合成缓存"""
+        if self.synthesis_cache is not None:
+            self.synthesis_cache.close()
+            self.synthesis_cache = None
+        if not self.config.getboolean('Cache', 'enabled', fallback=True):
+            return
+        try:
+            self.synthesis_cache = SynthesisCache(
+                self.cache_dir,
+                max_size_mb=self.config.getfloat('Cache', 'max_size_mb', fallback=1024),
+                max_age_days=self.config.getfloat('Cache', 'max_age_days', fallback=30),
+                referenced_files=self.referenced_audio_files,
+            )
+        except Exception as e:
+            logger.warning(f"打开合成缓存失败: {e}")
+
+    def open_task_store(self):
+        """打开（或在缓存目录变更后重新打开）任务存储，并恢复其中的任务"""
+        if self.task_store is not None:
+            self.task_store.close()
+            self.task_store = None
+        self.audio_file_map.store = None
+        self.reference_tracker.store = None
+        if not self.config.getboolean('LocalAPI', 'persist_tasks', fallback=True):
+            return
+        try:
+            # 多进程共享时其他worker要尽快看到状态变更，默认有变更即写入
+            self.task_store = TaskStore(
+                self.cache_dir,
+                flush_interval=self.config.getfloat(
+                    'LocalAPI', 'task_flush_interval', fallback=0 if self.shared_state else 0.5
+                ),
+            )
+            records = self.task_store.load(
+                self.audio_file_map.ttl_seconds, self.audio_file_map.max_size, recover=not self.shared_state
+            )
+            self.audio_file_map.restore(records)
+            self.audio_file_map.store = self.task_store
+            self.reference_tracker.store = self.task_store
+            if records:
+                logger.info(f"已从任务存储恢复 {len(records)} 个任务")
+        except Exception as e:
+            logger.warning(f"打开任务存储失败: {e}")
+
+    def make_cache_key(self, character_name, text, split_sentence):
+        """根据角色当前的参考音频计算合成缓存键
+
+        参考音频未知（未经本服务设置过，可能是其他客户端直接设置的）时返回None：结果对应哪个音色无法确定，
+        不查询也不写入合成缓存。
+        """
+        fingerprint = self.reference_tracker.get(character_name)
+        if fingerprint is None:
+            return None
+        ref_audio_path, ref_audio_text, ref_audio_hash = fingerprint
+        return SynthesisCache.make_key(character_name, ref_audio_path, ref_audio_text, split_sentence, text,
+                                       ref_audio_hash=ref_audio_hash)
+
+    def referenced_audio_files(self):
+        """仍有任务（处理中或已完成、尚未从任务表淘汰）指向的音频文件，合成缓存淘汰时保留这些文件
+
+        可能在线程中调用，任务表只读取一份快照。
+        """
+        paths = {record.file_path for _, record in self.audio_file_map.items() if record.status != "failed"}
+        if self.shared_state and self.task_store is not None:
+            # 其他worker进程的任务
+            paths.update(self.task_store.referenced_files())
+        return paths
+
+    def lookup_synthesis_cache(self, cache_key):
+        """查询合成缓存，未启用缓存或没有缓存键时始终未命中"""
+        if self.synthesis_cache is None or not cache_key:
+            return None
+        try:
+            return self.synthesis_cache.lookup(cache_key)
+        except Exception as e:
+            logger.warning(f"[合成缓存] 查询失败: {e}")
+            return None
+
+    def store_synthesis_cache(self, cache_key, file_path, character_name=None):
+        """登记新生成的音频到合成缓存（没有缓存键时不登记）"""
+        if self.synthesis_cache is None or not cache_key:
+            return
+        try:
+            self.synthesis_cache.store(cache_key, file_path, character_name)
+        except Exception as e:
+            logger.warning(f"[合成缓存] 登记失败: {e}")
         
     def load_config(self):
         """加载用户配置"""
@@ -127,7 +3071,7 @@ class TTSClientGUI:
             try:
                 self.config.read(self.config_file)
             except Exception as e:
-                print(f"加载配置文件失败: {e}")
+                logger.warning(f"加载配置文件失败: {e}")
                 # 创建默认配置
                 self.create_default_config()
         else:
@@ -160,20 +3104,25 @@ class TTSClientGUI:
         self.config['Recent'] = {}
         self.save_config()
     
+    def serialize_config(self):
+        buffer = io.StringIO()
+        self.config.write(buffer)
+        return buffer.getvalue()
+
     def save_config(self):
-        """保存用户配置"""
-        try:
-            with open(self.config_file, 'w') as configfile:
-                self.config.write(configfile)
-        except Exception as e:
-            print(f"保存配置文件失败: {e}")
+        """立即保存用户配置（原子替换）"""
+        self.config_writer.mark_dirty()
+        self.config_writer.flush()
     
     def update_config(self, section, key, value):
-        """更新配置项"""
-        if not self.config.has_section(section):
-            self.config.add_section(section)
-        self.config.set(section, key, value)
-        self.save_config()
+        """更新配置项（只修改内存，值有变化时由后台线程延迟写入）"""
+        with self.config_writer.lock:
+            if not self.config.has_section(section):
+                self.config.add_section(section)
+            if self.config.get(section, key, raw=True, fallback=None) == value:
+                return
+            self.config.set(section, key, value)
+        self.config_writer.mark_dirty()
     
     def create_widgets(self):
         # 创建标签页
@@ -292,6 +3241,11 @@ class TTSClientGUI:
         
         self.split_sentence_var = tk.BooleanVar()
         ttk.Checkbutton(options_frame, text="分割句子", variable=self.split_sentence_var).pack(side='left', padx=5)
+
+        # 逐句流水线合成：朗读时按句提交，合成好一句播放一句
+        self.incremental_var = tk.BooleanVar(value=self.config.getboolean('TTS', 'incremental_synthesis', fallback=False))
+        ttk.Checkbutton(options_frame, text="逐句合成播放", variable=self.incremental_var,
+                        command=self.toggle_incremental_synthesis).pack(side='left', padx=5)
         
         ttk.Label(options_frame, text="保存路径:").pack(side='left', padx=(20,5))
         self.save_path_entry = ttk.Entry(options_frame, width=25)
@@ -305,6 +3259,7 @@ class TTSClientGUI:
         ttk.Button(button_frame, text="停止", command=self.stop_tts).pack(side='left', padx=5)
         ttk.Button(button_frame, text="开始TTS", command=self.start_tts).pack(side='left', padx=5)
         ttk.Button(button_frame, text="朗读文本", command=self.speak_text).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="批量合成...", command=self.start_batch_tts).pack(side='left', padx=5)
         
         # 添加音频控制
         audio_frame = ttk.Frame(input_frame)
@@ -673,12 +3628,64 @@ class TTSClientGUI:
     
     def create_fastapi_app(self):
         """创建FastAPI应用"""
+        backends = self.upstream_backends()
+        remote = [name for name, url in backends if not UpstreamBackend.is_local_url(url)]
+        if remote and not self.config.getboolean('LocalAPI', 'shared_cache_dir', fallback=False):
+            raise RuntimeError(f"后端 {', '.join(remote)} 不在本机：上游把音频写到中转服务指定的 save_path，"
+                               f"需要以相同路径共享缓存目录 {os.path.abspath(self.cache_dir)}（如NFS挂载）后设置 [LocalAPI] shared_cache_dir = true")
+        # 异步中转引擎：worker数量即上游全局并发上限，任务按角色排队并轮询调度
+        self.relay_engine = RelayEngine(
+            self.upstream_client_settings,
+            worker_count=self.config.getint(
+                'LocalAPI', 'upstream_concurrency',
+                # 多个worker进程时上游并发由各进程分摊
+                fallback=self.config.getint(
+                    'LocalAPI', 'relay_workers', fallback=max(1, math.ceil(4 * len(backends) / self.process_count))
+                )
+            ),
+            queue_size=self.config.getint('LocalAPI', 'relay_queue_size', fallback=256),
+            queue_per_character=self.config.getint('LocalAPI', 'relay_queue_per_character', fallback=0),
+            tracer=self.tracer,
+        )
+        # 上游后端池：[Upstreams] 中配置的多个后端，按负载与角色驻留情况分配，后台探测健康状态
+        self.upstream_pool = UpstreamPool(
+            self.relay_engine,
+            backends,
+            strategy=self.config.get('LocalAPI', 'balancer', fallback='least_outstanding'),
+            health_interval=self.config.getfloat('LocalAPI', 'health_interval', fallback=10),
+            health_timeout=self.config.getfloat('LocalAPI', 'health_timeout', fallback=3),
+            eject_after=self.config.getint('LocalAPI', 'eject_after', fallback=3),
+            readmit_after=self.config.getint('LocalAPI', 'readmit_after', fallback=2),
+            on_readmit=self.reset_upstream_state,
+        )
+
+        @contextlib.asynccontextmanager
+        async def lifespan(app):
+            await self.relay_engine.start()
+            self.upstream_pool.start()
+            try:
+                yield
+            finally:
+                await self.upstream_pool.stop()
+                await self.relay_engine.stop()
+                if self.task_store is not None:
+                    self.task_store.flush()
+                self.tracer.flush()
+                self.throughput_model.save()
+
         self.fastapi_app = FastAPI(
             title="TTS客户端中转API",
             description="TTS客户端的中转API服务，处理局域网客户端请求并转发到后端TTS服务器",
-            version="1.0.0"
+            version="1.0.0",
+            lifespan=lifespan
         )
         
+        # 请求计数与下载耗时统计（/metrics）
+        self.metrics = RelayMetrics()
+        self.fastapi_app.add_middleware(MetricsMiddleware, metrics=self.metrics)
+        # 带 traceparent 头的请求记录为服务端span，后续的排队和上游调用挂在其下
+        self.fastapi_app.add_middleware(TracingMiddleware, tracer=self.tracer)
+        
         # 添加CORS中间件
         self.fastapi_app.add_middleware(
             CORSMiddleware,
@@ -711,9 +3718,41 @@ class TTSClientGUI:
             task_id: str
             client_id: str
             callback_url: Optional[str] = None
+
+        class BatchTTSItem(pydantic.BaseModel):
+            character_name: str
+            text: str
+            split_sentence: bool = False
+
+        class BatchTTSPayload(pydantic.BaseModel):
+            items: List[BatchTTSItem]
         
         # 统计信息
         self.request_count = 0
+
+        # 进行中的合成：缓存键 -> 任务ID，用于合并同时提交的相同请求
+        self.inflight_tasks: Dict[str, str] = {}
+        self.coalesced_requests = 0
+        # 任务ID -> 等待状态变化的事件，供 /events 推送使用
+        self.task_change_events: Dict[str, asyncio.Event] = {}
+        # 批量任务，以及任务ID -> 所属批次ID（任务状态变化时一并唤醒批次的推送）
+        self.batches = TaskRegistry(
+            self.config.getint('LocalAPI', 'max_batches', fallback=1000), self.audio_file_map.ttl_seconds,
+            store=self.task_store if self.shared_state else None, table="batches", shared=self.shared_state
+        )
+        self.task_batches: Dict[str, set] = {}
+        # 上游角色驻留管理：按后端分别按需加载，超出预算时卸载该后端最久未用的角色
+        self.residency = CharacterResidency(
+            self.cache_dir,
+            self.backend_api_call,
+            max_resident=self.config.getint('LocalAPI', 'max_resident_characters', fallback=0),
+            memory_budget_mb=self.config.getfloat('LocalAPI', 'resident_memory_mb', fallback=0),
+            default_model_mb=self.config.getfloat('LocalAPI', 'model_memory_mb', fallback=500),
+            on_change=lambda backend, character: self.reference_tracker.invalidate(backend, character),
+            store=self.task_store if self.shared_state else None,
+        )
+        
+        self.metrics.collectors.append(self.collect_metrics)
         
         # API路由
         @self.fastapi_app.get("/")
@@ -728,16 +3767,25 @@ class TTSClientGUI:
         @self.fastapi_app.post("/load_character")
         async def load_character(request: CharacterPayload):
             self.request_count += 1
-            success, result = self.api_call("/load_character", request.dict())
-            if success:
+            # 经驻留管理在所有健康后端上加载：记录模型目录，超出预算时先卸载最久未用的角色
+            backends = self.upstream_pool.healthy_backends()
+            results = await asyncio.gather(*(
+                self.residency.load(backend.name, request.character_name, request.onnx_model_dir)
+                for backend in backends
+            ))
+            errors = [error for success, error in results if not success]
+            if not errors:
                 return {"status": "success", "message": "角色加载成功"}
             else:
-                raise HTTPException(status_code=500, detail=result)
+                raise HTTPException(status_code=500, detail="; ".join(errors))
         
         @self.fastapi_app.post("/unload_character")
         async def unload_character(request: UnloadCharacterPayload):
             self.request_count += 1
-            success, result = self.api_call("/unload_character", request.dict())
+            success, result = await self.relay_broadcast(
+                "/unload_character", request.dict(),
+                on_success=lambda backend: self.residency.mark_unloaded(backend.name, request.character_name),
+            )
             if success:
                 return {"status": "success", "message": "角色卸载成功"}
             else:
@@ -746,193 +3794,222 @@ class TTSClientGUI:
         @self.fastapi_app.post("/set_reference_audio")
         async def set_reference_audio(request: ReferenceAudioPayload):
             self.request_count += 1
-            success, result = self.api_call("/set_reference_audio", request.dict())
-            if success:
+            tracker = self.reference_tracker
+            # 计算指纹需要读取音频文件，放到线程中执行
+            fingerprint = await asyncio.to_thread(tracker.fingerprint, request.audio_path, request.audio_text)
+            # 参考音频不在本机时无法校验内容，是否据路径和文本跳过由配置决定
+            verifiable = bool(fingerprint[2]) or self.config.getboolean(
+                'LocalAPI', 'skip_unverified_references', fallback=True
+            )
+            # 只转发给参考音频尚未生效的健康后端，其余后端在下次合成前按需补设
+            backends = [
+                backend for backend in self.upstream_pool.healthy_backends()
+                if not (verifiable and tracker.is_applied(backend.name, request.character_name, fingerprint))
+            ]
+            if not backends:
+                tracker.set(request.character_name, fingerprint)
+                tracker.skipped += 1
+                logger.info(f"[中转服务] 参考音频未变化，跳过上游调用: {request.character_name}")
+                return {"status": "success", "message": "参考音频设置成功", "skipped": True}
+            tracker.forwarded += 1
+            results = await asyncio.gather(*(
+                self.upstream_pool.call(backend, "/set_reference_audio", request.dict()) for backend in backends
+            ))
+            errors = []
+            for backend, (success, result) in zip(backends, results):
+                if success:
+                    tracker.mark_applied(backend.name, request.character_name, fingerprint)
+                else:
+                    tracker.invalidate(backend.name, request.character_name)
+                    errors.append(f"{backend.name}: {result}")
+            if len(errors) < len(backends):
+                tracker.set(request.character_name, fingerprint)
                 return {"status": "success", "message": "参考音频设置成功"}
             else:
-                raise HTTPException(status_code=500, detail=result)
+                raise HTTPException(status_code=500, detail="; ".join(errors))
         
         @self.fastapi_app.post("/tts")
         async def tts(request: TTSPayload, background_tasks: BackgroundTasks):
             self.request_count += 1
-            
-            # 生成唯一的任务ID
-            task_id = hashlib.md5(f"{request.character_name}_{request.text}_{time.time()}".encode()).hexdigest()[:16]
-            
-            # 生成缓存文件名
-            cache_file_path = self.generate_filename_from_text(request.text, request.character_name)
-            
-            # 准备请求数据 - 严格遵循API规范
-            data = {
-                "character_name": request.character_name,
-                "text": request.text,
-                "split_sentence": request.split_sentence,
-                "save_path": cache_file_path  # 强制保存到中转服务器本地
-            }
-            
-            # 记录任务信息
-            self.audio_file_map[task_id] = {
-                "file_path": cache_file_path,
+            return await self.submit_tts_task(request.character_name, request.text, request.split_sentence)
+
+        @self.fastapi_app.post("/batch_tts")
+        async def batch_tts(request: BatchTTSPayload):
+            """批量提交TTS任务，返回一个批次ID；各条目按窗口逐步送入上游队列"""
+            self.request_count += 1
+            if not request.items:
+                raise HTTPException(status_code=400, detail="批量任务为空")
+            max_items = self.config.getint('LocalAPI', 'batch_max_items', fallback=1000)
+            if len(request.items) > max_items:
+                raise HTTPException(status_code=400, detail=f"批量任务条目过多，最多 {max_items} 条")
+
+            batch_id = hashlib.md5(f"batch_{len(request.items)}_{time.time()}".encode()).hexdigest()[:16]
+            batch = BatchRecord(batch_id, [(item.character_name, item.text, item.split_sentence) for item in request.items])
+            self.batches.add(batch_id, batch)
+            await self.publish_task_state()
+            run_in_background(self.feed_batch(batch), f"批量任务 {batch_id} 提交")
+            logger.info(f"[中转服务] 批量任务已提交: {batch_id}, 共 {len(batch.items)} 条")
+            return {
                 "status": "processing",
-                "progress": 0,
-                "created_at": datetime.now().isoformat(),
-                "character": request.character_name,
-                "text": request.text[:50] + "..." if len(request.text) > 50 else request.text
+                "batch_id": batch_id,
+                "total": len(batch.items),
+                "check_status_url": f"/batch_status/{batch_id}",
+                "events_url": f"/batch_events/{batch_id}",
+                "download_url": f"/batch_download/{batch_id}"
             }
-            
-            # 在新线程中处理TTS请求
-            def process_tts():
-                try:
-                    # 启动一个简单的进度模拟器，在后台循环增加进度，直到任务完成或失败
-                    def progress_updater():
-                        try:
-                            while True:
-                                info = self.audio_file_map.get(task_id)
-                                if not info or info.get("status") != "processing":
-                                    break
-                                cur = info.get("progress", 0)
-                                # 逐步增加进度但不超过95%，完成后由实际结果设为100%
-                                if cur < 95:
-                                    info["progress"] = min(95, cur + randint(3, 10))
-                                time.sleep(1)
-                        except Exception as e:
-                            print(f"[中转服务] 进度更新线程异常: {e}")
-
-                    prog_thread = threading.Thread(target=progress_updater, daemon=True)
-                    prog_thread.start()
-
-                    success, result = self.api_call("/tts", data)
-                    if success:
-                        # 检查文件是否存在
-                        if os.path.exists(cache_file_path):
-                            self.audio_file_map[task_id]["status"] = "completed"
-                            self.audio_file_map[task_id]["progress"] = 100
-                            # 更新统计信息
-                            self.root.after(0, self.update_stats_display)
-                            print(f"[中转服务] TTS任务完成: {task_id}, 文件: {cache_file_path}")
-                            # 通知已注册该任务的客户端（如果提供了回调URL）
-                            try:
-                                download_url = f"http://{self.local_api_host}:{self.local_api_port}/download/{task_id}"
-                                for client_id, info in list(self.client_tasks.items()):
-                                    try:
-                                        if info.get("task_id") == task_id and info.get("callback_url"):
-                                            notify_payload = {
-                                                "task_id": task_id,
-                                                "status": "completed",
-                                                "download_url": download_url
-                                            }
-                                            # 以非阻塞方式调用外部客户端回调（短超时）
-                                            try:
-                                                requests.post(info.get("callback_url"), json=notify_payload, timeout=5)
-                                                info["status"] = "notified"
-                                                info["last_check"] = datetime.now().isoformat()
-                                                print(f"[中转服务] 已通知客户端 {client_id} 回调: {info.get('callback_url')}")
-                                            except Exception as e:
-                                                print(f"[中转服务] 通知客户端 {client_id} 失败: {e}")
-                                    except Exception as e:
-                                        print(f"[中转服务] 通知单个客户端时异常: {e}")
-                            except Exception as e:
-                                print(f"[中转服务] 通知客户端流程异常: {e}")
+
+        @self.fastapi_app.get("/batch_status/{batch_id}")
+        async def batch_status(batch_id: str):
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                raise HTTPException(status_code=404, detail="批次ID不存在")
+            payload = self.batch_summary(batch)
+            payload["items"] = [self.batch_item_payload(batch, index) for index in range(len(batch.items))]
+            return payload
+
+        @self.fastapi_app.get("/batch_events/{batch_id}")
+        async def batch_events(batch_id: str, request: Request):
+            """以SSE逐条推送批量任务中各条目的完成情况，全部结束后推送汇总"""
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                raise HTTPException(status_code=404, detail="批次ID不存在")
+
+            async def event_stream():
+                unreported = list(range(len(batch.items)))
+                last_sent = time.monotonic()
+                while True:
+                    # 批次可能由其他worker进程提交，每轮重新读取
+                    current = self.batches.get(batch_id) or batch
+                    remaining = []
+                    for index in unreported:
+                        item = self.batch_item_payload(current, index)
+                        if item["status"] in ("completed", "failed"):
+                            yield self.format_sse("item", item)
+                            last_sent = time.monotonic()
                         else:
-                            self.audio_file_map[task_id]["status"] = "failed"
-                            self.audio_file_map[task_id]["progress"] = 0
-                            self.audio_file_map[task_id]["error"] = "音频文件生成失败"
-                            print(f"[中转服务] TTS任务失败: {task_id}, 文件不存在: {cache_file_path}")
-                    else:
-                        self.audio_file_map[task_id]["status"] = "failed"
-                        self.audio_file_map[task_id]["progress"] = 0
-                        self.audio_file_map[task_id]["error"] = result
-                        print(f"[中转服务] TTS任务失败: {task_id}, 错误: {result}")
-                except Exception as e:
-                    self.audio_file_map[task_id]["status"] = "failed"
-                    self.audio_file_map[task_id]["error"] = str(e)
-                    print(f"[中转服务] TTS任务异常: {task_id}, 异常: {str(e)}")
-            
-            # 启动处理线程
-            threading.Thread(target=process_tts, daemon=True).start()
-            
-            # 返回任务ID，客户端可以轮询状态或等待完成
-            return {
-                "status": "processing", 
-                "task_id": task_id,
-                "message": "TTS任务已提交，请使用任务ID查询状态",
-                "check_status_url": f"/tts_status/{task_id}",
-                "download_url": f"/download/{task_id}" if os.path.exists(cache_file_path) else None
-            }
-        
+                            remaining.append(index)
+                    unreported = remaining
+                    if not unreported:
+                        yield self.format_sse("completed", self.batch_summary(current))
+                        return
+                    if time.monotonic() - last_sent >= 15:
+                        yield ": keep-alive\n\n"
+                        last_sent = time.monotonic()
+                    if await request.is_disconnected():
+                        return
+                    await self.wait_task_change(batch_id, timeout=1.0)
+
+            return StreamingResponse(
+                event_stream(),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        @self.fastapi_app.get("/batch_download/{batch_id}")
+        async def batch_download(batch_id: str, format: str = "zip", partial: bool = False):
+            """把批量任务中已完成的音频打包下载（zip或tar），默认要求全部条目已结束"""
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                raise HTTPException(status_code=404, detail="批次ID不存在")
+            if format not in ("zip", "tar"):
+                raise HTTPException(status_code=400, detail="仅支持 zip 或 tar 格式")
+            summary = self.batch_summary(batch)
+            if summary["status"] != "completed" and not partial:
+                raise HTTPException(status_code=400, detail="批量任务尚未完成")
+            if not summary["completed"]:
+                raise HTTPException(status_code=400, detail="批量任务没有已完成的音频")
+
+            archive_path = await asyncio.to_thread(self.build_batch_archive, batch, format)
+            return FileResponse(
+                archive_path,
+                media_type="application/zip" if format == "zip" else "application/x-tar",
+                filename=f"batch_{batch_id}.{format}",
+                background=BackgroundTask(os.remove, archive_path)
+            )
+
         @self.fastapi_app.get("/tts_status/{task_id}")
         async def get_tts_status(task_id: str):
             if task_id not in self.audio_file_map:
                 raise HTTPException(status_code=404, detail="任务ID不存在")
             
-            task_info = self.audio_file_map[task_id]
-            response = {
-                "task_id": task_id,
-                "status": task_info["status"],
-                "progress": task_info.get("progress", 0),
-                "created_at": task_info["created_at"],
-                "character": task_info["character"],
-                "text": task_info["text"]
-            }
-            
-            if task_info["status"] == "completed":
-                response["download_url"] = f"/download/{task_id}"
-                response["file_exists"] = os.path.exists(task_info["file_path"])
-                response["file_path"] = task_info["file_path"]
-                response["file_url"] = f"http://{self.local_api_host}:{self.local_api_port}/download/{task_id}"
-            elif task_info["status"] == "failed":
-                response["error"] = task_info.get("error", "未知错误")
-            
-            return response
+            return self.task_status_payload(task_id, self.audio_file_map.get(task_id))
+
+        @self.fastapi_app.get("/events/{task_id}")
+        async def task_events(task_id: str, request: Request):
+            """以SSE推送任务进度和完成状态，客户端无需轮询 /tts_status"""
+            if task_id not in self.audio_file_map:
+                raise HTTPException(status_code=404, detail="任务ID不存在")
+
+            async def event_stream():
+                last_snapshot = None
+                last_sent = time.monotonic()
+                while True:
+                    task_info = self.audio_file_map.get(task_id)
+                    if task_info is None:
+                        yield self.format_sse("failed", {"task_id": task_id, "status": "failed", "error": "任务ID不存在"})
+                        return
+                    payload = self.task_status_payload(task_id, task_info)
+                    snapshot = (payload["status"], payload["progress"], payload.get("queue_position"))
+                    if snapshot != last_snapshot:
+                        yield self.format_sse(payload["status"], payload)
+                        last_snapshot = snapshot
+                        last_sent = time.monotonic()
+                    elif time.monotonic() - last_sent >= 15:
+                        # 心跳注释，防止长时间无进度变化时连接被中间设备断开
+                        yield ": keep-alive\n\n"
+                        last_sent = time.monotonic()
+                    if payload["status"] in ("completed", "failed"):
+                        return
+                    if await request.is_disconnected():
+                        return
+                    await self.wait_task_change(task_id, timeout=1.0)
+
+            return StreamingResponse(
+                event_stream(),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
         @self.fastapi_app.get("/download/{task_id}")
-        async def download_audio(task_id: str):
+        async def download_audio(task_id: str, request: Request, format: Optional[str] = None):
             if task_id not in self.audio_file_map:
                 raise HTTPException(status_code=404, detail="任务ID不存在")
             
-            task_info = self.audio_file_map[task_id]
+            task_info = self.audio_file_map.get(task_id)
             
-            if task_info["status"] != "completed":
+            if task_info.status != "completed":
                 raise HTTPException(status_code=400, detail="任务尚未完成")
             
-            file_path = task_info["file_path"]
+            file_path = task_info.file_path
             
             if not os.path.exists(file_path):
                 raise HTTPException(status_code=404, detail="音频文件不存在")
             
-            # 返回音频文件
-            return FileResponse(
-                path=file_path,
-                media_type='audio/wav',
-                filename=os.path.basename(file_path)
-            )
+            # 返回音频文件（按format参数或Accept转码，支持Range续传和ETag条件请求）
+            self.metrics.observe_first_download(task_id)
+            return await self.negotiated_audio_response(request, file_path, format)
         
         @self.fastapi_app.get("/stream/{task_id}")
-        async def stream_audio(task_id: str):
-            """流式传输音频文件"""
-            if task_id not in self.audio_file_map:
+        async def stream_audio(task_id: str, request: Request, format: Optional[str] = None):
+            """流式传输音频文件：任务仍在处理时边生成边发送（WAV），已完成时与 /download 相同"""
+            task_info = self.audio_file_map.get(task_id)
+            if task_info is None:
                 raise HTTPException(status_code=404, detail="任务ID不存在")
             
-            task_info = self.audio_file_map[task_id]
+            if task_info.status == "failed":
+                raise HTTPException(status_code=400, detail=f"任务失败: {task_info.error or '未知错误'}")
             
-            # 等待任务完成
-            start_time = time.time()
-            while task_info["status"] == "processing" and (time.time() - start_time) < 30:  # 最多等待30秒
-                await asyncio.sleep(0.5)
+            file_path = task_info.file_path
+            if task_info.status == "completed":
+                if not os.path.exists(file_path):
+                    raise HTTPException(status_code=404, detail="音频文件不存在")
+                self.metrics.observe_first_download(task_id)
+                return await self.negotiated_audio_response(request, file_path, format)
             
-            if task_info["status"] != "completed":
-                raise HTTPException(status_code=400, detail=f"任务失败: {task_info.get('error', '未知错误')}")
-            
-            file_path = task_info["file_path"]
-            
-            if not os.path.exists(file_path):
-                raise HTTPException(status_code=404, detail="音频文件不存在")
-            
-            # 返回音频文件
-            return FileResponse(
-                path=file_path,
+            return StreamingResponse(
+                self.tail_task_file(task_id, file_path, request),
                 media_type='audio/wav',
-                filename=os.path.basename(file_path)
+                headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
             )
         
         # 新增：客户端任务注册接口
@@ -942,12 +4019,12 @@ class TTSClientGUI:
             if request.task_id not in self.audio_file_map:
                 raise HTTPException(status_code=404, detail="任务ID不存在")
             
-            self.client_tasks[request.client_id] = {
-                "task_id": request.task_id,
-                "callback_url": request.callback_url,
-                "last_check": datetime.now().isoformat(),
-                "status": "registered"
-            }
+            self.client_tasks.add(request.client_id, ClientTaskRecord(
+                request.task_id, request.client_id, request.callback_url
+            ))
+            # 任务由其他worker进程处理时，本进程等它完成后再通知客户端
+            if self.shared_state and not self.audio_file_map.is_local(request.task_id):
+                run_in_background(self.watch_task_completion(request.task_id), f"等待任务 {request.task_id} 完成")
             
             return {"status": "success", "message": "客户端任务已注册"}
 
@@ -958,7 +4035,7 @@ class TTSClientGUI:
         async def get_client_tasks():
             """获取所有客户端任务"""
             return {
-                "client_tasks": self.client_tasks,
+                "client_tasks": {client_id: info.to_dict() for client_id, info in self.client_tasks.items()},
                 "total_clients": len(self.client_tasks)
             }
         
@@ -967,8 +4044,7 @@ class TTSClientGUI:
         async def get_completed_tasks():
             """获取所有已完成的任务"""
             completed_tasks = {
-                task_id: info for task_id, info in self.audio_file_map.items() 
-                if info["status"] == "completed"
+                task_id: info.to_dict() for task_id, info in self.audio_file_map.items("completed")
             }
             return {
                 "completed_tasks": completed_tasks,
@@ -981,14 +4057,14 @@ class TTSClientGUI:
             """批量获取任务状态"""
             results = {}
             for task_id in task_ids:
-                if task_id in self.audio_file_map:
-                    task_info = self.audio_file_map[task_id]
+                task_info = self.audio_file_map.get(task_id)
+                if task_info is not None:
                     results[task_id] = {
-                        "status": task_info["status"],
-                        "character": task_info["character"],
-                        "text": task_info["text"]
+                        "status": task_info.status,
+                        "character": task_info.character,
+                        "text": task_info.text
                     }
-                    if task_info["status"] == "completed":
+                    if task_info.status == "completed":
                         results[task_id]["download_url"] = f"/download/{task_id}"
                 else:
                     results[task_id] = {"status": "not_found"}
@@ -998,57 +4074,626 @@ class TTSClientGUI:
         @self.fastapi_app.post("/clear_reference_audio_cache")
         async def clear_reference_audio_cache():
             self.request_count += 1
-            success, result = self.api_call("/clear_reference_audio_cache")
+            success, result = await self.relay_broadcast(
+                "/clear_reference_audio_cache",
+                on_success=lambda backend: self.reference_tracker.invalidate(backend.name),
+            )
+            if success:
+                return {"status": "success", "message": "参考音频缓存已清除"}
+            else:
+                raise HTTPException(status_code=500, detail=result)
+        
+        @self.fastapi_app.post("/stop")
+        async def stop_tts():
+            self.request_count += 1
+            success, result = await self.relay_broadcast("/stop")
+            if success:
+                return {"status": "success", "message": "TTS已停止"}
+            else:
+                raise HTTPException(status_code=500, detail=result)
+        
+        @self.fastapi_app.get("/metrics")
+        async def get_metrics():
+            """Prometheus格式的指标"""
+            return Response(self.metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+        @self.fastapi_app.get("/stats")
+        async def get_stats():
+            """获取服务统计信息"""
+            completed_tasks = self.audio_file_map.count("completed")
+            failed_tasks = self.audio_file_map.count("failed")
+            processing_tasks = self.audio_file_map.count("processing")
+            
+            return {
+                "total_requests": self.request_count,
+                "total_tasks": len(self.audio_file_map),
+                "completed_tasks": completed_tasks,
+                "failed_tasks": failed_tasks,
+                "processing_tasks": processing_tasks,
+                "active_clients": len(self.client_tasks),
+                "evicted_tasks": self.audio_file_map.evicted,
+                "task_store": self.task_store.stats() if self.task_store else None,
+                "throughput_model": self.throughput_model.stats(),
+                "transcoder": self.transcoder.stats(),
+                "residency": self.residency.stats(),
+                "references": self.reference_tracker.stats(),
+                "backend_server": self.upstream_api_url,
+                "upstreams": self.upstream_pool.stats(),
+                "upstream_pool": self.get_http_client().stats(),
+                "relay_engine": self.relay_engine.stats(),
+                "worker": {"pid": os.getpid(), "processes": self.process_count, "shared_state": self.shared_state},
+                "dedup": {
+                    "in_flight": len(self.inflight_tasks),
+                    "saved_upstream_calls": self.coalesced_requests
+                },
+                "synthesis_cache": self.synthesis_cache.stats() if self.synthesis_cache else None,
+                "tracing": self.tracer.stats(),
+                "logging": _log_handler.stats() if _log_handler is not None else None
+            }
+    
+    async def submit_tts_task(self, character_name, text, split_sentence=False):
+        """登记并提交一个TTS任务：先查合成缓存，再合并相同的进行中任务，否则按角色排队等待上游
+
+        队列已满时抛出429的HTTPException（带Retry-After）。
+        """
+        # 生成唯一的任务ID
+        task_id = hashlib.md5(f"{character_name}_{text}_{time.time()}".encode()).hexdigest()[:16]
+
+        # 先查合成缓存，命中时直接登记为已完成任务，不再调用上游（查询SQLite在线程中执行，不阻塞事件循环）
+        cache_key = await asyncio.to_thread(self.make_cache_key, character_name, text, split_sentence)
+        cached_path = await asyncio.to_thread(self.lookup_synthesis_cache, cache_key)
+        if cached_path:
+            self.audio_file_map.add(task_id, TaskRecord(
+                task_id, cached_path, character_name, text,
+                status="completed", cached=True
+            ))
+            self.metrics.mark_completed(task_id)
+            await self.publish_task_state()
+            logger.info(f"[中转服务] 合成缓存命中: {task_id}, 文件: {cached_path}")
+            # status 保持 "processing" 以兼容旧版客户端的提交检查，cached/download_url 表示可直接下载
+            return {
+                "status": "processing",
+                "task_id": task_id,
+                "cached": True,
+                "message": "命中合成缓存，可直接下载",
+                "check_status_url": f"/tts_status/{task_id}",
+                "download_url": f"/download/{task_id}"
+            }
+        
+        # 生成缓存文件名（内容寻址，相同请求对应同一文件；没有缓存键时按任务ID命名，不覆盖其他任务的结果）
+        cache_file_path = self.generate_filename_from_text(text, character_name, cache_key=cache_key or task_id)
+        record = TaskRecord(task_id, cache_file_path, character_name, text)
+
+        # 相同请求已在合成中：挂到已有任务上，共享其状态和结果文件
+        # （参考音频未知时没有缓存键，同时到达的相同请求仍在上游的同一状态下合成，按请求内容合并）
+        inflight_key = cache_key or "unverified:" + SynthesisCache.make_key(
+            character_name, '', '', split_sentence, text
+        )
+        inflight_task_id = await self.claim_inflight(inflight_key, record)
+        if inflight_task_id:
+            self.coalesced_requests += 1
+            logger.info(f"[中转服务] 合并重复请求到进行中的任务: {inflight_task_id}")
+            return {
+                "status": "processing",
+                "task_id": inflight_task_id,
+                "coalesced": True,
+                "message": "相同的TTS任务正在处理中，已合并到该任务",
+                "check_status_url": f"/tts_status/{inflight_task_id}",
+                "download_url": None
+            }
+
+        # 准备请求数据 - 严格遵循API规范
+        data = {
+            "character_name": character_name,
+            "text": text,
+            "split_sentence": split_sentence,
+            "save_path": cache_file_path  # 强制保存到中转服务器本地
+        }
+        
+        # 记录任务信息
+        self.audio_file_map.add(task_id, record)
+
+        # 按角色排队等待上游并发名额，队列已满时返回429并给出建议的重试时间
+        # 记下提交请求所在的追踪，任务在worker中执行时接着记录排队和上游调用
+        job = functools.partial(self.process_tts, task_id, data, cache_key, inflight_key, current_span.get())
+        if not self.relay_engine.submit(job, character_name, key=task_id):
+            self.audio_file_map.remove(task_id)
+            await self.release_inflight(inflight_key, task_id)
+            raise HTTPException(
+                status_code=429,
+                detail="中转服务任务队列已满，请稍后重试",
+                headers={"Retry-After": str(self.relay_engine.retry_after())}
+            )
+        
+        # 返回任务ID，客户端可以轮询状态或等待完成
+        return {
+            "status": "processing",
+            "task_id": task_id,
+            "message": "TTS任务已提交，请使用任务ID查询状态",
+            "check_status_url": f"/tts_status/{task_id}",
+            "download_url": f"/download/{task_id}" if os.path.exists(cache_file_path) else None
+        }
+
+    async def feed_batch(self, batch):
+        """把批量任务的条目逐步送入上游队列
+
+        同一批次同时排队/处理中的条目不超过窗口大小，避免一个大批次占满队列导致其他客户端被拒绝。
+        """
+        window = self.config.getint('LocalAPI', 'batch_window', fallback=self.relay_engine.worker_count * 2)
+        outstanding = deque()
+        for index, (character_name, text, split_sentence) in enumerate(batch.items):
+            while True:
+                while outstanding:
+                    task_info = self.audio_file_map.get(outstanding[0])
+                    if task_info is not None and task_info.status == "processing":
+                        break
+                    outstanding.popleft()
+                if len(outstanding) >= max(1, window):
+                    await self.wait_task_change(outstanding[0], timeout=1.0)
+                    continue
+                try:
+                    result = await self.submit_tts_task(character_name, text, split_sentence)
+                except HTTPException as e:
+                    if e.status_code != 429:
+                        batch.errors[index] = str(e.detail)
+                        break
+                    # 队列已满，等待空位后重试
+                    await asyncio.sleep(min(1.0, self.relay_engine.retry_after()))
+                    continue
+                except Exception as e:
+                    batch.errors[index] = str(e)
+                    break
+                task_id = result["task_id"]
+                batch.task_ids[index] = task_id
+                task_info = self.audio_file_map.get(task_id)
+                if task_info is not None and task_info.status == "processing":
+                    outstanding.append(task_id)
+                    self.task_batches.setdefault(task_id, set()).add(batch.batch_id)
+                break
+            self.batches.save(batch.batch_id)
+            self.signal_task_change(batch.batch_id)
+        logger.info(f"[中转服务] 批量任务 {batch.batch_id} 的 {len(batch.items)} 个条目已全部提交")
+
+    async def claim_inflight(self, cache_key, record):
+        """登记进行中的合成；相同请求已在合成中时返回其任务ID，否则返回None
+
+        多worker共享状态时，登记和任务记录在共享存储的同一事务中写入（在线程中执行，不阻塞事件循环）。
+        """
+        existing = self.inflight_tasks.get(cache_key)
+        if existing and self.audio_file_map.is_local(existing):
+            return existing
+        if self.shared_state and self.task_store is not None:
+            existing = await asyncio.to_thread(self.task_store.claim_inflight, cache_key, record)
+            if existing:
+                return existing
+        self.inflight_tasks[cache_key] = record.task_id
+        return None
+
+    async def release_inflight(self, cache_key, task_id):
+        if self.inflight_tasks.get(cache_key) == task_id:
+            del self.inflight_tasks[cache_key]
+            if self.shared_state and self.task_store is not None:
+                await asyncio.to_thread(self.task_store.release_inflight, cache_key, task_id)
+
+    async def publish_task_state(self):
+        """多worker共享状态时立即写入待写的任务变更，返回后其他进程即可查到（在线程中执行）"""
+        if self.shared_state and self.task_store is not None:
+            await asyncio.to_thread(self.task_store.flush)
+
+    async def watch_task_completion(self, task_id):
+        """等待其他worker进程处理的任务结束，完成后通知在本进程注册的客户端"""
+        while True:
+            task_info = self.audio_file_map.get(task_id)
+            if task_info is None or task_info.status != "processing":
+                break
+            await self.wait_task_change(task_id, timeout=1.0)
+        if task_info is not None and task_info.status == "completed":
+            await self.notify_task_clients(task_id)
+
+    def batch_item_payload(self, batch, index):
+        """批量任务中单个条目的状态"""
+        character_name = batch.items[index][0]
+        task_id = batch.task_ids[index]
+        item = {"index": index, "task_id": task_id, "character": character_name}
+        if index in batch.errors:
+            item.update(status="failed", error=batch.errors[index])
+            return item
+        if task_id is None:
+            item["status"] = "pending"
+            return item
+        task_info = self.audio_file_map.get(task_id)
+        if task_info is None:
+            item.update(status="failed", error="任务记录已过期")
+            return item
+        item["status"] = task_info.status
+        if task_info.status == "completed":
+            item["download_url"] = f"/download/{task_id}"
+        elif task_info.status == "failed":
+            item["error"] = task_info.error or "未知错误"
+        return item
+
+    def batch_summary(self, batch):
+        """批量任务汇总：各状态的条目数，全部条目结束后状态为completed"""
+        counts = {"pending": 0, "processing": 0, "completed": 0, "failed": 0}
+        for index in range(len(batch.items)):
+            status = self.batch_item_payload(batch, index)["status"]
+            counts[status] = counts.get(status, 0) + 1
+        done = counts["completed"] + counts["failed"]
+        return {
+            "batch_id": batch.batch_id,
+            "status": "completed" if done == len(batch.items) else "processing",
+            "total": len(batch.items),
+            "created_at": batch.created_at,
+            **counts,
+            "download_url": f"/batch_download/{batch.batch_id}"
+        }
+
+    def build_batch_archive(self, batch, archive_format):
+        """把批量任务中已完成的音频打包到临时文件（WAV压缩率低，zip不再压缩），返回文件路径"""
+        entries = []
+        for index, task_id in enumerate(batch.task_ids):
+            task_info = self.audio_file_map.get(task_id) if task_id else None
+            if task_info is None or task_info.status != "completed" or not os.path.exists(task_info.file_path):
+                continue
+            character_name = re.sub(r'[\\/:*?"<>|]', '_', batch.items[index][0])
+            entries.append((task_info.file_path, f"{index + 1:04d}_{character_name}.wav"))
+        fd, archive_path = tempfile.mkstemp(prefix=f"batch_{batch.batch_id}_", suffix=f".{archive_format}")
+        os.close(fd)
+        if archive_format == "zip":
+            with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_STORED) as archive:
+                for file_path, name in entries:
+                    archive.write(file_path, name)
+        else:
+            with tarfile.open(archive_path, "w") as archive:
+                for file_path, name in entries:
+                    archive.add(file_path, arcname=name)
+        return archive_path
+
+    async def negotiated_audio_response(self, request, file_path, requested=None):
+        """按查询参数或Accept头选择音频格式，需要时转码；无法转码时回退为WAV"""
+        try:
+            fmt = AudioTranscoder.negotiate(requested, request.headers.get("accept"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if fmt != "wav":
+            if not self.transcoder.available:
+                logger.warning(f"[中转服务] 未找到ffmpeg，无法转码为{fmt}，改为发送WAV")
+                fmt = "wav"
+            else:
+                try:
+                    started = time.perf_counter()
+                    file_path = await self.transcoder.get_variant(file_path, fmt)
+                    self.metrics.observe("transcode_seconds", time.perf_counter() - started, format=fmt)
+                except Exception as e:
+                    logger.warning(f"[中转服务] {e}，改为发送WAV")
+                    fmt = "wav"
+        return self.audio_file_response(request, file_path, AudioTranscoder.media_type(fmt))
+
+    @staticmethod
+    def audio_file_response(request, file_path, media_type='audio/wav'):
+        """返回音频文件；ETag由文件大小和修改时间生成，If-None-Match匹配时返回304
+
+        缓存文件按内容寻址，文件不变时ETag不变。Range/If-Range由FileResponse处理，
+        服务器支持 pathsend 扩展时文件内容由服务器直接发送。
+        """
+        stat_result = os.stat(file_path)
+        etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=86400", "Vary": "Accept"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            if "*" in candidates or etag in candidates:
+                return Response(status_code=304, headers=headers)
+        return FileResponse(
+            path=file_path,
+            media_type=media_type,
+            filename=os.path.basename(file_path),
+            headers=headers,
+            stat_result=stat_result
+        )
+
+    async def tail_task_file(self, task_id, file_path, request, chunk_size=64 * 1024):
+        """跟随上游写入的进度读取结果文件并逐块发送，任务结束且文件读完后结束"""
+        f = None
+        try:
+            while True:
+                task_info = self.audio_file_map.get(task_id)
+                finished = task_info is None or task_info.status != "processing"
+                if f is None and os.path.exists(file_path):
+                    f = open(file_path, 'rb')
+                if f is not None:
+                    chunk = f.read(chunk_size)
+                    if chunk:
+                        yield chunk
+                        continue
+                if finished:
+                    if task_info is None or task_info.status != "completed":
+                        logger.warning(f"[中转服务] 流式传输中止，任务未成功完成: {task_id}")
+                    return
+                if await request.is_disconnected():
+                    return
+                await self.wait_task_change(task_id, timeout=0.2)
+        finally:
+            if f is not None:
+                f.close()
+
+    def upstream_backends(self):
+        """读取 [Upstreams] 中的上游后端（名称 = 地址），未配置时只使用上游 API 地址
+
+        上游 /tts 把音频直接写到请求中的 save_path（中转服务缓存目录下的路径），不回传音频数据，
+        因此不在本机的后端必须以相同路径挂载中转服务的缓存目录，见 [LocalAPI] shared_cache_dir。
+        """
+        if self.config.has_section('Upstreams') and self.config.items('Upstreams'):
+            return [(name, url.strip()) for name, url in self.config.items('Upstreams') if url.strip()]
+        return [("default", self.upstream_api_url)]
+
+    async def backend_api_call(self, backend_name, endpoint, data=None):
+        """调用指定名称的上游后端（异步，不阻塞事件循环）"""
+        return await self.upstream_pool.call(self.upstream_pool.backends[backend_name], endpoint, data)
+
+    async def relay_broadcast(self, endpoint, data=None, on_success=None):
+        """在所有健康后端上执行同一调用，任一后端成功即视为成功，返回 (success, result)"""
+        results = await self.upstream_pool.broadcast(endpoint, data)
+        errors = []
+        for backend, success, result in results:
             if success:
-                return {"status": "success", "message": "参考音频缓存已清除"}
+                if on_success:
+                    on_success(backend)
             else:
-                raise HTTPException(status_code=500, detail=result)
-        
-        @self.fastapi_app.post("/stop")
-        async def stop_tts():
-            self.request_count += 1
-            success, result = self.api_call("/stop")
+                errors.append(f"{backend.name}: {result}" if len(results) > 1 else result)
+        if len(errors) < len(results):
+            return True, None
+        return False, "; ".join(errors)
+
+    def collect_metrics(self):
+        """导出时读取引擎、任务表、合成缓存和上游后端的现有统计"""
+        engine = self.relay_engine
+        samples = [
+            ("gauge", "queue_depth", engine.scheduler.depth, {}),
+            ("gauge", "busy_workers", engine.busy_workers, {}),
+        ]
+        samples.extend(("gauge", "tasks", count, {"status": status})
+                       for status, count in self.audio_file_map.counts().items())
+        if self.synthesis_cache is not None:
+            cache = self.synthesis_cache
+            lookups = cache.hits + cache.misses
+            samples.extend([
+                ("counter", "cache_hits_total", cache.hits, {}),
+                ("counter", "cache_misses_total", cache.misses, {}),
+                ("gauge", "cache_hit_ratio", round(cache.hits / lookups, 4) if lookups else 0.0, {}),
+            ])
+        for backend in self.upstream_pool.backends.values():
+            labels = {"backend": backend.name}
+            samples.extend([
+                ("histogram", "upstream_request_seconds", backend.latency, labels),
+                ("gauge", "upstream_healthy", int(backend.healthy), labels),
+                ("gauge", "upstream_outstanding", backend.outstanding, labels),
+            ])
+        return samples
+
+    def reset_upstream_state(self, backend_name):
+        """后端重新上线后可能已重启：清空它的角色驻留与参考音频记录"""
+        self.residency.reset_backend(backend_name)
+        self.reference_tracker.invalidate(backend_name)
+
+    async def apply_reference(self, backend, character_name):
+        """合成前确保该角色当前的参考音频已在所选后端生效"""
+        tracker = self.reference_tracker
+        fingerprint = tracker.get(character_name)
+        if fingerprint is None or not fingerprint[0] or tracker.is_applied(backend.name, character_name, fingerprint):
+            return True, None
+        tracker.forwarded += 1
+        success, result = await self.upstream_pool.call(backend, "/set_reference_audio", {
+            "character_name": character_name,
+            "audio_path": fingerprint[0],
+            "audio_text": fingerprint[1],
+        })
+        if success:
+            tracker.mark_applied(backend.name, character_name, fingerprint)
+        return success, result
+
+    def task_status_payload(self, task_id, task_info):
+        """构造 /tts_status 与 /events 共用的任务状态数据"""
+        response = {
+            "task_id": task_id,
+            "status": task_info.status,
+            **self.estimate_progress(task_info),
+            "created_at": task_info.created_at,
+            "character": task_info.character,
+            "text": task_info.text
+        }
+
+        if task_info.status == "completed":
+            response["download_url"] = f"/download/{task_id}"
+            response["file_exists"] = os.path.exists(task_info.file_path)
+            response["file_path"] = task_info.file_path
+            response["file_url"] = f"http://{self.local_api_host}:{self.local_api_port}/download/{task_id}"
+        elif task_info.status == "failed":
+            response["error"] = task_info.error or "未知错误"
+
+        return response
+
+    @staticmethod
+    def format_sse(event, data):
+        """编码一条SSE消息"""
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def signal_task_change(self, task_id):
+        """唤醒正在等待该任务状态变化的SSE连接（仅在服务器事件循环中调用）"""
+        event = self.task_change_events.pop(task_id, None)
+        if event is not None:
+            event.set()
+        batch_ids = self.task_batches.get(task_id)
+        if batch_ids:
+            # 任务开始处理时也会通知，所属批次的登记保留到任务结束
+            task_info = self.audio_file_map.get(task_id)
+            if task_info is None or task_info.status != "processing":
+                del self.task_batches[task_id]
+            for batch_id in batch_ids:
+                self.signal_task_change(batch_id)
+
+    async def wait_task_change(self, task_id, timeout):
+        """等待任务状态变化，超时后返回以便刷新估算进度"""
+        event = self.task_change_events.get(task_id)
+        if event is None:
+            event = self.task_change_events[task_id] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def estimate_progress(self, task_info):
+        """按角色的合成速度模型和排队位置估算进度与剩余秒数
+
+        返回 progress、eta_seconds，排队中的任务另有 queue_position（前面还有几个任务）。
+        """
+        if task_info.status != "processing":
+            return {"progress": task_info.progress, "eta_seconds": 0}
+        expected = self.throughput_model.estimate(task_info.character, task_info.text_length)
+        if task_info.started_at is None:
+            ahead = self.relay_engine.scheduler.position(task_info.character, task_info.task_id)
+            if ahead is None:
+                ahead = 0
+            # 前面的任务由所有worker分担，加上正在处理的任务剩余的大约一半时间；
+            # 引擎还没有完成过任务时以本任务的预计耗时代替平均处理时长
+            engine = self.relay_engine
+            service_time = engine.average_service_time() if engine.jobs_done + engine.jobs_failed else expected
+            wait = (ahead + engine.busy_workers * 0.5) * service_time / max(1, engine.worker_count)
+            return {"progress": 0, "eta_seconds": round(wait + expected, 1), "queue_position": ahead}
+        elapsed = time.time() - task_info.started_at
+        # 超出预计时间后进度停在99%，直到上游返回
+        progress = min(99, int(elapsed / expected * 100)) if expected > 0 else 99
+        return {"progress": progress, "eta_seconds": round(max(0.0, expected - elapsed), 1)}
+
+    async def process_tts(self, task_id, data, cache_key, inflight_key, trace_parent=None):
+        """在异步引擎worker中执行TTS任务
+
+        cache_key 为None时（参考音频未知）结果不写入合成缓存；trace_parent 为提交请求的span，没有时作为新追踪的根。
+        """
+        started = time.time()
+        record = self.audio_file_map.get(task_id)
+        created = record.created_ts if record is not None else started
+        attributes = {"tts.task_id": task_id, "tts.character": data["character_name"]}
+        with self.tracer.span("relay task", parent=trace_parent, start_time=created, attributes=attributes) as span:
+            self.tracer.record("relay queue_wait", created, started)
+            await self._process_tts(task_id, data, cache_key, inflight_key, started)
+            task_info = self.audio_file_map.get(task_id)
+            if task_info is not None and task_info.status == "failed":
+                span.set_error(task_info.error or "failed")
+
+    async def _process_tts(self, task_id, data, cache_key, inflight_key, started):
+        tasks = self.audio_file_map
+        cache_file_path = data["save_path"]
+        character_name = data["character_name"]
+        record = tasks.set_status(task_id, "processing", started_at=started)
+        if record is not None:
+            self.metrics.observe("queue_wait_seconds", started - record.created_ts)
+        self.signal_task_change(task_id)
+        pool = self.upstream_pool
+        backend = None
+        try:
+            tried = []
+            while True:
+                # 优先选择已加载该角色的后端，连接失败时换一个后端重试一次
+                backend = pool.choose(character_name, self.residency.is_resident, exclude=tried)
+                tried.append(backend.name)
+                # 角色未驻留时先按需加载（可能卸载最久未用的角色），加载耗时不计入合成速度
+                with self.tracer.span("relay acquire_character", attributes={
+                    "tts.backend": backend.name,
+                    "tts.resident": self.residency.is_resident(backend.name, character_name),
+                }):
+                    success, result = await self.residency.acquire(backend.name, character_name)
+                if success:
+                    with self.tracer.span("relay apply_reference", attributes={"tts.backend": backend.name}):
+                        success, result = await self.apply_reference(backend, character_name)
+                if success:
+                    started = time.time()
+                    success, result = await pool.call(backend, "/tts", data)
+                    if success:
+                        self.metrics.observe("upstream_tts_seconds", time.time() - started, character=character_name)
+                if success or not pool.is_transport_error(result) or len(tried) >= min(2, len(pool)):
+                    break
+                self.residency.release(backend.name, character_name)
+                backend = None
+                logger.warning(f"[中转服务] 后端 {tried[-1]} 请求失败，改用其他后端重试: {task_id}")
             if success:
-                return {"status": "success", "message": "TTS已停止"}
+                # 检查文件是否存在
+                if os.path.exists(cache_file_path):
+                    tasks.set_status(task_id, "completed", progress=100)
+                    self.metrics.mark_completed(task_id)
+                    await asyncio.to_thread(
+                        self.throughput_model.observe, character_name, len(data["text"]), time.time() - started
+                    )
+                    await asyncio.to_thread(self.store_synthesis_cache, cache_key, cache_file_path, character_name)
+                    # 更新统计信息
+                    if not self.headless:
+                        self.root.after(0, self.update_stats_display)
+                    logger.info(f"[中转服务] TTS任务完成: {task_id}, 文件: {cache_file_path}")
+                    await self.notify_task_clients(task_id)
+                else:
+                    error = "音频文件生成失败"
+                    if not backend.is_local:
+                        error += f"（后端 {backend.name} 不在本机，缓存目录是否已共享？）"
+                    tasks.set_status(task_id, "failed", progress=0, error=error)
+                    logger.warning(f"[中转服务] TTS任务失败: {task_id}, 文件不存在: {cache_file_path}")
             else:
-                raise HTTPException(status_code=500, detail=result)
-        
-        @self.fastapi_app.get("/stats")
-        async def get_stats():
-            """获取服务统计信息"""
-            completed_tasks = len([t for t in self.audio_file_map.values() if t["status"] == "completed"])
-            failed_tasks = len([t for t in self.audio_file_map.values() if t["status"] == "failed"])
-            processing_tasks = len([t for t in self.audio_file_map.values() if t["status"] == "processing"])
-            
-            return {
-                "total_requests": self.request_count,
-                "total_tasks": len(self.audio_file_map),
-                "completed_tasks": completed_tasks,
-                "failed_tasks": failed_tasks,
-                "processing_tasks": processing_tasks,
-                "active_clients": len(self.client_tasks),
-                "backend_server": self.upstream_api_url
-            }
-    
+                tasks.set_status(task_id, "failed", progress=0, error=result)
+                logger.warning(f"[中转服务] TTS任务失败: {task_id}, 错误: {result}")
+        except Exception as e:
+            tasks.set_status(task_id, "failed", error=str(e))
+            logger.error(f"[中转服务] TTS任务异常: {task_id}, 异常: {str(e)}")
+        finally:
+            if backend is not None:
+                self.residency.release(backend.name, character_name)
+            await self.release_inflight(inflight_key, task_id)
+            await self.publish_task_state()
+            task_info = tasks.get(task_id)
+            self.metrics.inc("tts_tasks_total", result=task_info.status if task_info else "failed")
+            self.signal_task_change(task_id)
+
+    async def notify_task_clients(self, task_id):
+        """通知已注册该任务的客户端（如果提供了回调URL）"""
+        try:
+            download_url = f"http://{self.local_api_host}:{self.local_api_port}/download/{task_id}"
+            for client_id, info in self.client_tasks.items("registered"):
+                if info.task_id != task_id or not info.callback_url:
+                    continue
+                notify_payload = {
+                    "task_id": task_id,
+                    "status": "completed",
+                    "download_url": download_url
+                }
+                # 短超时，单个客户端失败不影响其他客户端
+                try:
+                    await self.relay_engine.request("POST", info.callback_url, json=notify_payload, timeout=5)
+                    self.client_tasks.set_status(client_id, "notified", last_check=datetime.now().isoformat())
+                    logger.info(f"[中转服务] 已通知客户端 {client_id} 回调: {info.callback_url}")
+                except Exception as e:
+                    logger.warning(f"[中转服务] 通知客户端 {client_id} 失败: {e}")
+        except Exception as e:
+            logger.error(f"[中转服务] 通知客户端流程异常: {e}")
+
     def update_stats_display(self):
         """更新统计信息显示"""
         if hasattr(self, 'stats_var'):
             self.stats_var.set(f"总处理请求: {getattr(self, 'request_count', 0)}")
     
-    def run_fastapi_server(self, host, port):
-        """运行FastAPI服务器"""
+    def run_fastapi_server(self, host, port, sockets=None):
+        """运行FastAPI服务器（多worker进程时在父进程已监听的 sockets 上提供服务）"""
         try:
-            uvicorn.run(
+            config = uvicorn.Config(
                 self.fastapi_app,
                 host=host,
                 port=port,
                 log_level="info",
                 access_log=True
             )
+            uvicorn.Server(config).run(sockets=sockets)
         except Exception as e:
-            print(f"API服务器错误: {e}")
+            logger.error(f"API服务器错误: {e}")
             # 在GUI线程中更新状态
-            self.root.after(0, lambda: self.api_status_var.set(f"服务错误: {str(e)}"))
+            if not self.headless:
+                self.root.after(0, lambda: self.api_status_var.set(f"服务错误: {str(e)}"))
             self.server_running = False
 
     # 以下是不变的方法...
@@ -1084,6 +4729,10 @@ class TTSClientGUI:
         if new_url:
             self.upstream_api_url = new_url
             self.update_config('API', 'upstream_api_url', new_url)
+            # 未配置 [Upstreams] 时后端池只有默认后端，地址随之更新
+            pool = getattr(self, 'upstream_pool', None)
+            if pool is not None and "default" in pool.backends and not self.config.has_section('Upstreams'):
+                pool.backends["default"].url = new_url.rstrip('/')
             messagebox.showinfo("成功", f"上游 API 地址已更新为: {new_url}")
 
     def toggle_connect_master(self):
@@ -1103,6 +4752,10 @@ class TTSClientGUI:
             self.cache_dir = new_cache_dir
             self.update_config('Cache', 'cache_dir', new_cache_dir)
             self.ensure_cache_dir()
+            self.open_synthesis_cache()
+            self.open_task_store()
+            self.throughput_model.save()
+            self.throughput_model = ThroughputModel(self.cache_dir, store=self.task_store if self.shared_state else None)
             messagebox.showinfo("成功", f"缓存目录已更新为: {new_cache_dir}")
             
     def update_path_mode(self):
@@ -1152,11 +4805,14 @@ class TTSClientGUI:
         if messagebox.askyesno("确认", "确定要清理所有音频缓存文件吗？"):
             try:
                 count = 0
+                audio_exts = ('.wav',) + tuple(ext for ext, *_ in AudioTranscoder.FORMATS.values())
                 for filename in os.listdir(self.cache_dir):
-                    if filename.endswith('.wav'):
+                    if filename.endswith(audio_exts):
                         file_path = os.path.join(self.cache_dir, filename)
                         os.remove(file_path)
                         count += 1
+                if self.synthesis_cache is not None:
+                    self.synthesis_cache.clear()
                 messagebox.showinfo("成功", f"已清理 {count} 个音频缓存文件")
             except Exception as e:
                 messagebox.showerror("错误", f"清理缓存失败: {e}")
@@ -1195,7 +4851,7 @@ class TTSClientGUI:
         # 保存TTS文本
         tts_text = self.tts_text.get("1.0", tk.END).strip()
         if tts_text:
-            self.update_config('Recent', 'tts_text', tts_text)
+            self.recent_texts.add(tts_text)
             
         # 保存保存路径
         save_path = self.save_path_entry.get().strip()
@@ -1254,7 +4910,7 @@ class TTSClientGUI:
                 self.audio_text_entry.insert(0, audio_text)
                 
             # 加载TTS文本
-            tts_text = self.config.get('Recent', 'tts_text', fallback='')
+            tts_text = self.recent_texts.latest()
             if tts_text:
                 self.tts_text.insert("1.0", tts_text)
                 
@@ -1285,14 +4941,16 @@ class TTSClientGUI:
             self.proxy_mode_var.set(proxy_mode)
                 
         except Exception as e:
-            print(f"加载历史记录失败: {e}")
+            logger.warning(f"加载历史记录失败: {e}")
     
     def clear_history(self):
         """清除历史记录"""
         if messagebox.askyesno("确认", "确定要清除所有历史记录吗？"):
-            self.config.remove_section('Recent')
-            self.config.add_section('Recent')
+            with self.config_writer.lock:
+                self.config.remove_section('Recent')
+                self.config.add_section('Recent')
             self.save_config()
+            self.recent_texts.clear()
             
             # 清空表单
             self.character_name_entry.delete(0, tk.END)
@@ -1307,10 +4965,17 @@ class TTSClientGUI:
             
             messagebox.showinfo("成功", "历史记录已清除")
     
-    def generate_filename_from_text(self, text, character_name):
-        """根据文本和角色名称生成文件名"""
-        # 获取当前时间戳
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    def generate_filename_from_text(self, text, character_name, cache_key=None):
+        """根据文本和角色名称生成文件名
+
+        提供cache_key时以缓存键代替时间戳，相同请求总是映射到同一个缓存文件。
+        """
+        # 获取当前时间戳（缓存文件使用内容哈希，文本同样取规范化后的形式）
+        if cache_key:
+            timestamp = cache_key[:16]
+            text = SynthesisCache.normalize_text(text)
+        else:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         # 清理文本，移除特殊字符
         clean_text = re.sub(r'[^\w\s]', '', text)
@@ -1328,28 +4993,28 @@ class TTSClientGUI:
         
         # 确保缓存目录存在并检查权限
         current_cache_dir = self.cache_dir
-        print(f"[路径生成] 使用缓存目录: {current_cache_dir}")
+        logger.debug(f"[路径生成] 使用缓存目录: {current_cache_dir}")
         
         # 确保目录存在
         try:
             os.makedirs(current_cache_dir, exist_ok=True)
-            print(f"[路径生成] 缓存目录: {current_cache_dir} 已确认存在")
+            logger.debug(f"[路径生成] 缓存目录: {current_cache_dir} 已确认存在")
             
             # 检查目录是否可写
             if not os.access(current_cache_dir, os.W_OK):
-                print(f"[路径生成] 警告: 缓存目录 {current_cache_dir} 没有写入权限")
+                logger.warning(f"[路径生成] 警告: 缓存目录 {current_cache_dir} 没有写入权限")
                 # 尝试使用临时目录作为备选
                 import tempfile
                 temp_dir = tempfile.gettempdir()
-                print(f"[路径生成] 切换到临时目录: {temp_dir}")
+                logger.warning(f"[路径生成] 切换到临时目录: {temp_dir}")
                 current_cache_dir = temp_dir
                 os.makedirs(current_cache_dir, exist_ok=True)
         except Exception as e:
-            print(f"[路径生成] 创建缓存目录失败: {e}")
+            logger.warning(f"[路径生成] 创建缓存目录失败: {e}")
             # 使用临时目录作为备选
             import tempfile
             temp_dir = tempfile.gettempdir()
-            print(f"[路径生成] 强制使用临时目录: {temp_dir}")
+            logger.warning(f"[路径生成] 强制使用临时目录: {temp_dir}")
             current_cache_dir = temp_dir
         
         # 根据路径模式处理路径分隔符
@@ -1364,62 +5029,88 @@ class TTSClientGUI:
             # Linux模式强制使用正斜杠
             final_path = os.path.join(current_cache_dir, filename).replace('\\', '/')
         
-        print(f"[路径生成] 最终生成的文件路径: {final_path}")
+        logger.debug(f"[路径生成] 最终生成的文件路径: {final_path}")
         return final_path
     
+    def build_proxies(self):
+        """根据代理设置构建requests使用的代理字典，未启用代理时返回None"""
+        if not (self.use_proxy and self.proxy_host and self.proxy_port):
+            return None
+        # 确保代理类型正确格式化
+        proxy_type = self.proxy_type.lower()
+        if proxy_type == 'sock5':
+            # 转换为requests支持的socks5格式
+            proxy_type = 'socks5'
+        elif proxy_type != 'http':
+            # 默认使用http
+            proxy_type = 'http'
+
+        proxy_url = f"{proxy_type}://"
+        if self.proxy_username and self.proxy_password:
+            proxy_url += f"{self.proxy_username}:{self.proxy_password}@"
+        proxy_url += f"{self.proxy_host}:{self.proxy_port}"
+        return {
+            "http": proxy_url,
+            "https": proxy_url
+        }
+
+    def upstream_client_settings(self):
+        """读取上游连接池配置，返回(配置指纹, 参数字典)；[API]/[Proxy]未变化时指纹不变"""
+        proxies = self.build_proxies()
+        key = (
+            tuple(self.config.items('API')) if self.config.has_section('API') else (),
+            tuple(self.config.items('Proxy')) if self.config.has_section('Proxy') else (),
+            tuple(sorted(proxies.items())) if proxies else (),
+        )
+        settings = {
+            "proxies": proxies,
+            "pool_connections": self.config.getint('API', 'pool_connections', fallback=10),
+            "pool_maxsize": self.config.getint('API', 'pool_maxsize', fallback=20),
+            "pool_block": self.config.getboolean('API', 'pool_block', fallback=False),
+            "max_retries": self.config.getint('API', 'max_retries', fallback=3),
+            "keep_alive": self.config.getboolean('API', 'keep_alive', fallback=True),
+        }
+        return key, settings
+
+    def get_http_client(self):
+        """获取共享的上游HTTP客户端，仅在[API]或[Proxy]配置变化时重建"""
+        key, settings = self.upstream_client_settings()
+        with self._http_client_lock:
+            if self._http_client is not None and self._http_client_key == key:
+                return self._http_client
+            old_client = self._http_client
+            client = self._http_client = UpstreamHTTPClient(**settings)
+            self._http_client_key = key
+            proxies = settings['proxies']
+            if proxies:
+                logger.info(f"[API调用] 使用代理: {proxies['http']}")
+            logger.info(f"[API调用] 上游连接池已{'重建' if old_client else '创建'}")
+        if old_client is not None:
+            # 其他线程可能仍在旧客户端上进行请求，稍后再关闭
+            closer = threading.Timer(60, old_client.close)
+            closer.daemon = True
+            closer.start()
+        return client
+
     def api_call(self, endpoint, data=None):
         """通用的API调用方法"""
         try:
             url = f"{self.upstream_api_url}{endpoint}"
             self.status_var.set(f"正在调用 {endpoint}...")
-            
-            headers = {'Content-Type': 'application/json'}
-            
-            # 创建会话
-            session = requests.Session()
-            
-            # 配置重试策略
-            retry_strategy = Retry(
-                total=3,
-                backoff_factor=0.3,
-                status_forcelist=[500, 502, 503, 504],
-            )
-            adapter = HTTPAdapter(max_retries=retry_strategy)
-            session.mount("http://", adapter)
-            session.mount("https://", adapter)
-            
-            # 配置代理 - 支持HTTP和SOCKS5
-            if self.use_proxy and self.proxy_host and self.proxy_port:
-                # 确保代理类型正确格式化
-                proxy_type = self.proxy_type.lower()
-                if proxy_type == 'sock5':
-                    # 转换为requests支持的socks5格式
-                    proxy_type = 'socks5'
-                elif proxy_type != 'http':
-                    # 默认使用http
-                    proxy_type = 'http'
-                    
-                proxy_url = f"{proxy_type}://"
-                if self.proxy_username and self.proxy_password:
-                    proxy_url += f"{self.proxy_username}:{self.proxy_password}@"
-                proxy_url += f"{self.proxy_host}:{self.proxy_port}"
-                
-                proxies = {
-                    "http": proxy_url,
-                    "https": proxy_url
-                }
-                print(f"[API调用] 使用代理: {proxy_url} (类型: {proxy_type})")
-            else:
-                proxies = None
-            
+
+            headers = self.tracer.inject({'Content-Type': 'application/json'})
+
+            # 使用共享连接池（重试策略与代理已在客户端创建时配置）
+            session = self.get_http_client()
+
             # 添加调试信息
-            print(f"[API调用] 目标URL: {url}")
-            print(f"[API调用] 请求数据: {data}")
-            
+            logger.debug(f"[API调用] 目标URL: {url}")
+            log_payload("[API调用] 请求数据", data)
+
             if data:
-                response = session.post(url, json=data, headers=headers, timeout=30, proxies=proxies)
+                response = session.post(url, json=data, headers=headers, timeout=30)
             else:
-                response = session.post(url, headers=headers, timeout=30, proxies=proxies)
+                response = session.post(url, headers=headers, timeout=30)
             
             # 检查响应状态
             if response.status_code == 200:
@@ -1428,16 +5119,17 @@ class TTSClientGUI:
                     if response.content:  # 如果响应不为空
                         json_response = response.json()
                         self.status_var.set(f"{endpoint} 调用成功")
-                        print(f"[API调用] 响应成功: {json_response}")
+                        logger.debug("[API调用] 响应成功")
+                        log_payload("[API调用] 响应内容", json_response)
                         return True, json_response
                     else:
                         self.status_var.set(f"{endpoint} 调用成功 (空响应)")
-                        print(f"[API调用] 响应成功 (空响应)")
+                        logger.debug(f"[API调用] 响应成功 (空响应)")
                         return True, "成功"
                 except json.JSONDecodeError as e:
                     # 如果JSON解析失败，但状态码是200，可能返回的是纯文本或其他格式
                     self.status_var.set(f"{endpoint} 调用成功 (非JSON响应)")
-                    print(f"[API调用] 响应成功 (非JSON响应)")
+                    logger.debug(f"[API调用] 响应成功 (非JSON响应)")
                     return True, response.text
             else:
                 error_msg = f"HTTP错误: {response.status_code}"
@@ -1449,20 +5141,20 @@ class TTSClientGUI:
                     error_msg += f" - {response.text}"
                 
                 self.status_var.set(f"{endpoint} 调用失败: {response.status_code}")
-                print(f"[API调用] 响应失败: {error_msg}")
+                logger.warning(f"[API调用] 响应失败: {error_msg}")
                 return False, error_msg
                 
         except requests.exceptions.ConnectionError:
             self.status_var.set("连接错误: 无法连接到服务器")
-            print(f"[API调用] 连接错误: 无法连接到服务器 {url}")
+            logger.warning(f"[API调用] 连接错误: 无法连接到服务器 {url}")
             return False, "连接错误: 请检查服务器是否运行及API地址是否正确"
         except requests.exceptions.Timeout:
             self.status_var.set("请求超时")
-            print(f"[API调用] 请求超时: {url}")
+            logger.warning(f"[API调用] 请求超时: {url}")
             return False, "请求超时: 服务器响应时间过长"
         except Exception as e:
             self.status_var.set(f"错误: {str(e)}")
-            print(f"[API调用] 异常: {str(e)}")
+            logger.error(f"[API调用] 异常: {str(e)}")
             return False, str(e)
     
     def load_character(self):
@@ -1537,6 +5229,9 @@ class TTSClientGUI:
     def _set_reference_audio_thread(self, data):
         success, result = self.api_call("/set_reference_audio", data)
         if success:
+            self.reference_tracker.set(
+                data['character_name'], self.reference_tracker.fingerprint(data['audio_path'], data['audio_text'])
+            )
             messagebox.showinfo("成功", "参考音频设置成功")
         else:
             messagebox.showerror("错误", f"参考音频设置失败: {result}")
@@ -1559,12 +5254,14 @@ class TTSClientGUI:
         
         # 保存到配置
         self.update_config('Recent', 'tts_character', character_name)
-        self.update_config('Recent', 'tts_text', text)  # 新增：保存TTS文本
+        self.recent_texts.add(text)
         if save_path:
             self.update_config('Recent', 'save_path', save_path)
-        # 如果没有指定保存路径，使用与朗读文本相同的命名规则生成缓存文件路径
+        # 如果没有指定保存路径，使用与朗读文本相同的命名规则生成缓存文件路径（可命中合成缓存）
+        cache_key = None
         if not save_path:
-            cache_file_path = self.generate_filename_from_text(text, character_name)
+            cache_key = self.make_cache_key(character_name, text, data['split_sentence'])
+            cache_file_path = self.generate_filename_from_text(text, character_name, cache_key=cache_key)
             data['save_path'] = cache_file_path
         else:
             # 把用户提供的保存路径视为目录（浏览按钮现在只选目录）
@@ -1594,11 +5291,23 @@ class TTSClientGUI:
                 cache_file_path = self.generate_filename_from_text(text, character_name)
                 data['save_path'] = cache_file_path
 
-        threading.Thread(target=self._tts_thread, args=(data, cache_file_path), daemon=True).start()
+        threading.Thread(target=self._tts_thread, args=(data, cache_file_path, cache_key), daemon=True).start()
     
-    def _tts_thread(self, data, cache_file_path):
+    def _tts_thread(self, data, cache_file_path, cache_key=None):
+        with self.tracer.span("client tts", attributes={
+            "tts.character": data.get("character_name", ""), "tts.text_length": len(data.get("text", "")),
+        }):
+            self._tts(data, cache_file_path, cache_key)
+
+    def _tts(self, data, cache_file_path, cache_key=None):
+        cached_path = self.lookup_synthesis_cache(cache_key) if cache_key else None
+        if cached_path:
+            # 命中合成缓存：直接使用已有音频文件
+            logger.info(f"[合成缓存] 命中: {cached_path}")
+            cache_file_path = cached_path
+            success, result = True, "成功"
         # 若启用中转服务并且本地API服务正在运行，使用中转模式的轮询+下载逻辑
-        if getattr(self, 'proxy_mode', False) and getattr(self, 'server_running', False):
+        elif getattr(self, 'proxy_mode', False) and getattr(self, 'server_running', False):
             success, result = self._speak_with_proxy_mode(data, cache_file_path)
         else:
             success, result = self.api_call("/tts", data)
@@ -1608,25 +5317,28 @@ class TTSClientGUI:
                 try:
                     # 确保目标目录存在
                     os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
-                    print(f"[直接模式] 确保目录存在: {os.path.dirname(cache_file_path)}")
+                    logger.debug(f"[直接模式] 确保目录存在: {os.path.dirname(cache_file_path)}")
                     
                     # 如果API返回的是二进制音频数据，直接保存
                     if isinstance(result, bytes) and len(result) > 0:
                         with open(cache_file_path, 'wb') as f:
                             f.write(result)
-                        print(f"[直接模式] 音频数据已直接保存到: {cache_file_path}")
+                        logger.debug(f"[直接模式] 音频数据已直接保存到: {cache_file_path}")
                 except Exception as e:
-                    print(f"[直接模式] 准备文件保存时出错: {e}")
+                    logger.warning(f"[直接模式] 准备文件保存时出错: {e}")
+
+        if success and cache_key and not cached_path:
+            self.store_synthesis_cache(cache_key, cache_file_path, data['character_name'])
 
         if success:
             # 不在此处自动播放（start_tts 请求不自动朗读），仅提示完成并告知文件路径
             if cache_file_path and os.path.exists(cache_file_path) and os.path.getsize(cache_file_path) > 0:
                 file_size = os.path.getsize(cache_file_path)
-                print(f"[TTS完成] 文件已成功生成: {cache_file_path}, 大小: {file_size} 字节")
+                logger.info(f"[TTS完成] 文件已成功生成: {cache_file_path}, 大小: {file_size} 字节")
                 messagebox.showinfo("成功", f"TTS转换完成，文件已保存: {cache_file_path}")
             else:
-                print(f"[TTS完成] 文件未找到或为空: {cache_file_path}")
-                print(f"[TTS完成] API调用结果: {result}")
+                logger.warning(f"[TTS完成] 文件未找到或为空: {cache_file_path}")
+                logger.warning(f"[TTS完成] API调用结果: {truncate_payload(result)}")
                 # 更详细的错误提示
                 error_msg = "TTS转换完成，但未找到生成的音频文件。\n"
                 error_msg += f"检查路径: {cache_file_path}\n"
@@ -1638,6 +5350,140 @@ class TTSClientGUI:
         else:
             messagebox.showerror("错误", f"TTS转换失败: {result}")
     
+    def start_batch_tts(self):
+        """批量合成：读取文本或CSV文件，提交到中转服务的 /batch_tts，完成后下载打包的音频"""
+        file_path = filedialog.askopenfilename(
+            filetypes=[("文本或CSV文件", "*.txt *.csv"), ("所有文件", "*.*")]
+        )
+        if not file_path:
+            return
+        default_character = self.tts_character_entry.get().strip()
+        try:
+            items = self.parse_batch_file(file_path, default_character, self.split_sentence_var.get())
+        except Exception as e:
+            messagebox.showerror("错误", f"读取批量文件失败: {e}")
+            return
+        if not items:
+            messagebox.showerror("错误", "批量文件中没有可合成的条目（TXT文件需要先填写角色名称）")
+            return
+
+        archive_path = filedialog.asksaveasfilename(
+            defaultextension=".zip",
+            initialfile=os.path.splitext(os.path.basename(file_path))[0] + ".zip",
+            filetypes=[("ZIP压缩包", "*.zip"), ("TAR归档", "*.tar")]
+        )
+        if not archive_path:
+            return
+
+        self.status_var.set(f"正在提交批量任务（{len(items)} 条）...")
+        threading.Thread(target=self._batch_tts_thread, args=(items, archive_path), daemon=True).start()
+
+    @staticmethod
+    def parse_batch_file(file_path, default_character, split_sentence=False):
+        """解析批量文件
+
+        TXT：每行一条文本，使用默认角色；CSV：character_name,text[,split_sentence] 三列，
+        首行为表头时跳过，角色为空的行使用默认角色。
+        """
+        items = []
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            if not file_path.lower().endswith('.csv'):
+                if not default_character:
+                    return []
+                for line in f:
+                    text = line.strip()
+                    if text:
+                        items.append({"character_name": default_character, "text": text,
+                                      "split_sentence": split_sentence})
+                return items
+            for row in csv.reader(f):
+                if not row or len(row) < 2:
+                    continue
+                if not items and row[0].strip().lower() in ('character_name', 'character', '角色'):
+                    continue
+                character_name = row[0].strip() or default_character
+                text = row[1].strip()
+                if not character_name or not text:
+                    continue
+                item_split = split_sentence
+                if len(row) > 2 and row[2].strip():
+                    item_split = row[2].strip().lower() in ('1', 'true', 'yes', 'y', '是')
+                items.append({"character_name": character_name, "text": text, "split_sentence": item_split})
+        return items
+
+    def _batch_tts_thread(self, items, archive_path):
+        """提交批量任务、跟踪各条目完成情况并下载打包文件"""
+        target_api, _ = self.relay_target()
+        session = self.get_http_client()
+        try:
+            response = session.post(f"{target_api}/batch_tts", json={"items": items}, timeout=30)
+            if response.status_code != 200:
+                raise RuntimeError(f"提交批量任务失败: {response.status_code} - {response.text}")
+            batch_id = response.json()["batch_id"]
+            logger.info(f"[批量合成] 批次ID: {batch_id}, 共 {len(items)} 条")
+
+            summary = self._wait_batch_events(session, target_api, batch_id, len(items))
+            if summary is None:
+                # 推送不可用时轮询批次状态
+                while True:
+                    status_response = session.get(f"{target_api}/batch_status/{batch_id}", timeout=10)
+                    if status_response.status_code != 200:
+                        raise RuntimeError(f"查询批次状态失败: {status_response.status_code}")
+                    summary = status_response.json()
+                    done = summary.get("completed", 0) + summary.get("failed", 0)
+                    self.root.after(0, lambda d=done: self.status_var.set(f"批量合成中... {d}/{len(items)}"))
+                    if summary.get("status") == "completed":
+                        break
+                    time.sleep(1)
+
+            if not summary.get("completed"):
+                raise RuntimeError("批量任务中没有成功合成的条目")
+            archive_format = "tar" if archive_path.lower().endswith(".tar") else "zip"
+            success, result = self.stream_download(
+                session, f"{target_api}/batch_download/{batch_id}?format={archive_format}", archive_path
+            )
+            if not success:
+                raise RuntimeError(result)
+            message = f"批量合成完成：成功 {summary['completed']} 条，失败 {summary['failed']} 条"
+            logger.info(f"[批量合成] {message}，已保存到 {archive_path}")
+            self.root.after(0, lambda: self.status_var.set(message))
+            self.root.after(0, lambda: messagebox.showinfo("批量合成", f"{message}\n已保存到: {archive_path}"))
+        except Exception as e:
+            logger.warning(f"[批量合成] 失败: {e}")
+            self.root.after(0, lambda: self.status_var.set("批量合成失败"))
+            self.root.after(0, lambda: messagebox.showerror("错误", f"批量合成失败: {e}"))
+
+    def _wait_batch_events(self, session, target_api, batch_id, total):
+        """通过SSE跟踪批量任务，返回汇总；推送不可用或连接中断时返回None"""
+        done = 0
+        try:
+            with session.get(f"{target_api}/batch_events/{batch_id}", stream=True, timeout=(5, 60)) as response:
+                if response.status_code != 200 or not response.headers.get('Content-Type', '').startswith('text/event-stream'):
+                    return None
+                response.encoding = 'utf-8'
+                event_name = None
+                data_lines = []
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('event:'):
+                        event_name = line[6:].strip()
+                        continue
+                    if line.startswith('data:'):
+                        data_lines.append(line[5:].strip())
+                        continue
+                    if line or not data_lines:
+                        continue
+                    payload = json.loads('\n'.join(data_lines))
+                    data_lines = []
+                    if event_name == "completed":
+                        return payload
+                    done += 1
+                    if payload.get("status") == "failed":
+                        logger.warning(f"[批量合成] 第 {payload['index'] + 1} 条失败: {payload.get('error')}")
+                    self.root.after(0, lambda d=done: self.status_var.set(f"批量合成中... {d}/{total}"))
+        except Exception as e:
+            logger.warning(f"[批量合成] 推送连接中断，改为轮询: {e}")
+        return None
+
     def speak_text(self):
         """朗读文本"""
         if self.audio_playing:
@@ -1651,30 +5497,235 @@ class TTSClientGUI:
             messagebox.showerror("错误", "请填写角色名称和文本")
             return
         
-        # 生成基于文本的文件名（包含时间戳）
-        cache_file_path = self.generate_filename_from_text(text, character_name)
+        # 生成基于文本内容哈希的缓存文件名
+        split_sentence = self.split_sentence_var.get()
+        cache_key = self.make_cache_key(character_name, text, split_sentence)
+        cache_file_path = self.generate_filename_from_text(text, character_name, cache_key=cache_key)
         
         data = {
             "character_name": character_name,
             "text": text,
-            "split_sentence": self.split_sentence_var.get(),
+            "split_sentence": split_sentence,
             "save_path": cache_file_path
         }
         
         # 保存到配置
         self.update_config('Recent', 'tts_character', character_name)
-        self.update_config('Recent', 'tts_text', text)  # 新增：保存TTS文本
+        self.recent_texts.add(text)
+
+        # 逐句合成播放：多句文本按句流水线合成，第一句就绪即开始播放
+        sentences = self.split_text_sentences(text) if self.incremental_var.get() else []
+        if len(sentences) > 1:
+            threading.Thread(
+                target=self._speak_incremental_thread,
+                args=(data, cache_file_path, cache_key, sentences),
+                daemon=True
+            ).start()
+            return
         
-        threading.Thread(target=self._speak_thread, args=(data, cache_file_path), daemon=True).start()
+        threading.Thread(target=self._speak_thread, args=(data, cache_file_path, cache_key), daemon=True).start()
+
+    def toggle_incremental_synthesis(self):
+        """切换逐句合成播放"""
+        self.update_config('TTS', 'incremental_synthesis', str(self.incremental_var.get()))
+
+    @staticmethod
+    def split_text_sentences(text):
+        """按句末标点和换行切分文本，标点保留在句尾，只有标点的片段并入前一句"""
+        sentences = []
+        for part in re.split(r'(?<=[。！？!?；;…\n])|(?<=\.)\s+', text):
+            part = part.strip()
+            if not part:
+                continue
+            if sentences and not re.search(r'\w', part):
+                sentences[-1] += part
+            else:
+                sentences.append(part)
+        return sentences
+
+    def _synthesize_segment(self, character_name, sentence):
+        """合成单个句子，返回 (success, 本地WAV路径或错误信息)，优先使用合成缓存"""
+        cache_key = self.make_cache_key(character_name, sentence, False)
+        cached_path = self.lookup_synthesis_cache(cache_key)
+        if cached_path:
+            return True, cached_path
+
+        segment_path = self.generate_filename_from_text(sentence, character_name, cache_key=cache_key)
+        data = {
+            "character_name": character_name,
+            "text": sentence,
+            "split_sentence": False,
+            "save_path": segment_path
+        }
+        if self.proxy_mode and self.server_running:
+            success, result = self._speak_with_proxy_mode(data, segment_path)
+        else:
+            success, result = self._speak_direct_mode(data, segment_path)
+        if not success:
+            return False, result
+        if not os.path.exists(segment_path):
+            return False, f"音频文件不存在: {segment_path}"
+        self.store_synthesis_cache(cache_key, segment_path, character_name)
+        return True, segment_path
+
+    def _speak_incremental_thread(self, data, cache_file_path, cache_key, sentences):
+        """逐句合成的朗读线程，一次朗读作为一个追踪的根span，各句的合成挂在其下"""
+        with self.tracer.span("client speak_incremental", attributes={
+            "tts.character": data.get("character_name", ""), "tts.text_length": len(data.get("text", "")),
+            "tts.sentences": len(sentences),
+        }):
+            self._speak_incremental(data, cache_file_path, cache_key, sentences)
+
+    def _speak_incremental(self, data, cache_file_path, cache_key, sentences):
+        """逐句流水线合成并无缝播放，整段音频拼接后写入合成缓存"""
+        cached_path = self.lookup_synthesis_cache(cache_key)
+        if cached_path:
+            logger.info(f"[合成缓存] 命中: {cached_path}")
+            try:
+                self.play_audio_file(cached_path)
+            except Exception as e:
+                self.status_var.set(f"播放音频失败: {str(e)}")
+                messagebox.showerror("错误", f"播放音频失败: {str(e)}")
+            return
+
+        character_name = data['character_name']
+        depth = max(1, self.config.getint('TTS', 'pipeline_depth', fallback=2))
+        logger.info(f"[逐句合成] 共 {len(sentences)} 句，同时合成 {depth} 句")
+        # 线程池大小即同时在合成的句子数，其余句子按顺序排队
+        executor = ThreadPoolExecutor(max_workers=depth, thread_name_prefix="tts-segment")
+        # 线程池中的线程不继承当前span，按本线程的上下文执行
+        futures = [
+            executor.submit(contextvars.copy_context().run, self._synthesize_segment, character_name, sentence)
+            for sentence in sentences
+        ]
+
+        part_path = cache_file_path + '.part'
+        stream = None
+        stream_params = None
+        writer = None
+        writer_params = None
+        concat_ok = True
+        error = None
+        self.audio_playing = True
+        try:
+            for index, future in enumerate(futures):
+                if not self.audio_playing:
+                    break
+                self.status_var.set(f"逐句合成: 等待第 {index + 1}/{len(futures)} 句...")
+                success, result = future.result()
+                if not success:
+                    error = f"第 {index + 1} 句合成失败: {result}"
+                    break
+
+                with wave.open(result, 'rb') as wf:
+                    params = (wf.getnchannels(), wf.getsampwidth(), wf.getframerate())
+                    if writer is None:
+                        writer = wave.open(part_path, 'wb')
+                        writer.setnchannels(params[0])
+                        writer.setsampwidth(params[1])
+                        writer.setframerate(params[2])
+                        writer_params = params
+                    # 各句格式一致时复用同一个输出流，句与句之间无缝衔接
+                    if params != stream_params:
+                        if stream is not None:
+                            stream.stop_stream()
+                            stream.close()
+                        stream = self.p.open(
+                            format=self.p.get_format_from_width(params[1]),
+                            channels=params[0],
+                            rate=params[2],
+                            output=True
+                        )
+                        stream_params = params
+                    self.status_var.set(f"正在播放第 {index + 1}/{len(futures)} 句")
+                    frames = wf.readframes(1024)
+                    while frames and self.audio_playing:
+                        stream.write(frames)
+                        if params == writer_params:
+                            writer.writeframes(frames)
+                        frames = wf.readframes(1024)
+                    if params != writer_params:
+                        concat_ok = False
+            completed = self.audio_playing and error is None
+        except Exception as e:
+            completed = False
+            error = str(e)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if stream is not None:
+                stream.stop_stream()
+                stream.close()
+            if writer is not None:
+                writer.close()
+            self.audio_playing = False
+
+        if completed and concat_ok:
+            os.replace(part_path, cache_file_path)
+            self.store_synthesis_cache(cache_key, cache_file_path, character_name)
+            self.status_var.set("音频播放完成")
+            logger.info(f"[逐句合成] 整段音频已写入缓存: {cache_file_path}")
+            return
+        if completed:
+            logger.warning("[逐句合成] 各句音频格式不一致，整段音频未写入缓存")
+            self.status_var.set("音频播放完成")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        if error:
+            self.status_var.set(f"逐句合成失败: {error}")
+            messagebox.showerror("错误", f"逐句合成失败: {error}")
+        else:
+            self.status_var.set("音频播放已停止")
     
-    def _speak_thread(self, data, cache_file_path):
+    def _speak_thread(self, data, cache_file_path, cache_key=None):
         """改进的朗读线程，添加任务状态轮询"""
-        if self.proxy_mode and self.server_running:
-            # 中转模式：使用任务状态轮询机制
-            success, result = self._speak_with_proxy_mode(data, cache_file_path)
+        # 一次朗读（合成、下载和播放）作为一个追踪的根span
+        with self.tracer.span("client speak", attributes={
+            "tts.character": data.get("character_name", ""), "tts.text_length": len(data.get("text", "")),
+        }):
+            self._speak(data, cache_file_path, cache_key)
+
+    def _speak(self, data, cache_file_path, cache_key=None):
+        player = None
+        cached_path = self.lookup_synthesis_cache(cache_key) if cache_key else None
+        if cached_path:
+            # 命中合成缓存：直接播放已有音频，不调用上游
+            logger.info(f"[合成缓存] 命中: {cached_path}")
+            self.status_var.set("命中合成缓存")
+            cache_file_path = cached_path
+            success, result = True, "成功"
+        elif self.proxy_mode and self.server_running:
+            # 中转模式：使用任务状态轮询机制，收到WAV头和首批数据后即开始边下载边播放
+            if self.config.getboolean('Audio', 'stream_playback', fallback=True):
+                player = StreamingWavPlayer(
+                    self.p,
+                    prebuffer_ms=self.config.getint('Audio', 'jitter_buffer_ms', fallback=300),
+                    on_start=self._on_stream_playback_start,
+                    should_continue=lambda: self.audio_playing,
+                )
+            success, result = self._speak_with_proxy_mode(
+                data, cache_file_path, on_chunk=player.feed if player else None
+            )
         else:
             # 直接模式：保持原有逻辑
             success, result = self._speak_direct_mode(data, cache_file_path)
+
+        if success and cache_key and not cached_path:
+            self.store_synthesis_cache(cache_key, cache_file_path, data['character_name'])
+
+        if player is not None and player.started:
+            # 已在下载过程中开始播放：等待缓冲区播放完毕
+            player.finish()
+            player.wait()
+            self.audio_playing = False
+            if player.error:
+                self.status_var.set(f"播放音频失败: {player.error}")
+                messagebox.showerror("错误", f"播放音频失败: {player.error}")
+            else:
+                self.status_var.set("音频播放完成")
+                logger.info(f"[流式播放] 播放完成，欠载次数: {player.underruns}")
+            if not success:
+                messagebox.showerror("错误", f"音频下载未完成: {result}")
+            return
             
         if success:
             # 检查文件是否真的存在
@@ -1693,191 +5744,427 @@ class TTSClientGUI:
     
     def _speak_direct_mode(self, data, cache_file_path):
         """直接模式的TTS调用"""
-        success, result = self.api_call("/tts", data)
+        with self.tracer.span("client upstream_tts", kind="client") as span:
+            success, result = self.api_call("/tts", data)
+            if not success:
+                span.set_error(result)
         
         # 直接模式下尝试保存文件
         if success and cache_file_path:
             try:
                 # 确保目标目录存在
                 os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
-                print(f"[直接模式] 确保目录存在: {os.path.dirname(cache_file_path)}")
+                logger.debug(f"[直接模式] 确保目录存在: {os.path.dirname(cache_file_path)}")
                 
                 # 如果API返回的是二进制音频数据，直接保存
                 if isinstance(result, bytes) and len(result) > 0:
                     with open(cache_file_path, 'wb') as f:
                         f.write(result)
-                    print(f"[直接模式] 音频数据已直接保存到: {cache_file_path}")
+                    logger.debug(f"[直接模式] 音频数据已直接保存到: {cache_file_path}")
                 # 如果API返回的是JSON，检查是否有文件数据
                 elif isinstance(result, dict):
                     # 这里可以根据实际的API返回格式进行调整
-                    print(f"[直接模式] 收到JSON响应: {result}")
+                    log_payload("[直接模式] 收到JSON响应", result)
                     # 检查是否有audio_data字段
                     if 'audio_data' in result and isinstance(result['audio_data'], bytes):
                         with open(cache_file_path, 'wb') as f:
                             f.write(result['audio_data'])
-                        print(f"[直接模式] 从JSON响应中提取音频数据并保存")
+                        logger.debug(f"[直接模式] 从JSON响应中提取音频数据并保存")
             except Exception as e:
-                print(f"[直接模式] 准备文件保存时出错: {e}")
+                logger.warning(f"[直接模式] 准备文件保存时出错: {e}")
         
         return success, result
     
-    def _speak_with_proxy_mode(self, data, cache_file_path):
-        """中转模式的TTS调用，包含任务状态轮询和文件下载"""
+    def relay_target(self):
+        """选择中转目标：若启用连接主客户端并配置了主地址，则优先发给主客户端(master)，否则发往本地中转服务
+
+        返回 (目标地址, 是否使用主客户端)。
+        """
+        use_master = bool(getattr(self, 'connect_master', False) and getattr(self, 'master_api_url', ''))
+        if use_master:
+            return self.master_api_url.rstrip('/'), True
+        return f"http://{self.local_api_host}:{self.local_api_port}", False
+
+    def _speak_with_proxy_mode(self, data, cache_file_path, on_chunk=None):
+        """中转模式的TTS调用，包含任务状态轮询和文件下载（on_chunk 可在下载时逐块接收音频数据）
+
+        启用追踪时记录为一个span（没有上层span时作为追踪的根），追踪上下文随请求头传给中转服务。
+        """
+        with self.tracer.span("client relay_tts", kind="client", attributes={
+            "tts.character": data.get("character_name", ""), "tts.text_length": len(data.get("text", "")),
+        }) as span:
+            success, result = self._relay_tts(data, cache_file_path, on_chunk)
+            if not success:
+                span.set_error(result)
+            return success, result
+
+    def _relay_tts(self, data, cache_file_path, on_chunk=None):
         try:
-            # 选择目标：若启用连接主客户端并配置了主地址，则优先将请求发给主客户端(master)，否则发往本地中转服务
-            local_api_url = f"http://{self.local_api_host}:{self.local_api_port}"
-            target_api = None
-            use_master = getattr(self, 'connect_master', False) and getattr(self, 'master_api_url', '')
-            if use_master and self.master_api_url:
-                target_api = self.master_api_url.rstrip('/')
-                print(f"[中转模式] 使用主客户端进行中转: {target_api}")
-            else:
-                target_api = local_api_url
+            target_api, use_master = self.relay_target()
+            if use_master:
+                logger.info(f"[中转模式] 使用主客户端进行中转: {target_api}")
 
             tts_url = f"{target_api}/tts"
             
             self.status_var.set("正在提交TTS任务...")
-            print(f"[中转模式] 提交TTS任务到: {tts_url}")
-            print(f"[中转模式] 提交数据: {data}")
+            logger.debug(f"[中转模式] 提交TTS任务到: {tts_url}")
+            log_payload("[中转模式] 提交数据", data)
             
-            # 创建请求会话并配置代理
-            session = requests.Session()
-            # 配置代理
-            if self.use_proxy and self.proxy_host and self.proxy_port:
-                proxy_type = self.proxy_type.lower()
-                if proxy_type == 'sock5':
-                    proxy_type = 'socks5'
-                elif proxy_type != 'http':
-                    proxy_type = 'http'
-                
-                proxy_url = f"{proxy_type}://"
-                if self.proxy_username and self.proxy_password:
-                    proxy_url += f"{self.proxy_username}:{self.proxy_password}@"
-                proxy_url += f"{self.proxy_host}:{self.proxy_port}"
-                
-                proxies = {
-                    "http": proxy_url,
-                    "https": proxy_url
-                }
-                session.proxies = proxies
-            response = session.post(tts_url, json=data, timeout=30)
+            # 使用共享连接池（已配置代理）
+            session = self.get_http_client()
+            with self.tracer.span("client submit", kind="client") as span:
+                response = session.post(tts_url, json=data, timeout=30, headers=self.tracer.inject())
+                # 中转服务队列已满时按 Retry-After 等待后重新提交
+                for attempt in range(3):
+                    if response.status_code != 429:
+                        break
+                    retry_after = min(30, parse_retry_after(response.headers.get("Retry-After")))
+                    self.status_var.set(f"中转服务繁忙，{retry_after} 秒后重试...")
+                    logger.warning(f"[中转模式] 中转服务队列已满，{retry_after} 秒后重试")
+                    span.set_attribute("tts.retries", attempt + 1)
+                    time.sleep(retry_after)
+                    response = session.post(tts_url, json=data, timeout=30, headers=self.tracer.inject())
+                span.set_attribute("http.status_code", response.status_code)
             
             if response.status_code != 200:
                 error_msg = f"提交任务失败: {response.status_code} - {response.text}"
-                print(f"[中转模式] {error_msg}")
+                logger.warning(f"[中转模式] {error_msg}")
                 return False, error_msg
             
             result = response.json()
-            print(f"[中转模式] 任务提交响应: {result}")
+            logger.debug(f"[中转模式] 任务提交响应: {result}")
             
             if result.get("status") != "processing":
                 error_msg = f"任务提交失败: {result.get('message', '未知错误')}"
-                print(f"[中转模式] {error_msg}")
+                logger.warning(f"[中转模式] {error_msg}")
                 return False, error_msg
             
             task_id = result.get("task_id")
             if not task_id:
                 error_msg = "未收到任务ID"
-                print(f"[中转模式] {error_msg}")
+                logger.warning(f"[中转模式] {error_msg}")
                 return False, error_msg
+            waiting_since = time.time()
+
+            def download():
+                # 等待阶段（推送或轮询）到开始下载为止
+                self.tracer.record("client wait", waiting_since, time.time(), attributes={"tts.task_id": task_id})
+                return self._download_task_audio(session, target_api, task_id, cache_file_path, on_chunk)
 
             # 如果是连接到主客户端，把当前客户端注册到主客户端以便主端记录/推送状态
             if use_master:
                 try:
                     self.register_with_master(task_id)
                 except Exception as e:
-                    print(f"[中转模式] 向主客户端注册失败: {e}")
+                    logger.warning(f"[中转模式] 向主客户端注册失败: {e}")
             
+            # 中转服务命中合成缓存时无需轮询，直接下载
+            if result.get("cached") and result.get("download_url"):
+                self.status_var.set("中转服务命中合成缓存，准备下载...")
+                logger.info(f"[中转模式] 中转服务命中合成缓存: {task_id}")
+                return download()
+
             self.status_var.set(f"任务已提交，ID: {task_id}，等待生成...")
-            print(f"[中转模式] 任务ID: {task_id}")
+            logger.debug(f"[中转模式] 任务ID: {task_id}")
+
+            # 优先等待中转服务的推送（SSE），推送不可用时回退为轮询
+            if self.config.getboolean('API', 'use_push_events', fallback=True):
+                status_data = self._wait_task_events(session, target_api, task_id)
+                if status_data is not None:
+                    if status_data.get("status") == "completed":
+                        self.status_var.set("音频生成完成，准备下载...")
+                        logger.debug(f"[中转模式] 任务完成（推送），准备下载音频")
+                        return download()
+                    error_msg = status_data.get("error", "未知错误")
+                    logger.warning(f"[中转模式] 任务处理失败: {error_msg}")
+                    return False, f"任务处理失败: {error_msg}"
             
             # 轮询任务状态
             status_url = f"{target_api}/tts_status/{task_id}"
             max_attempts = getattr(self, 'proxy_poll_attempts', 120)  # 可配置的尝试次数
+            # 提交后这段时间内查询不到任务时重试（多worker部署时查询可能落到还没看到该任务的进程）
+            not_found_grace = self.config.getfloat('API', 'task_not_found_grace', fallback=5)
             attempt = 0
             
             while attempt < max_attempts:
                 try:
                     # 使用相同的会话发送请求
-                    status_response = session.get(status_url, timeout=10)
+                    status_response = session.get(status_url, timeout=10, headers=self.tracer.inject())
                     if status_response.status_code == 200:
                         status_data = status_response.json()
                         task_status = status_data.get("status")
                         progress = status_data.get("progress")
                         download_hint = status_data.get("download_url")
                         if progress is not None:
-                            self.status_var.set(f"生成中... {progress}%")
-                            print(f"[中转模式] 任务状态轮询 {attempt+1}/{max_attempts}: {task_status}, 进度: {progress}%, download_url: {download_hint}")
+                            self.status_var.set(self.format_task_progress(status_data))
+                            logger.debug(f"[中转模式] 任务状态轮询 {attempt+1}/{max_attempts}: {task_status}, 进度: {progress}%, download_url: {download_hint}", extra={"sample": f"poll:{task_id}"})
                         else:
-                            print(f"[中转模式] 任务状态轮询 {attempt+1}/{max_attempts}: {task_status}, download_url: {download_hint}")
+                            logger.debug(f"[中转模式] 任务状态轮询 {attempt+1}/{max_attempts}: {task_status}, download_url: {download_hint}", extra={"sample": f"poll:{task_id}"})
 
                         if task_status == "completed":
                             self.status_var.set("音频生成完成，准备下载...")
-                            print(f"[中转模式] 任务完成，准备下载音频")
-                            
-                            # 确保客户端缓存目录存在
-                            os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
-                            
-                            # 下载音频文件到客户端缓存目录
-                            download_url = f"{target_api}/download/{task_id}"
-                            # 使用相同的会话发送请求
-                            download_response = session.get(download_url, timeout=30)
-                            
-                            if download_response.status_code == 200:
-                                # 保存下载的音频文件到客户端缓存目录
-                                with open(cache_file_path, 'wb') as f:
-                                    f.write(download_response.content)
-                                
-                                # 验证文件是否成功保存
-                                if os.path.exists(cache_file_path) and os.path.getsize(cache_file_path) > 0:
-                                    self.status_var.set("音频文件下载完成")
-                                    print(f"[中转模式] 音频文件已保存到客户端: {cache_file_path}")
-                                    print(f"[中转模式] 文件大小: {os.path.getsize(cache_file_path)} 字节")
-                                    return True, "成功"
-                                else:
-                                    error_msg = "文件下载后保存失败或文件为空"
-                                    print(f"[中转模式] {error_msg}")
-                                    return False, error_msg
-                            else:
-                                error_msg = f"下载音频失败: {download_response.status_code}"
-                                print(f"[中转模式] {error_msg}")
-                                return False, error_msg
+                            logger.debug(f"[中转模式] 任务完成，准备下载音频")
+                            return download()
                                 
                         elif task_status == "failed":
                             error_msg = status_data.get("error", "未知错误")
-                            print(f"[中转模式] 任务处理失败: {error_msg}")
+                            logger.warning(f"[中转模式] 任务处理失败: {error_msg}")
                             return False, f"任务处理失败: {error_msg}"
                         
-                        # 任务仍在处理中，继续等待
-                        self.status_var.set(f"任务处理中... ({attempt+1}/{max_attempts})")
-                        time.sleep(0.5)  # 等待0.5秒
+                        # 任务仍在处理中，按预计剩余时间调整下次查询的间隔（0.5~3秒）
+                        if progress is None:
+                            self.status_var.set(f"任务处理中... ({attempt+1}/{max_attempts})")
+                        eta = status_data.get("eta_seconds")
+                        time.sleep(min(3.0, max(0.5, eta / 2)) if eta else 0.5)
+                        attempt += 1
+
+                    elif status_response.status_code == 404 and time.time() - waiting_since < not_found_grace:
+                        logger.debug(f"[中转模式] 任务暂时查询不到，稍后重试: {task_id}")
+                        time.sleep(0.5)
                         attempt += 1
                         
                     else:
                         error_msg = f"查询任务状态失败: {status_response.status_code}"
-                        print(f"[中转模式] {error_msg}")
+                        logger.warning(f"[中转模式] {error_msg}")
                         return False, error_msg
                         
                 except requests.exceptions.Timeout:
                     self.status_var.set(f"查询任务状态超时，重试中... ({attempt+1}/{max_attempts})")
-                    print(f"[中转模式] 查询任务状态超时，重试 {attempt+1}/{max_attempts}")
+                    logger.warning(f"[中转模式] 查询任务状态超时，重试 {attempt+1}/{max_attempts}")
                     attempt += 1
                     continue
                 except Exception as e:
                     error_msg = f"查询任务状态时发生错误: {str(e)}"
-                    print(f"[中转模式] {error_msg}")
+                    logger.warning(f"[中转模式] {error_msg}")
                     return False, error_msg
             
             # 超时
             error_msg = "任务处理超时，请稍后重试"
-            print(f"[中转模式] {error_msg}")
+            logger.warning(f"[中转模式] {error_msg}")
             return False, error_msg
             
         except Exception as e:
             error_msg = f"中转模式TTS调用失败: {str(e)}"
-            print(f"[中转模式] {error_msg}")
+            logger.warning(f"[中转模式] {error_msg}")
+            return False, error_msg
+
+    @staticmethod
+    def format_task_progress(status_data):
+        """把中转服务返回的进度、排队位置和预计剩余时间格式化为状态栏文字"""
+        eta = status_data.get("eta_seconds")
+        eta_text = f"，预计还需 {eta:.0f} 秒" if eta else ""
+        queue_position = status_data.get("queue_position")
+        if queue_position is not None:
+            return f"排队中，前面还有 {queue_position} 个任务{eta_text}"
+        return f"生成中... {status_data.get('progress', 0)}%{eta_text}"
+
+    def _wait_task_events(self, session, target_api, task_id):
+        """通过SSE等待任务结束，返回最终状态；推送不可用或连接中断时返回None"""
+        events_url = f"{target_api}/events/{task_id}"
+        try:
+            with session.get(events_url, stream=True, timeout=(5, 60), headers=self.tracer.inject()) as response:
+                content_type = response.headers.get('Content-Type', '')
+                if response.status_code != 200 or not content_type.startswith('text/event-stream'):
+                    logger.warning(f"[中转模式] 中转服务不支持推送 ({response.status_code})，改为轮询")
+                    return None
+                response.encoding = 'utf-8'
+                data_lines = []
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith('data:'):
+                        data_lines.append(line[5:].strip())
+                        continue
+                    if line or not data_lines:
+                        # 事件名、心跳注释等无需处理
+                        continue
+                    status_data = json.loads('\n'.join(data_lines))
+                    data_lines = []
+                    task_status = status_data.get("status")
+                    if task_status in ("completed", "failed"):
+                        return status_data
+                    self.status_var.set(self.format_task_progress(status_data))
+        except Exception as e:
+            logger.warning(f"[中转模式] 推送连接中断，改为轮询: {e}")
+        return None
+
+    def _download_task_audio(self, session, target_api, task_id, cache_file_path, on_chunk=None):
+        """从中转服务下载已完成任务的音频到客户端缓存目录"""
+        # 确保客户端缓存目录存在
+        os.makedirs(os.path.dirname(cache_file_path), exist_ok=True)
+
+        # 流式下载音频文件到客户端缓存目录（配置了压缩传输格式时下载后解码为WAV）
+        download_url = f"{target_api}/download/{task_id}"
+        transfer_format = self.transfer_format()
+        with self.tracer.span("client download", kind="client", attributes={
+            "tts.task_id": task_id, "tts.format": transfer_format,
+        }) as span:
+            if transfer_format == 'wav':
+                success, result = self.stream_download(session, download_url, cache_file_path, on_chunk=on_chunk)
+            else:
+                success, result = self._download_compressed(
+                    session, f"{download_url}?format={transfer_format}", cache_file_path, transfer_format, on_chunk
+                )
+            if success:
+                span.set_attribute("tts.bytes", result)
+            else:
+                span.set_error(result)
+        if not success:
+            logger.warning(f"[中转模式] {result}")
+            return False, result
+
+        # 验证文件是否成功保存
+        if os.path.exists(cache_file_path) and os.path.getsize(cache_file_path) > 0:
+            self.status_var.set("音频文件下载完成")
+            logger.debug(f"[中转模式] 音频文件已保存到客户端: {cache_file_path}")
+            logger.debug(f"[中转模式] 文件大小: {os.path.getsize(cache_file_path)} 字节")
+            return True, "成功"
+        else:
+            error_msg = "文件下载后保存失败或文件为空"
+            logger.warning(f"[中转模式] {error_msg}")
             return False, error_msg
 
+    def transfer_format(self):
+        """从中转服务下载音频使用的格式（[Audio] transfer_format），本机没有ffmpeg时只能使用WAV"""
+        fmt = self.config.get('Audio', 'transfer_format', fallback='wav').strip().lower()
+        if fmt not in AudioTranscoder.FORMATS or not self.transcoder.available:
+            return 'wav'
+        return fmt
+
+    def _download_compressed(self, session, url, cache_file_path, fmt, on_chunk=None):
+        """下载压缩格式的音频并解码为WAV；on_chunk 收到的是边下载边解码出的WAV数据"""
+        encoded_path = AudioTranscoder.variant_path(cache_file_path, fmt)
+        decoder = FfmpegDecodeStream(self.transcoder.ffmpeg, on_chunk) if on_chunk else None
+        try:
+            success, result = self.stream_download(
+                session, url, encoded_path, on_chunk=decoder.feed if decoder else None
+            )
+        finally:
+            if decoder is not None:
+                decoder.finish()
+        if not success:
+            return False, result
+        logger.debug(f"[中转模式] 已下载{fmt}音频: {result} 字节")
+        try:
+            return self.decode_audio_file(encoded_path, cache_file_path)
+        finally:
+            with contextlib.suppress(OSError):
+                os.remove(encoded_path)
+
+    def decode_audio_file(self, src_path, dest_path):
+        """把压缩音频解码为WAV文件（中转服务回退为WAV时直接改名）"""
+        with open(src_path, 'rb') as f:
+            is_wav = f.read(4) == b'RIFF'
+        if is_wav:
+            os.replace(src_path, dest_path)
+            return True, os.path.getsize(dest_path)
+        tmp_path = dest_path + '.tmp'
+        try:
+            subprocess.run(
+                [self.transcoder.ffmpeg, "-y", "-loglevel", "error", "-i", src_path, "-f", "wav", tmp_path],
+                check=True, capture_output=True, timeout=120
+            )
+            os.replace(tmp_path, dest_path)
+        except Exception as e:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            return False, f"音频解码失败: {e}"
+        return True, os.path.getsize(dest_path)
+
+    def stream_download(self, session, url, dest_path, on_chunk=None):
+        """分块流式下载到临时文件，完成后原子重命名为目标文件
+
+        连接中断时使用Range从已写入的位置续传；on_chunk 按顺序收到每个新字节块，
+        服务端不支持续传而重新发送整个文件时，已交付过的部分不会重复交付。
+        多次重试仍失败时保留临时文件和它的ETag，下次下载同一文件时用 If-Range 接着续传
+        （已下载的部分先交付给 on_chunk）。返回 (success, 字节数或错误信息)。
+        """
+        part_path = dest_path + '.part'
+        etag_path = part_path + '.etag'
+        chunk_size = self.config.getint('API', 'download_chunk_size', fallback=64 * 1024)
+        max_attempts = self.config.getint('API', 'download_retries', fallback=3) + 1
+        delivered = 0
+        etag = None
+
+        def discard_partial():
+            for path in (part_path, etag_path):
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+        if os.path.exists(part_path):
+            try:
+                with open(etag_path, 'r', encoding='utf-8') as f:
+                    etag = f.read().strip() or None
+            except OSError:
+                pass
+            if etag is None:
+                # 没有ETag无法确认服务端的文件未变化，不续传
+                os.remove(part_path)
+            else:
+                logger.info(f"[下载] 从上次中断的位置续传: {os.path.getsize(part_path)} 字节")
+                if on_chunk is not None:
+                    with open(part_path, 'rb') as f:
+                        for chunk in iter(lambda: f.read(chunk_size), b''):
+                            on_chunk(chunk)
+                            delivered += len(chunk)
+
+        for attempt in range(max_attempts):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = self.tracer.inject()
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+                if etag:
+                    # 文件已变化时服务端返回完整的200响应，而不是拼接错误的片段
+                    headers['If-Range'] = etag
+            try:
+                with session.get(url, stream=True, timeout=(5, 30), headers=headers) as response:
+                    if response.status_code == 206:
+                        mode = 'ab'
+                        # Content-Range: bytes start-end/total
+                        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+                        expected = int(total) if total.isdigit() else None
+                    elif response.status_code == 200:
+                        mode = 'wb'
+                        offset = 0
+                        length = response.headers.get('Content-Length', '')
+                        expected = int(length) if length.isdigit() else None
+                        # 记下新文件的ETag，本次失败后下次调用仍可续传
+                        etag = response.headers.get('ETag')
+                        if etag:
+                            atomic_write_text(etag_path, etag)
+                        else:
+                            with contextlib.suppress(OSError):
+                                os.remove(etag_path)
+                    else:
+                        discard_partial()
+                        return False, f"下载音频失败: {response.status_code}"
+
+                    position = offset
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            end = position + len(chunk)
+                            if on_chunk is not None and end > delivered:
+                                on_chunk(chunk[max(0, delivered - position):])
+                                delivered = end
+                            position = end
+
+                if expected is not None and position < expected:
+                    raise requests.exceptions.ChunkedEncodingError(f"连接提前关闭: {position}/{expected} 字节")
+                os.replace(part_path, dest_path)
+                with contextlib.suppress(OSError):
+                    os.remove(etag_path)
+                return True, position
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                logger.warning(f"[下载] 传输中断 ({attempt + 1}/{max_attempts})，将从断点续传: {e}")
+
+        if etag is None:
+            # 没有ETag的部分文件下次无法续传
+            discard_partial()
+        return False, "下载音频失败: 多次传输中断"
+
     def register_with_master(self, task_id):
         """向主客户端注册当前客户端任务（用于主端记录和推送）"""
         try:
@@ -1889,40 +6176,32 @@ class TTSClientGUI:
                 "client_id": self.client_id,
                 "callback_url": None
             }
-            print(f"[互联] 向主客户端注册任务: {register_url} -> {payload}")
-            # 创建请求会话并配置代理
-            session = requests.Session()
-            # 配置代理
-            if self.use_proxy and self.proxy_host and self.proxy_port:
-                proxy_type = self.proxy_type.lower()
-                if proxy_type == 'sock5':
-                    proxy_type = 'socks5'
-                elif proxy_type != 'http':
-                    proxy_type = 'http'
-                
-                proxy_url = f"{proxy_type}://"
-                if self.proxy_username and self.proxy_password:
-                    proxy_url += f"{self.proxy_username}:{self.proxy_password}@"
-                proxy_url += f"{self.proxy_host}:{self.proxy_port}"
-                
-                proxies = {
-                    "http": proxy_url,
-                    "https": proxy_url
-                }
-                session.proxies = proxies
+            logger.debug(f"[互联] 向主客户端注册任务: {register_url}")
+            log_payload("[互联] 注册数据", payload)
+            # 使用共享连接池（已配置代理）
+            session = self.get_http_client()
             r = session.post(register_url, json=payload, timeout=5)
             if r.status_code == 200:
-                print(f"[互联] 注册成功: {task_id} -> {self.client_id}")
+                logger.info(f"[互联] 注册成功: {task_id} -> {self.client_id}")
                 return True
             else:
-                print(f"[互联] 注册失败: {r.status_code} - {r.text}")
+                logger.warning(f"[互联] 注册失败: {r.status_code} - {r.text}")
                 return False
         except Exception as e:
-            print(f"[互联] 注册异常: {e}")
+            logger.warning(f"[互联] 注册异常: {e}")
             return False
     
+    def _on_stream_playback_start(self):
+        """流式播放开始（播放线程中调用）"""
+        self.audio_playing = True
+        self.status_var.set("正在播放音频（边下载边播放）...")
+
     def play_audio_file(self, file_path):
-        """使用PyAudio播放音频文件"""
+        """使用PyAudio播放音频文件（Opus/FLAC/MP3等压缩格式经ffmpeg解码后播放）"""
+        with open(file_path, 'rb') as f:
+            is_wav = f.read(4) == b'RIFF'
+        if not is_wav:
+            return self._play_compressed_file(file_path)
         try:
             self.audio_playing = True
             self.status_var.set("正在播放音频...")
@@ -1958,6 +6237,35 @@ class TTSClientGUI:
             self.audio_playing = False
             raise e
     
+    def _play_compressed_file(self, file_path):
+        """边解码边播放压缩音频"""
+        if not self.transcoder.available:
+            raise RuntimeError("播放压缩音频需要ffmpeg，请在[Audio] ffmpeg_path中配置")
+        self.audio_playing = True
+        self.status_var.set("正在播放音频...")
+        player = StreamingWavPlayer(
+            self.p,
+            prebuffer_ms=self.config.getint('Audio', 'jitter_buffer_ms', fallback=300),
+            should_continue=lambda: self.audio_playing,
+        )
+        decoder = FfmpegDecodeStream(self.transcoder.ffmpeg, player.feed)
+        try:
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    if not self.audio_playing:
+                        break
+                    decoder.feed(chunk)
+        finally:
+            decoder.finish()
+            player.finish()
+            player.wait()
+        self.audio_playing = False
+        if player.error:
+            raise RuntimeError(player.error)
+        if not player.started:
+            raise RuntimeError(f"无法解码音频文件: {file_path}")
+        self.status_var.set("音频播放完成")
+
     def stop_audio(self):
         """停止音频播放"""
         self.audio_playing = False
@@ -1987,37 +6295,32 @@ class TTSClientGUI:
         threading.Thread(target=self._test_connection_thread, daemon=True).start()
     
     def _test_connection_thread(self):
+        # 中转服务运行时由后台健康检查持续探测各后端，直接显示其结果
+        pool = getattr(self, 'upstream_pool', None)
+        if self.server_running and pool is not None:
+            lines = []
+            for backend in pool.backends.values():
+                if backend.healthy:
+                    latency = f", 探测延迟 {backend.probe_latency * 1000:.0f} ms" if backend.probe_latency is not None else ""
+                    lines.append(f"{backend.name} ({backend.url}): 正常, 在途请求 {backend.outstanding}{latency}")
+                else:
+                    lines.append(f"{backend.name} ({backend.url}): 已摘除, {backend.last_error}")
+            if any(backend.healthy for backend in pool.backends.values()):
+                messagebox.showinfo("连接测试", "\n".join(lines))
+            else:
+                messagebox.showerror("连接测试", "\n".join(lines))
+            return
         try:
-            # 构建代理配置
-            proxies = None
-            if self.use_proxy and self.proxy_host and self.proxy_port:
-                # 格式化代理类型，确保requests能正确识别
-                proxy_type = self.proxy_type.lower()
-                if proxy_type == 'sock5':
-                    proxy_type = 'socks5'
-                elif proxy_type != 'http':
-                    proxy_type = 'http'
-                
-                # 构建代理URL
-                proxy_url = f"{proxy_type}://"
-                if self.proxy_username and self.proxy_password:
-                    proxy_url += f"{self.proxy_username}:{self.proxy_password}@"
-                proxy_url += f"{self.proxy_host}:{self.proxy_port}"
-                
-                # 设置代理
-                proxies = {
-                    "http": proxy_url,
-                    "https": proxy_url
-                }
-                print(f"使用代理: {proxy_url}")
-            
+            # 使用共享连接池（已配置代理）
+            session = self.get_http_client()
+
             # 尝试访问API根路径或健康检查端点
-            response = requests.get(f"{self.upstream_api_url}/", timeout=5, proxies=proxies)
+            response = session.get(f"{self.upstream_api_url}/", timeout=5)
             if response.status_code == 200:
                 messagebox.showinfo("连接测试", "连接成功!")
             else:
                 # 如果根路径不行，尝试/docs路径（FastAPI的文档）
-                response = requests.get(f"{self.upstream_api_url}/docs", timeout=5, proxies=proxies)
+                response = session.get(f"{self.upstream_api_url}/docs", timeout=5)
                 if response.status_code == 200:
                     messagebox.showinfo("连接测试", "连接成功! (API文档可访问)")
                 else:
@@ -2026,11 +6329,146 @@ class TTSClientGUI:
             messagebox.showerror("连接测试", f"连接失败: {str(e)}")
     
     def __del__(self):
-        """析构函数，清理PyAudio资源"""
+        """析构函数，清理PyAudio资源、上游连接池与任务存储，写入未保存的配置"""
+        if getattr(self, 'config_writer', None) is not None:
+            self.config_writer.close()
+        if getattr(self, 'recent_texts', None) is not None:
+            self.recent_texts.close()
         if hasattr(self, 'p'):
             self.p.terminate()
+        if getattr(self, '_http_client', None) is not None:
+            self._http_client.close()
+        if getattr(self, 'task_store', None) is not None:
+            self.task_store.close()
+        if getattr(self, 'throughput_model', None) is not None:
+            self.throughput_model.save()
+        if getattr(self, 'transcoder', None) is not None:
+            self.transcoder.close()
+        if getattr(self, 'tracer', None) is not None:
+            self.tracer.close()
+
+def close_headless_app(app):
+    """无界面中转服务停止后写回任务存储与合成速度模型"""
+    app.server_running = False
+    app.config_writer.close()
+    app.recent_texts.close()
+    if app.task_store is not None:
+        app.task_store.close()
+    app.throughput_model.save()
+    app.transcoder.close()
+    app.tracer.close()
+
+
+def run_relay_worker(host, port, sock, process_count):
+    """多进程模式下的一个中转worker：在父进程监听的socket上提供服务，任务状态经SQLite与其他worker共享"""
+    app = TTSClientGUI(None, shared_state=True, process_count=process_count)
+    app.local_api_host, app.local_api_port = host, port
+    try:
+        app.create_fastapi_app()
+    except RuntimeError as e:
+        logger.error(f"[中转服务] 无法启动: {e}")
+        sys.exit(1)
+    app.server_running = True
+    logger.info(f"[中转服务] worker进程 {os.getpid()} 已启动")
+    try:
+        app.run_fastapi_server(host, port, sockets=[sock])
+    finally:
+        close_headless_app(app)
+
+
+def run_headless(host=None, port=None, workers=None):
+    """无界面运行中转服务（读取同一配置文件），在前台阻塞直到服务停止
+
+    workers 大于1时（默认读取配置 [LocalAPI] workers）由父进程监听端口，启动多个worker进程共同处理请求。
+    """
+    config = configparser.ConfigParser()
+    config.read("tts_client_config.ini")
+    setup_logging(config)
+    workers = workers or config.getint('LocalAPI', 'workers', fallback=1)
+    if workers > 1 and not config.getboolean('LocalAPI', 'persist_tasks', fallback=True):
+        logger.warning("[中转服务] 多worker进程需要任务存储共享状态（[LocalAPI] persist_tasks），改为单进程运行")
+        workers = 1
+    if workers > 1 and (config.getint('LocalAPI', 'max_resident_characters', fallback=0) > 0
+                        or config.getfloat('LocalAPI', 'resident_memory_mb', fallback=0) > 0):
+        # 驻留角色按进程跟踪，一个worker卸载角色时不知道其他worker是否正在用它合成
+        logger.error("[中转服务] 多worker进程不支持按数量/内存卸载角色（[LocalAPI] max_resident_characters、resident_memory_mb），"
+                     "请改为单进程运行或关闭这两项配置")
+        sys.exit(1)
+    if workers <= 1:
+        app = TTSClientGUI(None)
+        host = host or app.local_api_host
+        port = port or app.local_api_port
+        app.local_api_host, app.local_api_port = host, port
+        try:
+            app.create_fastapi_app()
+        except RuntimeError as e:
+            logger.error(f"[中转服务] 无法启动: {e}")
+            sys.exit(1)
+        app.server_running = True
+        logger.info(f"[中转服务] 无界面模式启动: http://{host}:{port}, 上游: {', '.join(url for _, url in app.upstream_backends())}")
+        try:
+            app.run_fastapi_server(host, port)
+        finally:
+            close_headless_app(app)
+        return
+
+    host = host or config.get('LocalAPI', 'host', fallback="0.0.0.0")
+    port = port or config.getint('LocalAPI', 'port', fallback=8001)
+    # 启动worker前做一次恢复：上次退出时处理中的任务标记为失败（worker启动后不能再这样做）
+    cache_dir = config.get('Cache', 'cache_dir', fallback="./audio_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    store = TaskStore(cache_dir)
+    store.load(config.getfloat('LocalAPI', 'task_ttl_hours', fallback=24) * 3600)
+    store.close()
+
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_relay_worker, args=(host, port, sock, workers), name=f"relay-worker-{index + 1}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"[中转服务] 无界面模式启动: http://{host}:{port}, {workers} 个worker进程")
+
+    def stop_workers(signum=None, frame=None):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop_workers)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # worker收到SIGTERM后处理完进行中的请求再退出；关闭期间忽略再次的 Ctrl+C
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        stop_workers()
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.kill()
+        sock.close()
+
 
 def main():
+    parser = argparse.ArgumentParser(description="TTS API 客户端 / 中转服务器")
+    parser.add_argument("--headless", action="store_true", help="不启动图形界面，只运行中转API服务")
+    parser.add_argument("--host", help="中转服务监听地址（默认读取配置 [LocalAPI] host）")
+    parser.add_argument("--port", type=int, help="中转服务端口（默认读取配置 [LocalAPI] port）")
+    parser.add_argument("--workers", type=int, help="中转worker进程数（默认读取配置 [LocalAPI] workers）")
+    args = parser.parse_args()
+    if args.headless:
+        run_headless(args.host, args.port, args.workers)
+        return
+
+    import_gui_modules()
     root = tk.Tk()
     app = TTSClientGUI(root)
     
@@ -2038,6 +6476,12 @@ def main():
     def on_closing():
         # 保存当前配置
         app.save_current_config()
+        app.config_writer.close()
+        app.recent_texts.close()
+        if app.task_store is not None:
+            app.task_store.close()
+        app.throughput_model.save()
+        app.tracer.close()
         root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)